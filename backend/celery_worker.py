@@ -25,6 +25,13 @@ celery_app = Celery(
     include=['tasks']  # Make sure tasks module is included
 )
 import tasks
+from celery.signals import setup_logging as celery_setup_logging
+from src.functions.helpers.log_pipeline import setup_logging
+
+# Connecting this keeps Celery from replacing the root logger's handlers, so workers log through the pipeline
+@celery_setup_logging.connect
+def configure_logging(**kwargs):
+    setup_logging()
 
 # Configure Celery
 celery_app.conf.update(
@@ -33,6 +40,7 @@ celery_app.conf.update(
         "tasks.run_sync_sp_to_yt_job": {"queue": "jobs"},
         "tasks.run_sync_yt_to_sp_job": {"queue": "jobs"},
         "tasks.run_merge_playlists_job": {"queue": "jobs"},
+        "tasks.run_download_playlist_job": {"queue": "jobs"},
         "celery_worker.cleanup_jobs": {"queue": "cleanup"},
     },
     task_default_queue="jobs",
@@ -48,6 +56,7 @@ def cleanup_jobs():
     Celery task to clean up old and stale jobs.
     - Marks jobs stuck in 'pending' or 'ready_to_finalize' for over an hour as 'error'.
     - Deletes jobs in 'completed' or 'error' state that are older than 5 minutes.
+    - Deletes playlist downloads, finished ('ready_to_download') or failed ('error'), after a day.
     """
     db = SessionLocal()
     try:
@@ -66,8 +75,16 @@ def cleanup_jobs():
         cleanup_time_threshold = datetime.utcnow() - timedelta(minutes=5)
         db.query(Job).filter(
             Job.status.in_(['completed', 'error']),
+            Job.type != 'download_playlist',
             Job.updated_at < cleanup_time_threshold
         ).delete(synchronize_session=False)
+
+        # Downloads stay a day, so a finished zip can still be fetched and a failed one resumed from its checkpoint
+        db.query(Job).filter(
+            Job.type == 'download_playlist',
+            Job.status.in_(['ready_to_download', 'error']),
+            Job.updated_at < datetime.utcnow() - timedelta(days=1)
+        ).delete(synchronize_session=False)
         
         db.commit()
     finally:
@@ -1,2 +1,16 @@
+import logging
+
 from src.db import Job, Base
-from src.db.youtube_token import SessionLocal
+from src.db.playlist_members import create_playlist_members_table
+from src.db.track_matches import create_track_matches_table
+from src.db.youtube_token import SessionLocal, engine
+
+logger = logging.getLogger(__name__)
+
+# Tables owned by the backend are created here; the rest of the schema already exists
+for table, create_table in (("track_matches", create_track_matches_table),
+                            ("playlist_members", create_playlist_members_table)):
+    try:
+        create_table(engine)
+    except Exception as e:
+        logger.warning("Could not create the %s table: %s", table, e)
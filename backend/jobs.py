@@ -1,4 +1,5 @@
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from db_models import Job, SessionLocal
 import datetime
@@ -7,7 +8,9 @@ import time
 import re
 from pydantic import BaseModel
 import logging
-from tasks import run_sync_sp_to_yt_job, run_sync_yt_to_sp_job, run_merge_playlists_job, run_finalize_job
+from tasks import run_sync_sp_to_yt_job, run_sync_yt_to_sp_job, run_merge_playlists_job, run_finalize_job, run_download_playlist_job
+from src.functions.download_yt_playlist import iter_playlist_zip
+from src.functions.helpers.audio_cache import parse_formats
 from src.db.youtube_quota import get_total_quota_used, reserve_quota_atomic
 from src.functions.helpers.sp_provider import get_spotify_client
 from spotipy import SpotifyException
@@ -28,6 +31,12 @@ class MergeRequest(BaseModel):
     new_playlist_name: str
     user_id: str
 
+class DownloadRequest(BaseModel):
+    playlist_name: str
+    user_id: str
+    parallelism: int | None = None
+    format: str = "mp3"
+
 def get_db():
     db = SessionLocal()
     try:
@@ -246,6 +255,73 @@ def start_merge_playlists(request: MergeRequest, db: Session = Depends(get_db)):
     
     return {"job_id": str(job_id)}
 
+@router.post("/download_playlist", status_code=202)
+def start_download_playlist(request: DownloadRequest, db: Session = Depends(get_db)):
+    validate_playlist_name(request.playlist_name)
+    if request.parallelism is not None and not 1 <= request.parallelism <= 16:
+        raise HTTPException(status_code=400, detail="parallelism must be between 1 and 16.")
+    try:
+        parse_formats(request.format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    job_id = uuid.uuid4()
+    logger.info(f"Starting download job {job_id} for playlist '{request.playlist_name}'")
+
+    job = Job(
+        job_id=job_id,
+        user_id=request.user_id,
+        type="download_playlist",
+        status="pending",
+        playlist_name=request.playlist_name,
+        # The first checkpoint; a resume reads the format from it even if no track was done yet
+        result={'format': request.format},
+    )
+    db.add(job)
+    db.commit()
+    logger.info(f"Created job {job_id} in database")
+
+    logger.info(f"Queueing task run_download_playlist_job for job {job_id}")
+    result = run_download_playlist_job.apply_async(
+        args=(str(job_id), request.playlist_name, request.user_id, request.parallelism, request.format),
+        queue='jobs'
+    )
+    logger.info(f"Task queued with task_id: {result.id}")
+
+    return {"job_id": str(job_id)}
+
+@router.post("/{job_id}/resume", status_code=202)
+def resume_download_playlist(job_id: uuid.UUID, parallelism: int | None = None, db: Session = Depends(get_db)):
+    """Re-queues a failed or interrupted playlist download; the tracks it already has are kept."""
+    job = db.query(Job).filter(Job.job_id == job_id).first()
+    if not job or job.type != "download_playlist":
+        raise HTTPException(status_code=404, detail="Download job not found")
+    if job.status not in ("error", "downloading"):
+        raise HTTPException(status_code=400, detail=f"Job can't be resumed, current status is {job.status}")
+
+    # A job still 'downloading' on a live worker isn't claimed again, so this can't run it twice
+    run_download_playlist_job.apply_async(
+        args=(str(job_id), job.playlist_name, job.user_id, parallelism, (job.result or {}).get('format')),
+        queue='jobs'
+    )
+    logger.info(f"Queued resume of download job {job_id}")
+    return {"job_id": str(job_id), "status": job.status}
+
+@router.get("/{job_id}/download")
+def download_playlist_zip(job_id: uuid.UUID, db: Session = Depends(get_db)):
+    """Streams the downloaded tracks of a finished playlist download as a zip."""
+    job = db.query(Job).filter(Job.job_id == job_id).first()
+    if not job or job.type != "download_playlist":
+        raise HTTPException(status_code=404, detail="Download job not found")
+    if job.status != "ready_to_download":
+        raise HTTPException(status_code=400, detail=f"Download is not ready, current status is {job.status}")
+
+    filename = re.sub(r'[^\w\- ]+', '_', job.playlist_name or 'playlist').strip() or 'playlist'
+    return StreamingResponse(
+        iter_playlist_zip(job.result.get('tracks', []), job.result.get('format') or 'mp3'),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}.zip"'}
+    )
+
 @router.get("/{job_id}")
 def get_job_status(job_id: uuid.UUID, db: Session = Depends(get_db)):
     job = db.query(Job).filter(Job.job_id == job_id).first()
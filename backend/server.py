@@ -1,10 +1,11 @@
 import sys
 import os
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.exceptions import RequestValidationError
 from pydantic import BaseModel, ValidationError
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Literal
+import json
 import logging
 from datetime import datetime
 from dotenv import load_dotenv
@@ -30,6 +31,14 @@ from src.functions.helpers.sp_provider import SpotifyProvider, is_spotify_authen
 from src.functions.helpers.quota_tracker import get_total_quota_used, set_total_quota_value, YT_API_QUOTA_COSTS, quota_usage
 from src.db.youtube_token import save_youtube_token, get_youtube_token, is_youtube_authenticated
 from src.db.youtube_quota import get_total_quota_used, set_total_quota_value
+from src.functions.helpers.search_cache import get_search_cache_stats
+from src.functions.helpers.query_planner import get_planner_stats
+from src.functions.helpers.yt_client_pool import get_client_pool_stats, invalidate_client
+from src.functions.helpers.rate_limit import get_rate_limit_stats
+from src.functions.helpers.log_pipeline import setup_logging
+from src.functions.helpers.audio_cache import get_audio, AudioDownloadError, AUDIO_FORMATS, get_audio_pipeline_stats
+from src.functions.helpers.match_index import iter_matches, SYNC_MATCH_WORKERS
+from src.functions.helpers.playlist_diff import PlaylistIndex
 
 DATABASE_URL = os.environ["DATABASE_URL"]
 engine = create_engine(DATABASE_URL)
@@ -46,15 +55,8 @@ def get_db():
 logs_dir = os.path.join(os.path.dirname(__file__), 'logs')
 os.makedirs(logs_dir, exist_ok=True)
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(os.path.join(logs_dir, 'app.log')),
-        logging.StreamHandler()
-    ]
-)
+# Configure logging (through the non-blocking queue, see log_pipeline)
+setup_logging(os.path.join(logs_dir, 'app.log'))
 logger = logging.getLogger(__name__)
 
 class SongStatus(BaseModel):
@@ -66,6 +68,22 @@ class SyncResponse(BaseModel):
     playlist: str
     songs: List[SongStatus]
 
+class MatchBatchItem(BaseModel):
+    title: str
+    artist: str
+    direction: Literal['sp_to_yt', 'yt_to_sp']
+    source_id: Optional[str] = None  # Spotify track id / YouTube video id, shares matches by id
+    duration_ms: Optional[int] = None
+
+class MatchBatchRequest(BaseModel):
+    user_id: str
+    items: List[MatchBatchItem]
+    concurrency: Optional[int] = None
+
+# Limits for /api/match_batch
+MATCH_BATCH_MAX_ITEMS = int(os.getenv("MATCH_BATCH_MAX_ITEMS", "5000"))
+MATCH_BATCH_MAX_CONCURRENCY = int(os.getenv("MATCH_BATCH_MAX_CONCURRENCY", "16"))
+
 app = FastAPI()
 app.include_router(jobs_router)
 
@@ -203,6 +221,31 @@ def youtube_quota_usage(db: Session = Depends(get_db)):
         "limit": YT_API_DAILY_LIMIT
     }
 
+@app.get("/api/search_cache_stats")
+def search_cache_stats():
+    """Hit/miss counters and size of the shared search response cache."""
+    return get_search_cache_stats()
+
+@app.get("/api/search_planner_stats")
+def search_planner_stats():
+    """Per-variant runs, yields and wins recorded by the search_auto query planner."""
+    return {provider: get_planner_stats(provider) for provider in ("youtube", "spotify")}
+
+@app.get("/api/youtube_client_pool_stats")
+def youtube_client_pool_stats():
+    """Hit/miss counts and size of this server process's pool of ready YouTube API clients."""
+    return get_client_pool_stats()
+
+@app.get("/api/rate_limit_stats")
+def rate_limit_stats():
+    """Rates, AIMD concurrency limits and throttle counts of this server process's provider rate limiters."""
+    return get_rate_limit_stats()
+
+@app.get("/api/audio_pipeline_stats")
+def audio_pipeline_stats():
+    """How this server process delivered audio (passthrough, remux, transcode) and the seconds spent per stage."""
+    return get_audio_pipeline_stats()
+
 @app.get("/health")
 async def health_check():
     """A simple health check endpoint to confirm the server is running."""
@@ -273,6 +316,25 @@ def api_download_yt_song(song_name: str, artists: str, user_id: str):
     result = download_yt_song(song_name, artists, user_id)
     return {"result": result}
 
+@app.get("/api/audio/{video_id}")
+def stream_audio(video_id: str, format: str = "mp3"):
+    """
+    Streams a YouTube video's audio, with HTTP Range support. The file comes from the audio
+    download cache; only the first request for a video and format runs yt-dlp.
+
+    format may be a preference list such as "opus,m4a,mp3": the first format the video can be
+    served in without re-encoding is returned (see the Content-Type).
+    """
+    try:
+        path = get_audio(video_id, format)
+    except ValueError as e:
+        raise ValidationError(str(e))
+    except AudioDownloadError as e:
+        raise APIError(str(e), status_code=502)
+    delivered = os.path.splitext(path)[1][1:]
+    return FileResponse(path, media_type=AUDIO_FORMATS[delivered], filename=f"{video_id}.{delivered}",
+                        content_disposition_type="inline")
+
 @app.get("/api/manual_search_sp_to_yt")
 def manual_search_sp_to_yt(song: str, artist: str, user_id: str):
     logger.info(f"Manual search for '{song}' by '{artist}' for user_id: {user_id}")
@@ -299,6 +361,77 @@ def manual_search_yt_to_sp(song: str, artist: str, user_id: str):
         logger.error(f"Error in manual search YouTube to Spotify: {str(e)}")
         raise APIError(f"Failed to perform manual search: {str(e)}")
 
+@app.post("/api/match_batch")
+def match_batch(request: MatchBatchRequest):
+    """Matches many (title, artist, direction) items through search_auto and streams NDJSON.
+
+    One line is written per item as soon as it resolves (shared-index hits first, then searches in
+    completion order), so lines are not in request order; each carries the item's 'index'.
+    """
+    if not request.items:
+        raise ValidationError("items must not be empty")
+    if len(request.items) > MATCH_BATCH_MAX_ITEMS:
+        raise ValidationError(f"At most {MATCH_BATCH_MAX_ITEMS} items per batch")
+    directions = {item.direction for item in request.items}
+    workers = max(1, min(request.concurrency or SYNC_MATCH_WORKERS, MATCH_BATCH_MAX_CONCURRENCY))
+
+    # Authenticate once up front so failures are a normal HTTP error rather than a broken stream
+    searches = {}
+    if 'sp_to_yt' in directions:
+        yt = YoutubeProvider(request.user_id)
+        if not yt._check_authenticated():
+            raise AuthenticationError("YouTube is not authenticated.")
+        searches['sp_to_yt'] = lambda song, artists, duration_ms: yt.search_auto(song, artists, check_auth=False, duration_ms=duration_ms)
+    if 'yt_to_sp' in directions:
+        sp = SpotifyProvider(request.user_id)
+        try:
+            sp.ensure_client()
+        except SpotifyOauthError:
+            raise AuthenticationError("Spotify is not authenticated.")
+        searches['yt_to_sp'] = sp.search_auto
+
+    tracks = [
+        {'title': item.title, 'artist': item.artist, 'id': item.source_id,
+         'duration_ms': item.duration_ms, 'direction': item.direction}
+        for item in request.items
+    ]
+    logger.info(f"Batch match of {len(tracks)} items for user {request.user_id} with {workers} workers")
+
+    def stream():
+        db = SessionLocal()  # owned by the stream, which outlives the request handler
+        try:
+            for outcome in iter_matches(searches, db, tracks, workers=workers):
+                item = request.items[outcome.index]
+                line = {
+                    "index": outcome.index,
+                    "title": item.title,
+                    "artist": item.artist,
+                    "direction": item.direction,
+                    "cached": outcome.cached,
+                    "match": None,
+                }
+                if outcome.error is not None:
+                    logger.error(f"Batch match failed for '{item.title}' by '{item.artist}': {outcome.error}")
+                    line["status"] = "error"
+                    line["error"] = str(outcome.error)
+                elif outcome.result is None:
+                    line["status"] = "not_found"
+                else:
+                    target_id, title_score, artist_score, target_title, target_artist = outcome.result
+                    line["status"] = "found"
+                    line["match"] = {
+                        "id": target_id,
+                        "title": target_title,
+                        "artist": target_artist,
+                        "title_score": float(title_score),
+                        "artist_score": float(artist_score),
+                    }
+                yield json.dumps(line) + "\n"
+        finally:
+            db.close()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
 @app.get("/api/spotify_auth_url")
 def get_spotify_auth_url(user_id: str):
     """Return the Spotify authorization URL for the frontend/extension to redirect the user."""
@@ -417,6 +550,7 @@ def youtube_callback(code: str, state: str = None, user_id: str = None):
         creds = flow.credentials
         # Save creds for user_id in the database
         save_youtube_token(user_id, creds.to_json())
+        invalidate_client(user_id)
         frontend_url = os.getenv("FRONTEND_URL", "http://localhost:5173")
         return RedirectResponse(url=f"{frontend_url}/youtube-auth-success?user_id={user_id}")
     except Exception as e:
@@ -446,11 +580,13 @@ def youtube_auth_status(user_id: str):
         logger.error(f"Error checking YouTube auth status for user_id {user_id}: {str(e)}")
         return {"authenticated": False}
 
-def normalize_track(track):
-    """Helper to normalize track for comparison (name + artist, lowercased, stripped)."""
-    name = track.get('name', '').strip().lower()
-    artist = track.get('artist', '').strip().lower()
-    return f"{name}::{artist}"
+def tracks_missing_from(source_tracks, target_tracks):
+    """Fuzzy-diffs two playlists; returns (tracks to sync in source order, present count, ambiguous entries)."""
+    diff = PlaylistIndex(target_tracks or []).diff(source_tracks)
+    present = {id(track) for track, _ in diff.present}
+    ambiguous = [{"track": track, "candidates": candidates} for track, candidates in diff.ambiguous]
+    # Ambiguous tracks are still synced; the post-match checks in the sync skip true duplicates
+    return [t for t in source_tracks if id(t) not in present], len(diff.present), ambiguous
 
 @app.get("/api/pre_sync_check_sp_to_yt")
 def pre_sync_check_sp_to_yt(
@@ -466,8 +602,9 @@ def pre_sync_check_sp_to_yt(
         sp = SpotifyProvider(user_id)
         if not is_spotify_authenticated(user_id):
             raise AuthenticationError("Spotify is not authenticated.")
-        sp_playlist_id = sp.get_playlist_by_name(playlist_name)['id']
-        sp_tracks = sp.get_playlist_items(sp_playlist_id)  # Should return list of dicts with 'name' and 'artist'
+        sp_playlist = sp.get_playlist_by_name(playlist_name)
+        sp_playlist_id = sp_playlist['id']
+        sp_tracks = sp.get_playlist_items(sp_playlist_id, db, playlist=sp_playlist)  # Should return list of dicts with 'name' and 'artist'
         if not sp_tracks:
             raise ResourceNotFoundError(f"Spotify playlist '{playlist_name}' not found or empty.")
 
@@ -478,11 +615,10 @@ def pre_sync_check_sp_to_yt(
             yt_tracks = []
         else:
             yt_playlist_id = yt_playlist['id']
-            yt_tracks = yt.get_playlist_items(yt_playlist_id, db)  # Should return list of dicts with 'name' and 'artist'
-        yt_track_keys = set(normalize_track(t) for t in yt_tracks) if yt_tracks else set()
+            yt_tracks = yt.get_playlist_items(yt_playlist_id, db, playlist=yt_playlist)
 
         # Determine which tracks need to be synced
-        tracks_to_sync = [t for t in sp_tracks if normalize_track(t) not in yt_track_keys]
+        tracks_to_sync, already_present, ambiguous = tracks_missing_from(sp_tracks, yt_tracks)
         original_count = len(tracks_to_sync)
 
         # Quota logic
@@ -504,7 +640,9 @@ def pre_sync_check_sp_to_yt(
             "original_count": original_count,
             "final_count": reduced_count,
             "quota_cost": quota_cost,
-            "quota_threshold": QUOTA_THRESHOLD
+            "quota_threshold": QUOTA_THRESHOLD,
+            "already_present_count": already_present,
+            "ambiguous": ambiguous
         }
     except Exception as e:
         logger.error(f"Error in pre_sync_check_sp_to_yt: {str(e)}")
@@ -528,7 +666,7 @@ def pre_sync_check_yt_to_sp(
         if not yt_playlist:
             raise ResourceNotFoundError(f"YouTube playlist '{playlist_name}' not found.")
         yt_playlist_id = yt_playlist['id']
-        yt_tracks = yt.get_playlist_items(yt_playlist_id, db)  # Should return list of dicts with 'name' and 'artist'
+        yt_tracks = yt.get_playlist_items(yt_playlist_id, db, playlist=yt_playlist)  # Should return list of dicts with 'name' and 'artist'
         if not yt_tracks:
             raise ResourceNotFoundError(f"YouTube playlist '{playlist_name}' is empty.")
 
@@ -539,11 +677,10 @@ def pre_sync_check_yt_to_sp(
             sp_tracks = []
         else:
             sp_playlist_id = sp_playlist['id']
-            sp_tracks = sp.get_playlist_items(sp_playlist_id)  # Should return list of dicts with 'name' and 'artist'
-        sp_track_keys = set(normalize_track(t) for t in sp_tracks) if sp_tracks else set()
+            sp_tracks = sp.get_playlist_items(sp_playlist_id, db, playlist=sp_playlist)
 
         # Determine which tracks need to be synced
-        tracks_to_sync = [t for t in yt_tracks if normalize_track(t) not in sp_track_keys]
+        tracks_to_sync, already_present, ambiguous = tracks_missing_from(yt_tracks, sp_tracks)
         original_count = len(tracks_to_sync)
 
         # Quota logic (adjust as needed for Spotify API limits)
@@ -565,7 +702,9 @@ def pre_sync_check_yt_to_sp(
             "original_count": original_count,
             "final_count": reduced_count,
             "quota_cost": quota_cost,
-            "quota_threshold": QUOTA_THRESHOLD
+            "quota_threshold": QUOTA_THRESHOLD,
+            "already_present_count": already_present,
+            "ambiguous": ambiguous
         }
     except Exception as e:
         logger.error(f"Error in pre_sync_check_yt_to_sp: {str(e)}")
@@ -0,0 +1,76 @@
+from sqlalchemy import Column, Integer, String, DateTime, JSON, UniqueConstraint
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import Session
+import datetime
+
+Base = declarative_base()
+
+class PlaylistMembers(Base):
+    """The last fetched contents of one of a user's playlists, by platform id.
+
+    platform is 'youtube' (item ids are video ids) or 'spotify' (item ids are track ids, not uris).
+    version is the playlist's version when items was complete: '<etag>:<itemCount>' on YouTube,
+    the snapshot_id on Spotify. None means the items may be incomplete and must be refetched.
+    """
+    __tablename__ = 'playlist_members'
+    __table_args__ = (UniqueConstraint('user_id', 'platform', 'playlist_id', name='uq_playlist_members_user_platform_playlist'),)
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(String, nullable=False, index=True)
+    platform = Column(String, nullable=False)
+    playlist_id = Column(String, nullable=False)
+    version = Column(String, nullable=True)
+    items = Column(JSON, nullable=False)  # [{'id', 'title', 'artist', 'is_unplayable'}, ...] in playlist order
+    refreshed_at = Column(DateTime(timezone=True), nullable=False)
+
+
+def create_playlist_members_table(bind):
+    """Creates the playlist_members table (and its indexes) unless it already exists."""
+    Base.metadata.create_all(bind, checkfirst=True)
+
+
+def _insert(db: Session):
+    """The INSERT construct with ON CONFLICT support for the session's database."""
+    return sqlite.insert if db.get_bind().dialect.name == 'sqlite' else postgresql.insert
+
+
+def get_playlist_members(db: Session, user_id: str, platform: str, playlist_id: str):
+    """Returns the stored PlaylistMembers for a playlist, or None."""
+    return db.query(PlaylistMembers).filter_by(user_id=user_id, platform=platform, playlist_id=playlist_id).first()
+
+
+def save_playlist_members(db: Session, user_id: str, platform: str, playlist_id: str, version: str | None, items: list):
+    """Replaces the stored contents of a playlist in a single upsert."""
+    values = dict(
+        user_id=user_id,
+        platform=platform,
+        playlist_id=playlist_id,
+        version=version,
+        items=items,
+        refreshed_at=datetime.datetime.now(datetime.timezone.utc),
+    )
+    db.execute(
+        _insert(db)(PlaylistMembers)
+        .values(**values)
+        .on_conflict_do_update(
+            index_elements=['user_id', 'platform', 'playlist_id'],
+            set_={k: v for k, v in values.items() if k in ('version', 'items', 'refreshed_at')},
+        )
+    )
+    db.commit()
+
+
+def add_playlist_members(db: Session, user_id: str, platform: str, playlist_id: str, items: list, version: str | None):
+    """Appends items we just inserted into a playlist and records its new version.
+
+    Does nothing if the playlist has no stored contents, since the added items alone aren't the whole playlist.
+    """
+    members = get_playlist_members(db, user_id, platform, playlist_id)
+    if members is None:
+        return
+    known = {item['id'] for item in members.items}
+    members.items = members.items + [item for item in items if item['id'] not in known]
+    members.version = version
+    members.refreshed_at = datetime.datetime.now(datetime.timezone.utc)
+    db.commit()
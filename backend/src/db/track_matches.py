@@ -0,0 +1,93 @@
+from sqlalchemy import Column, Integer, String, Float, DateTime, UniqueConstraint
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import Session
+import datetime
+
+Base = declarative_base()
+
+class TrackMatch(Base):
+    """A confident cross-platform match, shared by every user.
+
+    direction is 'sp_to_yt' (source is a Spotify track, target a YouTube video id)
+    or 'yt_to_sp' (source is a YouTube video, target a Spotify track uri).
+    """
+    __tablename__ = 'track_matches'
+    # One row per (direction, fingerprint): the last match saved for a fingerprint wins, source_id included.
+    # That is intended, since tracks sharing a fingerprint share their target, and a source id whose row was
+    # taken over still finds the same target through the fingerprint in get_track_match.
+    __table_args__ = (UniqueConstraint('direction', 'fingerprint', name='uq_track_matches_direction_fingerprint'),)
+
+    id = Column(Integer, primary_key=True)
+    direction = Column(String, nullable=False)
+    fingerprint = Column(String, nullable=False)
+    source_id = Column(String, nullable=True, index=True)
+    target_id = Column(String, nullable=False)
+    target_title = Column(String, nullable=False)
+    target_artist = Column(String, nullable=False)
+    title_score = Column(Float, nullable=False)
+    artist_score = Column(Float, nullable=False)
+    confidence = Column(Float, nullable=False)
+    last_verified = Column(DateTime(timezone=True), nullable=False)
+
+
+def create_track_matches_table(bind):
+    """Creates the track_matches table (and its indexes) unless it already exists."""
+    Base.metadata.create_all(bind, checkfirst=True)
+
+
+def _insert(db: Session):
+    """The INSERT construct with ON CONFLICT support for the session's database."""
+    return sqlite.insert if db.get_bind().dialect.name == 'sqlite' else postgresql.insert
+
+
+def get_track_match(db: Session, direction: str, fingerprint: str, source_id: str | None = None, max_age: datetime.timedelta | None = None):
+    """Returns the stored TrackMatch for a source id, or for the fingerprint if the source id has none; None if
+    there is no (fresh) match.
+
+    A source id's own match wins over any fingerprint match, even when it is too old to be returned.
+    """
+    query = db.query(TrackMatch).filter(TrackMatch.direction == direction)
+    match = None
+    if source_id:
+        match = query.filter(TrackMatch.source_id == source_id).order_by(TrackMatch.last_verified.desc()).first()
+    if match is None:
+        match = query.filter(TrackMatch.fingerprint == fingerprint).first()
+    if match is None:
+        return None
+    if max_age is not None and _as_utc(match.last_verified) < datetime.datetime.now(datetime.timezone.utc) - max_age:
+        return None
+    return match
+
+
+def _as_utc(timestamp):
+    # Databases without time zone support (e.g. SQLite) hand back naive UTC datetimes
+    return timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=datetime.timezone.utc)
+
+
+def save_track_match(db: Session, direction: str, fingerprint: str, source_id: str | None, target_id: str,
+                     target_title: str, target_artist: str, title_score: float, artist_score: float, confidence: float):
+    """Inserts or refreshes the match for (direction, fingerprint) in a single upsert."""
+    values = dict(
+        direction=direction,
+        fingerprint=fingerprint,
+        source_id=source_id,
+        target_id=target_id,
+        target_title=target_title,
+        target_artist=target_artist,
+        title_score=title_score,
+        artist_score=artist_score,
+        confidence=confidence,
+        last_verified=datetime.datetime.now(datetime.timezone.utc),
+    )
+    update_values = {k: v for k, v in values.items() if k not in ('direction', 'fingerprint')}
+    if source_id is None:
+        # Don't erase a source id recorded by an earlier match
+        update_values.pop('source_id')
+
+    db.execute(
+        _insert(db)(TrackMatch)
+        .values(**values)
+        .on_conflict_do_update(index_elements=['direction', 'fingerprint'], set_=update_values)
+    )
+    db.commit()
@@ -1,5 +1,147 @@
-from helpers.yt_provider import YoutubeProvider
+from src.functions.helpers.yt_provider import YoutubeProvider
+from src.functions.helpers.audio_cache import get_audio, find_cached, parse_formats, AudioDownloadError
+from src.functions.helpers.log_pipeline import log_sampled
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import io
+import logging
+import os
+import re
+import zipfile
 
-def download_yt_playlist(song_name, artists, user_id):
-    yt = YoutubeProvider(user_id)
-    yt.download_song(yt.search_manual(song_name, artists))
\ No newline at end of file
+logger = logging.getLogger(__name__)
+
+# Tracks downloaded at once by a download_playlist job (the audio cache's
+# AUDIO_DOWNLOAD_WORKERS still caps the yt-dlp processes of each worker)
+DOWNLOAD_PLAYLIST_PARALLELISM = int(os.getenv("DOWNLOAD_PLAYLIST_PARALLELISM", "4"))
+# A 'downloading' job without a checkpoint for this long is taken to be dead and can be resumed
+DOWNLOAD_PLAYLIST_STALE_SECONDS = int(os.getenv("DOWNLOAD_PLAYLIST_STALE_SECONDS", "900"))
+
+_UNSAFE_NAME_RE = re.compile(r'[\\/:*?"<>|\x00-\x1f]+')
+
+
+def playlist_checkpoint(tracks, playlist_id=None, fmt='mp3'):
+    """The job result of a download: every track with its status, and the counts so far."""
+    counts = {'total': len(tracks), 'done': 0, 'failed': 0, 'skipped': 0, 'pending': 0}
+    for track in tracks:
+        counts[track['status']] += 1
+    return {'playlist_id': playlist_id, 'format': fmt, 'tracks': [dict(track) for track in tracks], 'progress': counts}
+
+
+def download_yt_playlist(playlist_name, yt: YoutubeProvider, db, checkpoint=None, parallelism=None, on_progress=None, fmt=None):
+    """Downloads the audio of every track of a YouTube playlist into the audio cache.
+
+    Tracks already marked 'done' in the checkpoint (a previous playlist_checkpoint) are kept as long
+    as their file is still cached, so an interrupted download resumes where it stopped. Failed
+    tracks are retried.
+
+    Args:
+        playlist_name (str): the YouTube playlist to download.
+        checkpoint (dict, optional): the result of an earlier run of the same job.
+        parallelism (int, optional): tracks downloaded at once; DOWNLOAD_PLAYLIST_PARALLELISM if not given.
+        on_progress (callable, optional): called with the checkpoint after every finished track.
+        fmt (str, optional): audio format or preference list (see audio_cache); the checkpoint's, or 'mp3', if not given.
+
+    Returns:
+        dict: the final checkpoint.
+    """
+    fmt = ','.join(parse_formats(fmt or (checkpoint or {}).get('format') or 'mp3'))
+    if checkpoint and checkpoint.get('tracks'):
+        playlist_id = checkpoint.get('playlist_id')
+        tracks = [dict(track) for track in checkpoint['tracks']]
+        logger.info("Resuming download of '%s': %s of %s tracks done", playlist_name,
+                    checkpoint.get('progress', {}).get('done', 0), len(tracks))
+    else:
+        pl_info = yt.get_playlist_by_name(playlist_name, db)
+        if pl_info is None:
+            raise Exception(f"Could not find or access playlist '{playlist_name}'")
+        playlist_id = pl_info['id']
+        tracks = [{'id': item['id'], 'title': item.get('title'), 'artist': item.get('artist'),
+                   'status': 'skipped' if item.get('is_unplayable') else 'pending', 'error': None}
+                  for item in yt.get_playlist_items(playlist_id, db, playlist=pl_info)]
+        logger.info("Downloading %s tracks of '%s'", len(tracks), playlist_name)
+
+    todo = []
+    for index, track in enumerate(tracks):
+        if track['status'] == 'skipped':
+            continue
+        if track['status'] == 'done' and find_cached(track['id'], fmt) is not None:
+            continue
+        track.update(status='pending', error=None)
+        todo.append(index)
+
+    if on_progress is not None:
+        on_progress(playlist_checkpoint(tracks, playlist_id, fmt))
+
+    with ThreadPoolExecutor(max_workers=max(1, parallelism or DOWNLOAD_PLAYLIST_PARALLELISM)) as executor:
+        futures = {executor.submit(get_audio, tracks[index]['id'], fmt): index for index in todo}
+        for future in as_completed(futures):
+            track = tracks[futures[future]]
+            try:
+                future.result()
+                track['status'] = 'done'
+                log_sampled(logger, logging.DEBUG, "Downloaded %s (%s)", track['title'], track['id'])
+            except (ValueError, AudioDownloadError) as e:
+                track.update(status='failed', error=str(e))
+                logger.warning("Could not download %s (%s): %s", track['title'], track['id'], e)
+            if on_progress is not None:
+                on_progress(playlist_checkpoint(tracks, playlist_id, fmt))
+
+    return playlist_checkpoint(tracks, playlist_id, fmt)
+
+
+def _archive_name(position, track, ext, used):
+    name = _UNSAFE_NAME_RE.sub('_', f"{track.get('artist') or 'Unknown'} - {track.get('title') or track['id']}").strip(' .')
+    name = f"{position:03d} - {name[:150]}"
+    while f"{name}{ext}" in used:
+        name += f" ({track['id']})"
+    used.add(f"{name}{ext}")
+    return f"{name}{ext}"
+
+
+class _ZipSink(io.RawIOBase):
+    """Write-only stream that collects what zipfile writes, so it can be sent as it is produced."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_playlist_zip(tracks, fmt='mp3', chunk_size=64 * 1024):
+    """Yields a zip of the downloaded tracks (status 'done') piece by piece, without building it in memory or on disk.
+
+    A track whose file has left the cache is downloaded again; if that fails it is left out.
+    """
+    sink = _ZipSink()
+    used = set()
+    # Compressed audio doesn't shrink any further, so the files are stored as is
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for position, track in enumerate(tracks, start=1):
+            if track.get('status') != 'done':
+                continue
+            try:
+                path = get_audio(track['id'], fmt)
+            except (ValueError, AudioDownloadError) as e:
+                logger.warning("Leaving %s out of the zip: %s", track['id'], e)
+                continue
+            info = zipfile.ZipInfo.from_file(path, _archive_name(position, track, os.path.splitext(path)[1], used))
+            info.compress_type = zipfile.ZIP_STORED
+            with open(path, 'rb') as source, archive.open(info, 'w') as entry:
+                while True:
+                    data = source.read(chunk_size)
+                    if not data:
+                        break
+                    entry.write(data)
+                    yield sink.take()
+            yield sink.take()
+    yield sink.take()
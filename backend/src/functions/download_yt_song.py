@@ -1,12 +1,17 @@
 from src.functions.helpers.yt_provider import YoutubeProvider
+import logging
+
+logger = logging.getLogger(__name__)
 
 def download_yt_song(song_name, artists, user_id):
-    print("Downloading YouTube song...")
+    logger.info("Downloading YouTube song...")
     yt = YoutubeProvider(user_id)
-    video_id = yt.search_manual(song_name, artists)
-    if video_id:
-        yt.download_song(video_id)
-        return f"Downloaded '{song_name}' by '{artists}' successfully!"
+    results = yt.search_manual(song_name, artists)
+    if results:
+        video_id = results[0]['yt_id']
+        if yt.download_song(video_id) is None:
+            return f"Could not download '{song_name}' by '{artists}'."
+        return f"Downloaded '{song_name}' by '{artists}' successfully! Stream it from /api/audio/{video_id}"
 
     else:
         return f"Could not find the song '{song_name}' by '{artists}'."
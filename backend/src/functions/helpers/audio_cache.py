@@ -0,0 +1,314 @@
+"""Content-addressed disk cache of YouTube audio, filled by a pool of yt-dlp processes.
+
+A stream already in an acceptable format is kept or remuxed; only otherwise is it transcoded with
+ffmpeg, on a smaller pool of its own. See get_audio().
+"""
+import hashlib
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+# Where downloaded audio is kept
+AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR", os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..', 'audio_cache')))
+# yt-dlp processes running at once in each server process
+AUDIO_DOWNLOAD_WORKERS = int(os.getenv("AUDIO_DOWNLOAD_WORKERS", "4"))
+# ffmpeg transcodes running at once in each server process, and the threads each may use
+AUDIO_TRANSCODE_WORKERS = int(os.getenv("AUDIO_TRANSCODE_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+AUDIO_TRANSCODE_THREADS = int(os.getenv("AUDIO_TRANSCODE_THREADS", "1"))
+# Niceness transcodes run at (0 keeps the server's priority)
+AUDIO_TRANSCODE_NICE = int(os.getenv("AUDIO_TRANSCODE_NICE", "10"))
+# Longest a caller waits for a download
+AUDIO_DOWNLOAD_TIMEOUT = float(os.getenv("AUDIO_DOWNLOAD_TIMEOUT", "300"))
+# Cache size beyond which the least recently used files are deleted (0 keeps everything)
+AUDIO_CACHE_MAX_BYTES = int(os.getenv("AUDIO_CACHE_MAX_BYTES", str(5 * 1024 ** 3)))
+FFMPEG_PATH = os.getenv("FFMPEG_PATH", "ffmpeg")
+
+# Formats get_audio can produce, with their media types
+AUDIO_FORMATS = {
+    'mp3': 'audio/mpeg',
+    'm4a': 'audio/mp4',
+    'opus': 'audio/ogg',
+    'webm': 'audio/webm',
+}
+
+# Per format: the codec it holds (as yt-dlp reports it), the container yt-dlp names it by, the
+# ffmpeg muxer, the encoder used when transcoding, and the yt-dlp selector for a matching stream
+_FORMAT_SPECS = {
+    'mp3': {'codec': 'mp3', 'ext': 'mp3', 'muxer': 'mp3',
+            'encoder': ['-c:a', 'libmp3lame', '-b:a', '192k'], 'selector': 'bestaudio[acodec=mp3]'},
+    'm4a': {'codec': 'mp4a', 'ext': 'm4a', 'muxer': 'ipod',
+            'encoder': ['-c:a', 'aac', '-b:a', '192k'], 'selector': 'bestaudio[ext=m4a]'},
+    'opus': {'codec': 'opus', 'ext': 'opus', 'muxer': 'opus',
+             'encoder': ['-c:a', 'libopus', '-b:a', '160k'], 'selector': 'bestaudio[acodec=opus]'},
+    'webm': {'codec': 'opus', 'ext': 'webm', 'muxer': 'webm',
+             'encoder': ['-c:a', 'libopus', '-b:a', '160k'], 'selector': 'bestaudio[acodec=opus]'},
+}
+
+_VIDEO_ID_RE = re.compile(r'^[A-Za-z0-9_-]{11}$')
+
+_pool = None
+_transcode_pool = None
+# Drives each video through the stages; twice the stage slots, so transcodes waiting for a slot never hold up downloads
+_pipelines = ThreadPoolExecutor(max_workers=2 * (AUDIO_DOWNLOAD_WORKERS + AUDIO_TRANSCODE_WORKERS), thread_name_prefix='audio-pipeline')
+_pool_lock = threading.RLock()  # reentrant: a done callback may run while it is held
+_in_flight = {}  # (video_id, formats) -> Future of the pipeline
+
+_stats_lock = threading.Lock()
+_stats = {'passthrough': 0, 'remux': 0, 'transcode': 0, 'failed': 0}
+_stage_seconds = {'download': 0.0, 'remux': 0.0, 'transcode': 0.0}
+
+
+class AudioDownloadError(Exception):
+    """yt-dlp couldn't produce the audio (or took longer than AUDIO_DOWNLOAD_TIMEOUT)."""
+
+
+def cache_path(video_id, fmt):
+    """Where the audio of a video in a format is (or will be) cached."""
+    key = hashlib.sha256(f"{video_id}:{fmt}".encode()).hexdigest()
+    return os.path.join(AUDIO_CACHE_DIR, key[:2], f"{key}.{fmt}")
+
+
+def parse_formats(fmt):
+    """Validates a format or comma-separated preference list ('opus,m4a,mp3') and returns it as a tuple."""
+    formats = tuple(dict.fromkeys(part.strip().lower() for part in (fmt or '').split(',') if part.strip()))
+    if not formats:
+        raise ValueError("No audio format given")
+    unsupported = [f for f in formats if f not in AUDIO_FORMATS]
+    if unsupported:
+        raise ValueError(f"Unsupported audio format: {unsupported[0]!r}")
+    return formats
+
+
+def ydl_format_selector(formats):
+    """yt-dlp format selector preferring a stream in one of the formats, in order, over any other audio."""
+    return '/'.join([_FORMAT_SPECS[f]['selector'] for f in formats] + ['bestaudio', 'best'])
+
+
+def plan_conversion(codec, ext, fmt):
+    """How a source stream (yt-dlp's acodec and ext) becomes fmt: 'passthrough', 'remux' or 'transcode'."""
+    spec = _FORMAT_SPECS[fmt]
+    if not (codec or '').lower().startswith(spec['codec']):
+        return 'transcode'
+    return 'passthrough' if ext == spec['ext'] else 'remux'
+
+
+def _fetch(video_id, selector, directory):
+    """Runs in a pool process: downloads a video's best matching audio stream as is."""
+    import yt_dlp
+
+    ydl_opts = {
+        'format': selector,
+        'outtmpl': os.path.join(directory, 'source.%(ext)s'),
+        'quiet': True,
+        'noprogress': True,
+        'noplaylist': True,
+    }
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(f"https://www.youtube.com/watch?v={video_id}", download=True)
+        downloads = info.get('requested_downloads') or [{}]
+        path = downloads[0].get('filepath') or ydl.prepare_filename(info)
+    if not os.path.exists(path):
+        raise RuntimeError(f"yt-dlp produced no file for {video_id}")
+    return {'path': path, 'codec': info.get('acodec'), 'ext': info.get('ext')}
+
+
+def _ffmpeg(source, output, fmt, codec_args, timeout, nice=0):
+    command = [FFMPEG_PATH, '-nostdin', '-loglevel', 'error', '-y', '-i', source, '-vn', *codec_args,
+               '-f', _FORMAT_SPECS[fmt]['muxer'], output]
+    if nice and shutil.which('nice'):
+        command = ['nice', '-n', str(nice)] + command
+    completed = subprocess.run(command, capture_output=True, timeout=timeout)
+    if completed.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {completed.stderr.decode('utf-8', 'replace').strip()[-500:]}")
+
+
+def _transcode(source, output, fmt, timeout):
+    """Runs on the transcode pool: re-encodes the source with a bounded number of threads."""
+    _ffmpeg(source, output, fmt, _FORMAT_SPECS[fmt]['encoder'] + ['-threads', str(AUDIO_TRANSCODE_THREADS)],
+            timeout, nice=AUDIO_TRANSCODE_NICE)
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        # Spawned rather than forked: the server process runs threads (logging, pools) that a fork would copy mid-state
+        _pool = ProcessPoolExecutor(max_workers=AUDIO_DOWNLOAD_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def _get_transcode_pool():
+    global _transcode_pool
+    if _transcode_pool is None:
+        # ffmpeg does the work in its own process, so threads are enough to bound how many run
+        _transcode_pool = ThreadPoolExecutor(max_workers=AUDIO_TRANSCODE_WORKERS, thread_name_prefix='audio-transcode')
+    return _transcode_pool
+
+
+def _submit_fetch(video_id, selector, directory):
+    global _pool
+    with _pool_lock:
+        try:
+            return _get_pool().submit(_fetch, video_id, selector, directory)
+        except BrokenProcessPool:
+            _pool = None
+            return _get_pool().submit(_fetch, video_id, selector, directory)
+
+
+def _record(plan, timings):
+    with _stats_lock:
+        _stats[plan] += 1
+        for stage, seconds in timings.items():
+            _stage_seconds[stage] += seconds
+
+
+def _run_pipeline(video_id, formats):
+    """Takes a video through download, then passthrough/remux/transcode, into the cache. Returns (path, timings)."""
+    os.makedirs(AUDIO_CACHE_DIR, exist_ok=True)
+    # Created inside the cache, so the rename below is atomic
+    tmp = tempfile.mkdtemp(dir=AUDIO_CACHE_DIR, prefix='.download-')
+    try:
+        timings = {}
+        start = time.monotonic()
+        source = _submit_fetch(video_id, ydl_format_selector(formats), tmp).result()
+        timings['download'] = time.monotonic() - start
+
+        plans = {fmt: plan_conversion(source['codec'], source['ext'], fmt) for fmt in formats}
+        fmt = next((f for f in formats if plans[f] != 'transcode'), formats[0])
+        plan = plans[fmt]
+        path = cache_path(video_id, fmt)
+        output = os.path.join(tmp, f"output.{fmt}")
+
+        start = time.monotonic()
+        if plan == 'passthrough':
+            output = source['path']
+        elif plan == 'remux':
+            _ffmpeg(source['path'], output, fmt, ['-c:a', 'copy'], AUDIO_DOWNLOAD_TIMEOUT)
+            timings['remux'] = time.monotonic() - start
+        else:
+            _get_transcode_pool().submit(_transcode, source['path'], output, fmt, AUDIO_DOWNLOAD_TIMEOUT).result()
+            timings['transcode'] = time.monotonic() - start
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(output, path)
+        _record(plan, timings)
+        logger.info("Cached %s as %s (%s from %s/%s): %s", video_id, fmt, plan, source['codec'], source['ext'],
+                    ', '.join(f"{stage} {seconds:.2f}s" for stage, seconds in timings.items()))
+        return path, timings
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _finish(key, future):
+    global _pool
+    with _pool_lock:
+        _in_flight.pop(key, None)
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            with _stats_lock:
+                _stats['failed'] += 1
+            if isinstance(error, BrokenProcessPool):
+                # A worker died (e.g. killed for memory); the next download starts a new pool
+                _pool = None
+
+
+def _evict():
+    """Deletes the least recently used files while the cache is larger than AUDIO_CACHE_MAX_BYTES."""
+    if AUDIO_CACHE_MAX_BYTES <= 0:
+        return
+    files = []
+    for root, dirs, names in os.walk(AUDIO_CACHE_DIR):
+        dirs[:] = [d for d in dirs if not d.startswith('.download-')]
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= AUDIO_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+def find_cached(video_id, fmt='mp3'):
+    """Path of a video's audio already cached in one of the formats, in preference order, or None."""
+    for f in parse_formats(fmt):
+        path = cache_path(video_id, f)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def get_audio(video_id, fmt='mp3'):
+    """Path of a video's audio, downloading (and converting) it unless it is cached.
+
+    Args:
+        video_id (str): a YouTube video id.
+        fmt (str): one of AUDIO_FORMATS, or a comma-separated preference list of them.
+
+    Returns:
+        str: the cached file's path; its extension is the format that was delivered.
+
+    Raises:
+        ValueError: for a malformed video id or an unsupported format.
+        AudioDownloadError: if the download failed or timed out.
+    """
+    if not _VIDEO_ID_RE.match(video_id or ''):
+        raise ValueError(f"Invalid YouTube video id: {video_id!r}")
+    formats = parse_formats(fmt)
+
+    path = find_cached(video_id, ','.join(formats))
+    if path is not None:
+        os.utime(path)  # marks it recently used
+        logger.debug("Cache hit for %s (%s)", video_id, os.path.splitext(path)[1][1:])
+        return path
+
+    key = (video_id, formats)
+    with _pool_lock:
+        future = _in_flight.get(key)
+        if future is None:
+            logger.info("Downloading %s as %s", video_id, ','.join(formats))
+            future = _pipelines.submit(_run_pipeline, video_id, formats)
+            _in_flight[key] = future
+            future.add_done_callback(lambda done: _finish(key, done))
+    try:
+        path, _ = future.result(timeout=AUDIO_DOWNLOAD_TIMEOUT)
+    except FutureTimeoutError:
+        raise AudioDownloadError(f"Downloading {video_id} took longer than {AUDIO_DOWNLOAD_TIMEOUT:.0f}s")
+    except Exception as e:
+        raise AudioDownloadError(f"Failed to download {video_id}: {e}") from e
+
+    _evict()
+    return path
+
+
+def get_audio_pipeline_stats():
+    """How this process's audio was delivered (passthrough, remux, transcode) and the time spent per stage."""
+    with _stats_lock:
+        delivered = _stats['passthrough'] + _stats['remux'] + _stats['transcode']
+        return {
+            **_stats,
+            'delivered': delivered,
+            'converted_without_transcode': round((delivered - _stats['transcode']) / delivered, 3) if delivered else 0.0,
+            'stage_seconds': {stage: round(seconds, 2) for stage, seconds in _stage_seconds.items()},
+            'transcode_workers': AUDIO_TRANSCODE_WORKERS,
+            'download_workers': AUDIO_DOWNLOAD_WORKERS,
+        }
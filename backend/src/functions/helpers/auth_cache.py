@@ -0,0 +1,81 @@
+"""Records, in Redis, that a user's provider token was last seen working, so callers needn't probe
+the API before every operation. Only a 401/403 drops a record before the token expires.
+"""
+import os
+import threading
+import time
+import redis
+from .redis_client import get_redis, report_redis_error
+
+AUTH_CACHE_MAX_AGE = int(os.getenv("AUTH_CACHE_MAX_AGE", "3600"))
+AUTH_CACHE_LOCAL_TTL = int(os.getenv("AUTH_CACHE_LOCAL_TTL", "60"))
+
+_KEY_PREFIX = "syncer:auth:"
+
+_local = {}  # (provider, user_id) -> (trusted until, recheck Redis after), both time.time()
+_local_lock = threading.Lock()
+
+
+def _key(provider, user_id):
+    return f"{_KEY_PREFIX}{provider}:{user_id}"
+
+
+def is_auth_valid(provider, user_id):
+    """True if a validation of the user's token is on record and hasn't expired."""
+    now = time.time()
+    with _local_lock:
+        valid_until, recheck_at = _local.get((provider, user_id), (0.0, 0.0))
+    if now < min(valid_until, recheck_at):
+        return True
+
+    client = get_redis()
+    if client is None:
+        # Without Redis the in-process record is all there is
+        return now < valid_until
+    try:
+        raw = client.get(_key(provider, user_id))
+    except redis.RedisError as e:
+        report_redis_error(e, source="AuthCache")
+        return now < valid_until
+
+    with _local_lock:
+        if raw is None:
+            _local.pop((provider, user_id), None)
+            return False
+        valid_until = float(raw)
+        _local[(provider, user_id)] = (valid_until, now + AUTH_CACHE_LOCAL_TTL)
+    return now < valid_until
+
+
+def record_auth_valid(provider, user_id, expires_at=None):
+    """Records a successful validation, trusted until expires_at (epoch seconds) or AUTH_CACHE_MAX_AGE."""
+    now = time.time()
+    valid_until = now + AUTH_CACHE_MAX_AGE
+    if expires_at is not None:
+        valid_until = min(valid_until, expires_at)
+    ttl = int(valid_until - now)
+    if ttl <= 0:
+        return
+
+    with _local_lock:
+        _local[(provider, user_id)] = (valid_until, now + AUTH_CACHE_LOCAL_TTL)
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        client.set(_key(provider, user_id), valid_until, ex=ttl)
+    except redis.RedisError as e:
+        report_redis_error(e, source="AuthCache")
+
+
+def invalidate_auth(provider, user_id):
+    """Forgets the user's validation, after an API call was rejected with 401/403 or a new token was saved."""
+    with _local_lock:
+        _local.pop((provider, user_id), None)
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        client.delete(_key(provider, user_id))
+    except redis.RedisError as e:
+        report_redis_error(e, source="AuthCache")
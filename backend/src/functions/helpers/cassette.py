@@ -0,0 +1,252 @@
+"""Record/replay HTTP cassettes, to run the providers without Google or Spotify.
+
+SYNCER_CASSETTE_MODE=record also writes every httplib2, requests and httpx exchange under
+SYNCER_CASSETTE_DIR; replay answers the same requests from there (CassetteMissError for any other).
+SYNCER_CASSETTE_LATENCY ('recorded' or milliseconds), SYNCER_CASSETTE_ERROR_RATE,
+SYNCER_CASSETTE_ERROR_STATUS and SYNCER_CASSETTE_SEED make a replay slow or flaky.
+"""
+import base64
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import httplib2
+import httpx
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Never part of the match key: they change between runs and must not land on disk
+_IGNORED_PARAMS = {"key", "access_token", "quotaUser", "prettyPrint"}
+_TOKEN_URLS = ("oauth2.googleapis.com/token", "accounts.google.com/o/oauth2/token", "accounts.spotify.com/api/token")
+_REDACTED_FIELDS = ("access_token", "refresh_token", "id_token")
+_SKIPPED_HEADERS = {"set-cookie", "content-encoding", "transfer-encoding", "content-length", "status"}
+# googleapiclient batch bodies: a random boundary, a random base in each part's Content-ID
+# ('<uuid + 3>'), and the API key and authorization header of each part's request
+_BATCH_BOUNDARY_RE = re.compile(rb"\A--(=+\d+=+)")
+_BATCH_CONTENT_ID_RE = re.compile(rb"(?im)^(content-id: <)[^+>]*\+")
+_BATCH_AUTH_RE = re.compile(rb"(?im)^(authorization: ).*$")
+_BATCH_PARAM_RE = re.compile(rb"([?&](?:" + "|".join(map(re.escape, sorted(_IGNORED_PARAMS))).encode() + rb")=)[^&\s]*")
+
+
+class CassetteMissError(Exception):
+    """Raised in replay mode for a request that has no recording."""
+
+
+class Cassette:
+    def __init__(self, directory, mode, latency="", error_rate=0.0, error_status=503, seed=None):
+        self.directory = directory
+        self.mode = mode
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._recordings = {}  # path -> {'request': ..., 'responses': [...]}
+        self._replayed = {}  # path -> responses served so far
+
+    def _path(self, library, method, url, body):
+        """The recording file of a request, keyed on its method, URL without secrets, and body."""
+        parts = urlsplit(url)
+        query = urlencode(sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                                 if k not in _IGNORED_PARAMS))
+        url = urlunsplit((parts.scheme, parts.netloc, parts.path, query, ""))
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        if _is_token_url(url) or not body:
+            body = b""
+        body = _normalize_batch_body(body)
+        digest = hashlib.sha1(b"\n".join([method.upper().encode(), url.encode(), body])).hexdigest()
+        return os.path.join(self.directory, library, f"{digest}.json"), url
+
+    def _load(self, path):
+        if path not in self._recordings:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self._recordings[path] = json.load(f)
+            except FileNotFoundError:
+                self._recordings[path] = None
+        return self._recordings[path]
+
+    def record(self, library, method, url, body, status, headers, content, elapsed):
+        path, key_url = self._path(library, method, url, body)
+        if _is_token_url(key_url):
+            content = _redact_tokens(content)
+        response = {
+            "status": status,
+            "headers": {k: v for k, v in headers.items() if k.lower() not in _SKIPPED_HEADERS},
+            "elapsed": round(elapsed, 4),
+        }
+        try:
+            response["body"] = content.decode("utf-8")
+        except UnicodeDecodeError:
+            response["body_b64"] = base64.b64encode(content).decode("ascii")
+
+        with self._lock:
+            recording = self._load(path) or {"request": {"method": method.upper(), "url": key_url}, "responses": []}
+            recording["responses"].append(response)
+            self._recordings[path] = recording
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(recording, f, indent=1)
+
+    def replay(self, library, method, url, body):
+        """Returns (status, headers, content) for the next recorded response to this request."""
+        path, key_url = self._path(library, method, url, body)
+        with self._lock:
+            recording = self._load(path)
+            if not recording:
+                raise CassetteMissError(f"No recording for {method.upper()} {key_url} ({library}) in {self.directory}")
+            served = self._replayed.get(path, 0)
+            self._replayed[path] = served + 1
+            # Once every recorded response has been served, keep repeating the last one
+            response = recording["responses"][min(served, len(recording["responses"]) - 1)]
+            inject_error = self.error_rate > 0 and self._random.random() < self.error_rate
+
+        if self.latency == "recorded":
+            time.sleep(response.get("elapsed", 0))
+        elif self.latency:
+            time.sleep(float(self.latency) / 1000)
+
+        if inject_error:
+            body = json.dumps({"error": {"code": self.error_status, "message": "Injected by cassette replay"}})
+            return self.error_status, {"content-type": "application/json"}, body.encode("utf-8")
+        if "body_b64" in response:
+            content = base64.b64decode(response["body_b64"])
+        else:
+            content = response.get("body", "").encode("utf-8")
+        return response["status"], response.get("headers", {}), content
+
+
+def _normalize_batch_body(body):
+    """A batch request body with its random and secret parts replaced by fixed ones; other bodies as they are."""
+    match = _BATCH_BOUNDARY_RE.match(body)
+    if match is None:
+        return body
+    body = body.replace(match.group(1), b"batch-boundary")
+    body = _BATCH_CONTENT_ID_RE.sub(rb"\1batch +", body)
+    body = _BATCH_AUTH_RE.sub(rb"\1cassette-redacted", body)
+    return _BATCH_PARAM_RE.sub(rb"\1", body)
+
+
+def _is_token_url(url):
+    return any(token_url in url for token_url in _TOKEN_URLS)
+
+
+def _redact_tokens(content):
+    try:
+        data = json.loads(content)
+    except ValueError:
+        return content
+    if not isinstance(data, dict):
+        return content
+    for field in _REDACTED_FIELDS:
+        if field in data:
+            data[field] = "cassette-redacted"
+    return json.dumps(data).encode("utf-8")
+
+
+_cassette = None
+_install_lock = threading.Lock()
+
+
+def get_cassette():
+    """Returns the active Cassette, or None when SYNCER_CASSETTE_MODE is off."""
+    return _cassette
+
+
+def install_cassette():
+    """Patches httplib2, requests and httpx according to SYNCER_CASSETTE_MODE. Safe to call repeatedly."""
+    global _cassette
+    # Read here rather than at import so values from .env (load_dotenv) are picked up
+    mode = os.getenv("SYNCER_CASSETTE_MODE", "").strip().lower()
+    if mode not in ("record", "replay"):
+        return None
+    with _install_lock:
+        if _cassette is not None:
+            return _cassette
+        directory = os.getenv("SYNCER_CASSETTE_DIR", os.path.join(os.getcwd(), "cassettes"))
+        seed = os.getenv("SYNCER_CASSETTE_SEED")
+        _cassette = Cassette(
+            directory,
+            mode,
+            latency=os.getenv("SYNCER_CASSETTE_LATENCY", "").strip().lower(),
+            error_rate=float(os.getenv("SYNCER_CASSETTE_ERROR_RATE", "0")),
+            error_status=int(os.getenv("SYNCER_CASSETTE_ERROR_STATUS", "503")),
+            seed=int(seed) if seed else None,
+        )
+        _patch_httplib2(_cassette)
+        _patch_requests(_cassette)
+        _patch_httpx(_cassette)
+        logger.info("Cassette %s mode, cassettes in %s", mode, directory)
+        return _cassette
+
+
+def _patch_httplib2(cassette):
+    """googleapiclient (YouTube Data API) and google-auth-httplib2."""
+    original = httplib2.Http.request
+
+    def request(self, uri, method="GET", body=None, headers=None, *args, **kwargs):
+        if cassette.mode == "replay":
+            status, resp_headers, content = cassette.replay("googleapiclient", method, uri, body)
+            info = {k.lower(): v for k, v in resp_headers.items()}
+            info["status"] = str(status)
+            return httplib2.Response(info), content
+
+        start = time.monotonic()
+        resp, content = original(self, uri, method, body, headers, *args, **kwargs)
+        cassette.record("googleapiclient", method, uri, body, resp.status, dict(resp), content, time.monotonic() - start)
+        return resp, content
+
+    httplib2.Http.request = request
+
+
+def _patch_requests(cassette):
+    """spotipy and google-auth token refreshes."""
+    original = requests.Session.send
+
+    def send(self, request, **kwargs):
+        if cassette.mode == "replay":
+            status, resp_headers, content = cassette.replay("requests", request.method, request.url, request.body)
+            response = requests.Response()
+            response.status_code = status
+            response.headers = requests.structures.CaseInsensitiveDict(resp_headers)
+            response._content = content
+            response.url = request.url
+            response.request = request
+            response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+            response.reason = "Cassette"
+            return response
+
+        start = time.monotonic()
+        response = original(self, request, **kwargs)
+        cassette.record("requests", request.method, request.url, request.body, response.status_code,
+                        dict(response.headers), response.content, time.monotonic() - start)
+        return response
+
+    requests.Session.send = send
+
+
+def _patch_httpx(cassette):
+    """youtubesearchpython (VideosSearch)."""
+    original = httpx.Client.send
+
+    def send(self, request, *args, **kwargs):
+        if cassette.mode == "replay":
+            status, resp_headers, content = cassette.replay("youtubesearchpython", request.method, str(request.url),
+                                                            request.content)
+            return httpx.Response(status, headers=resp_headers, content=content, request=request)
+
+        start = time.monotonic()
+        response = original(self, request, *args, **kwargs)
+        response.read()
+        cassette.record("youtubesearchpython", request.method, str(request.url), request.content,
+                        response.status_code, dict(response.headers), response.content, time.monotonic() - start)
+        return response
+
+    httpx.Client.send = send
@@ -0,0 +1,151 @@
+"""Non-blocking logging: setup_logging() makes the root logger queue records for a listener thread
+to write (dropping them when the queue is full). log_context() adds job fields to the records
+logged inside it, and log_sampled() samples per-track DEBUG messages.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+from contextlib import contextmanager
+
+# Level of every logger (DEBUG adds the per-track messages)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# 'text' (the format server.py always used) or 'json' (one object per line)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+# Share of per-track DEBUG messages that are written (1 keeps all of them)
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
+# Records waiting for the writer thread; beyond this new records are dropped
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+_TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_context = contextvars.ContextVar("log_context", default={})
+_handlers = []
+_listener = None
+_queue_handler = None
+
+
+@contextmanager
+def log_context(**fields):
+    """Adds fields (e.g. job_id, user_id) to every record logged within the block."""
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def log_sampled(logger, level, msg, *args):
+    """Logs a per-item message for a LOG_SAMPLE_RATE share of calls; only a level check when the level is off."""
+    if logger.isEnabledFor(level) and random.random() < LOG_SAMPLE_RATE:
+        logger.log(level, msg, *args)
+
+
+class _ContextFilter(logging.Filter):
+    """Copies the caller's log_context onto the record before it leaves the caller's thread."""
+
+    def filter(self, record):
+        record.context = _context.get()
+        return True
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of waiting when the queue is full."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__(_TEXT_FORMAT)
+
+    def format(self, record):
+        line = super().format(record)
+        context = getattr(record, 'context', None)
+        if context:
+            line += ' [' + ' '.join(f"{key}={value}" for key, value in context.items()) + ']'
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            **(getattr(record, 'context', None) or {}),
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def _start_listener():
+    global _listener, _queue_handler
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    handler = _NonBlockingQueueHandler(log_queue)
+    handler.addFilter(_ContextFilter())
+    root = logging.getLogger()
+    for old in list(root.handlers):
+        root.removeHandler(old)
+    root.addHandler(handler)
+    _queue_handler = handler
+    _listener = logging.handlers.QueueListener(log_queue, *_handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def _restart_after_fork():
+    # The listener thread doesn't survive a fork (Celery's prefork pool), so each child starts its own
+    if _listener is not None:
+        _start_listener()
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+
+def setup_logging(log_file=None, level=LOG_LEVEL):
+    """Routes all logging through the non-blocking queue. Later calls only add log_file, if new.
+
+    Args:
+        log_file (str, optional): also write the log to this file.
+        level (str | int): level of the root logger.
+    """
+    formatter = JsonFormatter() if LOG_FORMAT == 'json' else TextFormatter()
+    if _listener is not None:
+        if log_file and not any(getattr(h, 'baseFilename', None) == os.path.abspath(log_file) for h in _handlers):
+            _listener.stop()
+            file_handler = logging.FileHandler(log_file)
+            file_handler.setFormatter(formatter)
+            _handlers.append(file_handler)
+            _start_listener()
+        return
+
+    _handlers.append(logging.StreamHandler())
+    if log_file:
+        _handlers.append(logging.FileHandler(log_file))
+    for handler in _handlers:
+        handler.setFormatter(formatter)
+    logging.getLogger().setLevel(level)
+    _start_listener()
+    atexit.register(_stop_listener)
+    os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def get_dropped_count():
+    """Records dropped because the queue was full, in this process."""
+    return _queue_handler.dropped if _queue_handler is not None else 0
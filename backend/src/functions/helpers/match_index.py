@@ -0,0 +1,166 @@
+import contextvars
+import datetime
+import html
+import logging
+import os
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from .provider import BASE_STOPWORDS, normalize, tokenize
+from .log_pipeline import log_sampled
+from src.db.track_matches import get_track_match, save_track_match
+
+logger = logging.getLogger(__name__)
+
+# Only matches at least this confident (0.7 * title + 0.3 * artist) are shared across users
+MATCH_MIN_CONFIDENCE = 85
+# Stored matches older than this are searched again (and re-verified on success)
+MATCH_MAX_AGE = datetime.timedelta(days=30)
+# Default number of tracks searched at once by match_tracks
+SYNC_MATCH_WORKERS = int(os.getenv("SYNC_MATCH_WORKERS", "8"))
+
+# Stopwords that mark a different recording ('Song (Live)', 'Song - Cover'), so they stay in the fingerprint
+_VERSION_STOPWORDS = {"live", "cover"}
+
+MatchOutcome = namedtuple("MatchOutcome", ["index", "result", "cached", "error"])
+
+
+def track_fingerprint(track_name, artists):
+    """Normalized (title, artist) key, stable across stopwords, casing, punctuation and artist order.
+
+    Version tokens (live, cover, remix, acoustic, ...) are kept, so different recordings of a song
+    don't share a match.
+    """
+    track = normalize(track_name, artists)
+    title_key = " ".join(
+        token for token in tokenize(html.unescape(track_name))
+        if (token not in BASE_STOPWORDS or token in _VERSION_STOPWORDS) and token not in track.artist_tokens
+    ) or " ".join(sorted(track.tokens))
+    return f"{title_key}::{' '.join(sorted(track.artist_tokens))}"
+
+
+def match_confidence(title_score, artist_score):
+    return 0.7 * title_score + 0.3 * artist_score
+
+
+def lookup_match(db, direction, track_name, artists, source_id=None):
+    """Returns a stored match in search_auto's result format, or None if there is no fresh one."""
+    try:
+        match = get_track_match(db, direction, track_fingerprint(track_name, artists), source_id, max_age=MATCH_MAX_AGE)
+    except Exception as e:
+        db.rollback()
+        logger.warning("Lookup failed for '%s' by %s: %s", track_name, artists, e)
+        return None
+
+    if match is None:
+        return None
+    log_sampled(logger, logging.DEBUG, "Hit for '%s' by %s: '%s' by %s", track_name, artists, match.target_title, match.target_artist)
+    return [match.target_id, match.title_score, match.artist_score, match.target_title, match.target_artist]
+
+
+def record_match(db, direction, track_name, artists, source_id, result):
+    """Stores a search_auto result in the shared index if it is confident enough."""
+    target_id, title_score, artist_score, target_title, target_artist = result
+    confidence = match_confidence(title_score, artist_score)
+    if confidence < MATCH_MIN_CONFIDENCE:
+        return
+    try:
+        save_track_match(db, direction, track_fingerprint(track_name, artists), source_id, target_id,
+                         target_title, target_artist, title_score, artist_score, confidence)
+    except Exception as e:
+        db.rollback()
+        logger.warning("Failed to save match for '%s' by %s: %s", track_name, artists, e)
+
+
+def search_auto_indexed(provider, db, direction, track_name, artists, source_id=None):
+    """provider.search_auto with the shared track_matches index checked first and updated after."""
+    result = lookup_match(db, direction, track_name, artists, source_id)
+    if result is not None:
+        return result
+
+    result = provider.search_auto(track_name, artists)
+    if result is not None:
+        record_match(db, direction, track_name, artists, source_id, result)
+    return result
+
+
+def iter_matches(searches, db, tracks, direction=None, workers=None):
+    """Matches many tracks, yielding each one as soon as it resolves.
+
+    Index hits are looked up (and yielded) first on the calling thread; the misses are then searched
+    in parallel and yielded in completion order. Index reads and writes stay on the calling thread.
+
+    Args:
+        searches (dict): {direction: search(track_name, artists, duration_ms) -> search_auto result or None}.
+            Each search must be thread-safe.
+        db (Session): used for index lookups and writes.
+        tracks (list[dict]): playlist items ({'title', 'artist', 'id', 'is_unplayable'}, optionally
+            'duration_ms' and a per-track 'direction').
+        direction (str | None): 'sp_to_yt' or 'yt_to_sp' for tracks without their own 'direction'.
+        workers (int | None): max tracks searched at once (default SYNC_MATCH_WORKERS).
+
+    Yields:
+        MatchOutcome: (index into tracks, search_auto-style result or None, whether it came from the
+        index, the exception raised by the search or None). Unplayable tracks yield a None result.
+    """
+    to_search = []
+    for i, track in enumerate(tracks):
+        if track.get('is_unplayable'):
+            yield MatchOutcome(i, None, False, None)
+            continue
+        track_direction = track.get('direction', direction)
+        result = lookup_match(db, track_direction, track['title'], track['artist'], track.get('id'))
+        if result is None:
+            to_search.append(i)
+        else:
+            yield MatchOutcome(i, result, True, None)
+
+    if not to_search:
+        return
+
+    def search(i):
+        track = tracks[i]
+        return searches[track.get('direction', direction)](track['title'], track['artist'], track.get('duration_ms'))
+
+    workers = max(1, min(workers or SYNC_MATCH_WORKERS, len(to_search)))
+    logger.info("Searching %s of %s tracks with %s workers", len(to_search), len(tracks), workers)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="match") as pool:
+        # Each search runs in a copy of the caller's context, so its log records keep the job's fields
+        futures = {pool.submit(contextvars.copy_context().run, search, i): i for i in to_search}
+        try:
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    yield MatchOutcome(i, None, False, e)
+                    continue
+                if result is not None:
+                    track = tracks[i]
+                    record_match(db, track.get('direction', direction), track['title'], track['artist'], track.get('id'), result)
+                yield MatchOutcome(i, result, False, None)
+        finally:
+            # The consumer stopped early (e.g. a client disconnected): don't start the remaining searches
+            for future in futures:
+                future.cancel()
+
+
+def match_tracks(search, db, direction, tracks, workers=None):
+    """Matches many playlist tracks, searching the index misses in parallel.
+
+    Args:
+        search (callable): search(track_name, artists, duration_ms) -> search_auto result or None;
+            must be thread-safe. duration_ms is None when the playlist item has no duration.
+        db (Session): used for index lookups and writes, which stay on the calling thread.
+        direction (str): 'sp_to_yt' or 'yt_to_sp'.
+        tracks (list[dict]): playlist items ({'title', 'artist', 'id', 'is_unplayable'}, optionally 'duration_ms').
+        workers (int | None): max tracks searched at once (default SYNC_MATCH_WORKERS).
+
+    Returns:
+        list: one search_auto-style result (or None) per track, in the same order. Unplayable tracks get None.
+    """
+    results = [None] * len(tracks)
+    for outcome in iter_matches({direction: search}, db, tracks, direction=direction, workers=workers):
+        if outcome.error is not None:
+            raise outcome.error
+        results[outcome.index] = outcome.result
+    return results
@@ -0,0 +1,138 @@
+"""Stored playlist items (table playlist_members), reused while the playlist's version (YouTube etag
+and itemCount, Spotify snapshot_id) is unchanged. A Spotify playlist that only grew has just its
+tail fetched.
+"""
+import logging
+import os
+from src.db.playlist_members import get_playlist_members, save_playlist_members, add_playlist_members
+
+logger = logging.getLogger(__name__)
+
+# Stored items refetched along with a tail, to check that nothing before it changed
+SNAPSHOT_TAIL_OVERLAP = int(os.getenv("SNAPSHOT_TAIL_OVERLAP", "5"))
+
+
+def playlist_version(platform, playlist):
+    """The version of a playlist as returned by get_playlist_by_name, or None if it doesn't carry one.
+
+    YouTube's etag alone doesn't reliably change when items are added, so the item count is part of it.
+    """
+    if not playlist:
+        return None
+    if platform == 'youtube':
+        if not playlist.get('etag') or playlist.get('itemCount') is None:
+            return None
+        return f"{playlist['etag']}:{playlist['itemCount']}"
+    return playlist.get('snapshot_id')
+
+
+def item_id(track_id):
+    """Platform id of a playlist item; Spotify uris ('spotify:track:<id>') are reduced to the id."""
+    return track_id.rsplit(':', 1)[-1]
+
+
+def playlist_item_count(platform, playlist):
+    """The number of items get_playlist_by_name reported for a playlist, or None."""
+    if not playlist:
+        return None
+    return playlist.get('itemCount') if platform == 'youtube' else playlist.get('track_count')
+
+
+def _stored(item):
+    stored = {
+        'id': item_id(item['id']) if item.get('id') else None,
+        'title': item.get('title') or '',
+        'artist': item.get('artist') or '',
+        'is_unplayable': bool(item.get('is_unplayable')),
+    }
+    if item.get('duration_ms') is not None:
+        stored['duration_ms'] = item['duration_ms']
+    return stored
+
+
+def _fetch_tail(platform, playlist, stored, fetch_tail):
+    """The playlist's items if it only grew past the stored ones, reading just its tail; None otherwise."""
+    count = playlist_item_count(platform, playlist)
+    if fetch_tail is None or count is None or count <= len(stored) or not stored:
+        return None
+    overlap = min(SNAPSHOT_TAIL_OVERLAP, len(stored))
+    offset = len(stored) - overlap
+    tail = fetch_tail(offset) or []
+    if len(tail) != count - offset or [item.get('id') for item in tail[:overlap]] != [item['id'] for item in stored[offset:]]:
+        logger.info("Playlist %s changed before its tail, refetching it.", playlist['id'])
+        return None
+    logger.info("Playlist %s grew by %s items, fetched its tail only.", playlist['id'], count - len(stored))
+    return stored[:offset] + [_stored(item) for item in tail]
+
+
+def cached_playlist_items(db, user_id, platform, playlist, fetch, fetch_tail=None):
+    """A playlist's items from the snapshot store, fetching only what changed since they were stored.
+
+    Args:
+        platform (str): 'youtube' or 'spotify'.
+        playlist (dict): the playlist as returned by get_playlist_by_name (with its etag/snapshot_id).
+        fetch (callable): fetch() -> the playlist's items, as returned by get_playlist_items.
+        fetch_tail (callable, optional): fetch_tail(offset) -> the playlist's items from offset on.
+
+    Returns:
+        list[dict]: the playlist's items ({'title', 'id', 'artist', 'is_unplayable'}).
+    """
+    version = playlist_version(platform, playlist)
+    members = None
+    if version is not None:
+        try:
+            members = get_playlist_members(db, user_id, platform, playlist['id'])
+        except Exception as e:
+            db.rollback()
+            logger.warning("Lookup failed for playlist %s: %s", playlist['id'], e)
+        if members is not None and members.version == version:
+            logger.info("Playlist %s unchanged, using %s stored items.", playlist['id'], len(members.items))
+            return [{'is_unplayable': False, **item} for item in members.items]
+
+    items = None
+    if members is not None and members.version is not None:
+        items = _fetch_tail(platform, playlist, members.items, fetch_tail)
+    if items is None:
+        items = [_stored(item) for item in fetch() or []]
+    try:
+        save_playlist_members(db, user_id, platform, playlist['id'], version, items)
+    except Exception as e:
+        db.rollback()
+        logger.warning("Failed to save playlist %s: %s", playlist['id'], e)
+    return [dict(item) for item in items]
+
+
+def items_to_insert(playlist_id, items, existing):
+    """Drops the items already in a playlist (by platform id) and repeated ones, keeping their order.
+
+    Args:
+        items (list[dict]): {'id', 'title', 'artist'} of the items about to be inserted.
+        existing (list[dict]): the playlist's current items, as returned by get_playlist_items.
+    """
+    present = {item_id(item['id']) for item in existing if item.get('id')}
+    new_items, seen = [], set()
+    for item in items:
+        key = item_id(item['id'])
+        if key in present:
+            logger.debug("'%s' (%s) is already in playlist %s, not inserting it.", item.get('title'), key, playlist_id)
+        elif key not in seen:
+            seen.add(key)
+            new_items.append(item)
+    return new_items
+
+
+def record_inserted(db, user_id, platform, playlist_id, items, version, created=False):
+    """Adds items just inserted into a playlist to the snapshot store, along with the playlist's new version.
+
+    Args:
+        created (bool): the playlist was created for these items, so they are all of its contents.
+    """
+    stored = [_stored(item) for item in items]
+    try:
+        if created:
+            save_playlist_members(db, user_id, platform, playlist_id, version, stored)
+        else:
+            add_playlist_members(db, user_id, platform, playlist_id, stored, version)
+    except Exception as e:
+        db.rollback()
+        logger.warning("Failed to record inserts into playlist %s: %s", playlist_id, e)
@@ -0,0 +1,186 @@
+"""Fuzzy diff of a source playlist against a target one. Each source track is only scored against the
+target tracks sharing one of its rarest title tokens.
+"""
+import bisect
+import html
+from collections import namedtuple
+from .provider import BASE_STOPWORDS, normalize, tokenize, fuzzy_match, fuzzy_match_matrix
+
+# Clean-title score at or above which a target counts as the same song...
+PRESENT_SCORE = 90
+# ...and the score from which a near-miss is reported as ambiguous instead of missing
+AMBIGUOUS_SCORE = 75
+# Artist score (as search_auto scores artists) from which differently written artists count as the same
+SAME_ARTIST_SCORE = 80
+# Tokens per source track used to pick its block of candidates (rarest first)...
+BLOCK_KEYS = 3
+# ...stopping once the block would exceed this many tracks (the rarest token is always used)
+BLOCK_MAX_CANDIDATES = 256
+# Tokens marking a different recording of the same song; a match differing by one is only ambiguous
+VERSION_TOKENS = {
+    "remix", "acoustic", "instrumental", "slowed", "reverb", "sped", "nightcore",
+    "karaoke", "demo", "edit", "extended", "mix", "version", "remastered", "remaster",
+}
+
+# Tokens starting a featured-artist part, which one platform may leave out of the title
+_FEAT_TOKENS = {"feat", "featuring", "ft"}
+
+PlaylistDiff = namedtuple("PlaylistDiff", ["added", "present", "ambiguous"])
+
+
+def _title_keys(track):
+    """Tokens used for blocking: the title's tokens minus stopwords and the artist's own tokens."""
+    keys = {t for t in track.tokens if len(t) > 1 or t.isdigit()} - BASE_STOPWORDS
+    return (keys - track.artist_tokens) or keys
+
+
+def _core_tokens(track):
+    """Title tokens that must agree for two tracks to be the same song: no stopwords, version tokens or feat. part."""
+    tokens = tokenize(html.unescape(track.title))
+    for i, token in enumerate(tokens):
+        if token in _FEAT_TOKENS:
+            tokens = tokens[:i]
+            break
+    return set(tokens) - BASE_STOPWORDS - VERSION_TOKENS
+
+
+class PlaylistIndex:
+    """A playlist's tracks indexed for fuzzy membership checks.
+
+    Args:
+        tracks (list[dict]): playlist items ({'title', 'artist', 'id', ...}) as returned by get_playlist_items.
+    """
+
+    def __init__(self, tracks):
+        self.tracks = [t for t in tracks if not t.get('is_unplayable') and t.get('title')]
+        self.ids = {t['id'] for t in self.tracks if t.get('id')}
+        self._normalized = [normalize(t['title'], t.get('artist') or '') for t in self.tracks]
+        self._artists = [(t.get('artist') or '').lower() for t in self.tracks]
+        self._choices = [track.clean_title or track.lower for track in self._normalized]
+        self._postings = {}  # token -> [track index, ...], shortest title first
+        for i, track in enumerate(self._normalized):
+            for token in _title_keys(track):
+                self._postings.setdefault(token, []).append(i)
+        self._posting_lengths = {}
+        for token, posting in self._postings.items():
+            posting.sort(key=lambda i: len(self._choices[i]))
+            self._posting_lengths[token] = [len(self._choices[i]) for i in posting]
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def _candidates(self, track, query):
+        keys = [k for k in _title_keys(track) if k in self._postings]
+        if not keys:
+            return []
+        keys.sort(key=lambda k: len(self._postings[k]))
+        block = self._postings[keys[0]]
+        if len(block) <= BLOCK_MAX_CANDIDATES:
+            candidates = set(block)
+            for key in keys[1:BLOCK_KEYS]:
+                if len(candidates) + len(self._postings[key]) > BLOCK_MAX_CANDIDATES:
+                    break
+                candidates.update(self._postings[key])
+            return sorted(candidates)
+
+        # Only common tokens (e.g. 'love you'): narrow to the targets sharing the two rarest...
+        lengths = self._posting_lengths[keys[0]]
+        if len(keys) > 1:
+            second = set(self._postings[keys[1]])
+            block = [i for i in block if i in second]
+            lengths = [len(self._choices[i]) for i in block]
+        # ...and if that is still too many, to those closest in length (blocks are length-sorted)
+        if len(block) > BLOCK_MAX_CANDIDATES:
+            middle = bisect.bisect_left(lengths, len(query))
+            start = max(0, min(middle - BLOCK_MAX_CANDIDATES // 2, len(block) - BLOCK_MAX_CANDIDATES))
+            block = block[start:start + BLOCK_MAX_CANDIDATES]
+        return block
+
+    def _same_artist(self, track, artist, i):
+        """True if either side's artist shows up in the other's title or artist, or the artists score as the
+        same in search_auto's artist matching. An unknown artist never counts as the same: the track is searched.
+        """
+        target = self._normalized[i]
+        if not track.artist_tokens or not target.artist_tokens:
+            return False
+        if track.artist_tokens & (target.tokens | target.artist_tokens):
+            return True
+        if target.artist_tokens & track.tokens:
+            return True
+        # e.g. 'drake' in the channel name 'DrakeVEVO'
+        target_text = target.lower + " " + self._artists[i]
+        if any(len(t) > 2 and t in target_text for t in track.artist_tokens):
+            return True
+        return fuzzy_match(self._artists[i], artist.lower()) >= SAME_ARTIST_SCORE
+
+    def lookup(self, title, artist=''):
+        """Classifies a track against the playlist.
+
+        Returns:
+            tuple[str, list[dict]]: ('present', [matching tracks]), ('ambiguous', [near-miss tracks])
+            or ('missing', []).
+        """
+        track = normalize(title, artist or '')
+        query = track.clean_title or track.lower
+        candidates = self._candidates(track, query)
+        if not candidates:
+            return 'missing', []
+
+        # Artist names in the target's title (e.g. 'Artist - Song' on YouTube) are dropped using the
+        # source's artists too, since channel names often don't tokenize to them
+        choices = []
+        for i in candidates:
+            target = self._normalized[i]
+            choice = self._choices[i]
+            if track.artist_tokens & target.tokens:
+                choice = " ".join(t for t in target.clean_title.split() if t not in track.artist_tokens) or choice
+            choices.append(choice)
+        scores = fuzzy_match_matrix([query], choices)[0]
+
+        present, ambiguous = [], []
+        core = _core_tokens(track)
+        for i, score in zip(candidates, scores):
+            if score < AMBIGUOUS_SCORE:
+                continue
+            target = self._normalized[i]
+            # token_set_ratio gives 100 when one title's tokens are a subset of the other's ('Horse' vs
+            # 'Dark Horse'), so the titles must also share the same words, artist names aside
+            artists = track.artist_tokens | target.artist_tokens
+            if (score >= PRESENT_SCORE and not (track.tokens ^ target.tokens) & VERSION_TOKENS
+                    and core - artists == _core_tokens(target) - artists
+                    and self._same_artist(track, artist or '', i)):
+                present.append(self.tracks[i])
+            else:
+                ambiguous.append(self.tracks[i])
+
+        if present:
+            return 'present', present
+        if ambiguous:
+            return 'ambiguous', ambiguous
+        return 'missing', []
+
+    def diff(self, source_tracks):
+        """Splits source_tracks by membership in this playlist, keeping their order.
+
+        Returns:
+            PlaylistDiff: added (tracks not in the playlist, including unplayable ones), present
+            ([(source track, matching playlist track)]) and ambiguous ([(source track, [near-miss tracks])]).
+        """
+        added, present, ambiguous = [], [], []
+        for track in source_tracks:
+            if track.get('is_unplayable') or not track.get('title'):
+                added.append(track)
+                continue
+            status, matches = self.lookup(track['title'], track.get('artist') or '')
+            if status == 'present':
+                present.append((track, matches[0]))
+            elif status == 'ambiguous':
+                ambiguous.append((track, matches))
+            else:
+                added.append(track)
+        return PlaylistDiff(added, present, ambiguous)
+
+
+def diff_playlists(source_tracks, target_tracks):
+    """Returns the PlaylistDiff of source_tracks against target_tracks (see PlaylistIndex.diff)."""
+    return PlaylistIndex(target_tracks).diff(source_tracks)
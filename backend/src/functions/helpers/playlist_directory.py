@@ -0,0 +1,91 @@
+"""Each user's playlists by name, kept in Redis so get_playlist_by_name needn't list them all. An
+entry older than PLAYLIST_DIRECTORY_FRESH_SECONDS, or looked up for a write, is revalidated on its
+own; a name that isn't in the directory triggers a full listing.
+"""
+import json
+import os
+import time
+import redis
+from .redis_client import get_redis, report_redis_error
+
+PLAYLIST_DIRECTORY_FRESH_SECONDS = int(os.getenv("PLAYLIST_DIRECTORY_FRESH_SECONDS", "60"))
+PLAYLIST_DIRECTORY_TTL = int(os.getenv("PLAYLIST_DIRECTORY_TTL", str(24 * 60 * 60)))
+
+_KEY_PREFIX = "syncer:playlists:"
+
+
+def _key(provider, user_id):
+    return f"{_KEY_PREFIX}{provider}:{user_id}"
+
+
+def _on_redis_error(e):
+    report_redis_error(e, source="PlaylistDirectory")
+
+
+def is_fresh(entry):
+    return time.time() - entry.get('checked_at', 0) < PLAYLIST_DIRECTORY_FRESH_SECONDS
+
+
+def get_cached_playlist(provider, user_id, playlist_name):
+    """Returns the directory entry for a playlist name (case-insensitive), or None."""
+    client = get_redis()
+    if client is None:
+        return None
+    try:
+        raw = client.hget(_key(provider, user_id), playlist_name.lower())
+    except redis.RedisError as e:
+        _on_redis_error(e)
+        return None
+    return json.loads(raw) if raw is not None else None
+
+
+def cache_playlist(provider, user_id, entry):
+    """Writes one playlist (a get_playlist_by_name result) through to the directory, as just checked."""
+    client = get_redis()
+    if client is None:
+        return
+    key = _key(provider, user_id)
+    try:
+        pipe = client.pipeline()
+        pipe.hset(key, entry['title'].lower(), json.dumps({**entry, 'checked_at': time.time()}))
+        pipe.expire(key, PLAYLIST_DIRECTORY_TTL)
+        pipe.execute()
+    except redis.RedisError as e:
+        _on_redis_error(e)
+
+
+def save_directory(provider, user_id, entries):
+    """Replaces a user's directory with a full listing; the first playlist wins when names repeat."""
+    client = get_redis()
+    if client is None:
+        return
+    now = time.time()
+    mapping = {}
+    for entry in entries:
+        mapping.setdefault(entry['title'].lower(), json.dumps({**entry, 'checked_at': now}))
+    key = _key(provider, user_id)
+    try:
+        pipe = client.pipeline()
+        pipe.delete(key)
+        if mapping:
+            pipe.hset(key, mapping=mapping)
+            pipe.expire(key, PLAYLIST_DIRECTORY_TTL)
+        pipe.execute()
+    except redis.RedisError as e:
+        _on_redis_error(e)
+
+
+def expire_playlist(provider, user_id, playlist_id):
+    """Marks a playlist's entry stale (e.g. after adding to it), so the next lookup revalidates it."""
+    client = get_redis()
+    if client is None:
+        return
+    key = _key(provider, user_id)
+    try:
+        for name, raw in client.hgetall(key).items():
+            entry = json.loads(raw)
+            if entry.get('id') == playlist_id:
+                entry['checked_at'] = 0
+                client.hset(key, name, json.dumps(entry))
+    except redis.RedisError as e:
+        _on_redis_error(e)
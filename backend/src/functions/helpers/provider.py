@@ -1,5 +1,7 @@
 import re
-from fuzzywuzzy import fuzz
+from functools import lru_cache
+from rapidfuzz import fuzz, process, utils
+import numpy as np
 import html
 
 class Provider:
@@ -34,43 +36,274 @@ BASE_STOPWORDS = {
     "ft", "wshh", "mv", "ver", "lyrics", "live", "album", "cover"
 }
 
+_TOKEN_RE = re.compile(r'\b\w+\b')
+
+# Upper bound on memoized normalizations; a 1k-track sync touches a few thousand distinct titles
+NORMALIZE_CACHE_SIZE = 8192
+
 #%%
 def tokenize(text):
-    return re.findall(r'\b\w+\b', text.lower())
+    return _TOKEN_RE.findall(text.lower())
 
 #%%
-def preprocess_title(title, *artist_groups):
+class NormalizedTrack:
+    """A title (and optional artist names) normalized once for matching and dedup.
+
+    Attributes:
+        title (str): the raw title.
+        lower (str): the lowercased raw title.
+        clean_title (str): the title with stopwords and artist tokens removed (see preprocess_title).
+        tokens (frozenset[str]): every token of the (html-unescaped) title.
+        artist_tokens (frozenset[str]): every token of the artist names.
+        words (frozenset[str]): whitespace-separated words of the lowercased title, parentheses removed.
+        main_title (str | None): the lowercased title before "(feat. ...)", if it has a featured-artist part.
+    """
+    __slots__ = ("title", "lower", "clean_title", "tokens", "artist_tokens", "words", "main_title")
+
+    def __init__(self, title, artist_names=()):
+        title_tokens = tokenize(html.unescape(title))
+        artist_tokens = set()
+        for name in artist_names:
+            artist_tokens.update(tokenize(name))
+
+        self.title = title
+        self.lower = title.lower()
+        self.clean_title = " ".join(
+            token for token in title_tokens if token not in BASE_STOPWORDS and token not in artist_tokens
+        )
+        self.tokens = frozenset(title_tokens)
+        self.artist_tokens = frozenset(artist_tokens)
+        self.words = frozenset(self.lower.replace('(', ' ').replace(')', ' ').split())
+        self.main_title = None
+        if '(' in title and ('feat' in self.lower or 'ft' in self.lower):
+            self.main_title = title.split('(')[0].strip().lower()
+
+    def __repr__(self):
+        return f"NormalizedTrack({self.title!r}, clean_title={self.clean_title!r})"
 
-    title = html.unescape(title)
-    title_tokens = tokenize(title)
 
-    all_artist_tokens = set()
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def _normalize(title, artist_names):
+    return NormalizedTrack(title, artist_names)
+
+
+def normalize(title, *artist_groups):
+    """Returns the memoized NormalizedTrack for a title.
+
+    Args:
+        title (str): a track or video title.
+        *artist_groups (str | list[str]): artist names whose tokens are stripped from clean_title.
+    """
+    artist_names = []
     for group in artist_groups:
         if isinstance(group, str):
-            all_artist_tokens |= set(tokenize(group))
+            artist_names.append(group)
         elif isinstance(group, list):
-            for item in group:
-                all_artist_tokens |= set(tokenize(item))
-    
-    all_stopwords = BASE_STOPWORDS | all_artist_tokens
-    filtered = [token for token in title_tokens if token not in all_stopwords]
-    return " ".join(filtered)
+            artist_names.extend(group)
+    return _normalize(title, tuple(artist_names))
 
 #%%
-def fuzzy_match(str1, str2, override_threshold=90):
-    ratio = fuzz.ratio(str1, str2)
-    partial_ratio = fuzz.partial_ratio(str1, str2)
-    token_set_ratio = fuzz.token_set_ratio(str1, str2)
+def preprocess_title(title, *artist_groups):
+    return normalize(title, *artist_groups).clean_title
 
+#%%
+def fuzzy_match(str1, str2, override_threshold=90):
+    token_set_ratio = round(fuzz.token_set_ratio(str1, str2, processor=utils.default_process))
     if token_set_ratio >= override_threshold:
         return 100
+    ratio = round(fuzz.ratio(str1, str2))
+    partial_ratio = round(fuzz.partial_ratio(str1, str2))
     return int(0.2 * ratio + 0.2 * partial_ratio + 0.6 * token_set_ratio)
 
 
+def _combine(ratio, partial_ratio, token_set_ratio, override_threshold):
+    """fuzzy_match's weighting, on arrays of its three (unrounded) scores."""
+    ratio, partial_ratio, token_set_ratio = np.rint(ratio), np.rint(partial_ratio), np.rint(token_set_ratio)
+    scores = np.trunc(0.2 * ratio + 0.2 * partial_ratio + 0.6 * token_set_ratio)
+    scores[token_set_ratio >= override_threshold] = 100
+    return scores
+
+
+#%%
+def fuzzy_match_matrix(queries, choices, override_threshold=90):
+    """fuzzy_match over every (query, choice) pair, each scorer run over the whole matrix by rapidfuzz's cdist.
+
+    Returns:
+        np.ndarray: a len(queries) x len(choices) array where [i, j] == fuzzy_match(queries[i], choices[j]).
+    """
+    if not queries or not choices:
+        return np.zeros((len(queries), len(choices)))
+    return _combine(
+        process.cdist(queries, choices, scorer=fuzz.ratio, dtype=np.float64),
+        process.cdist(queries, choices, scorer=fuzz.partial_ratio, dtype=np.float64),
+        process.cdist(queries, choices, scorer=fuzz.token_set_ratio, processor=utils.default_process, dtype=np.float64),
+        override_threshold,
+    )
+
+
+def fuzzy_match_pairs(strings1, strings2, override_threshold=90):
+    """fuzzy_match of each strings1[i] with strings2[i] only, scored in one pass by rapidfuzz's cpdist.
+
+    Returns:
+        np.ndarray: len(strings1) scores where [i] == fuzzy_match(strings1[i], strings2[i]).
+    """
+    if not strings1:
+        return np.zeros(0)
+    return _combine(
+        process.cpdist(strings1, strings2, scorer=fuzz.ratio, dtype=np.float64),
+        process.cpdist(strings1, strings2, scorer=fuzz.partial_ratio, dtype=np.float64),
+        process.cpdist(strings1, strings2, scorer=fuzz.token_set_ratio, processor=utils.default_process, dtype=np.float64),
+        override_threshold,
+    )
+
+
+class CandidateScorer:
+    """Collects the title/artist comparisons for every search candidate and scores them in one pass.
+
+    Each candidate's title score is the max over its title comparisons, and likewise for artists,
+    so the ranking is identical to calling fuzzy_match pair by pair. Fuzzy comparisons are deferred
+    and only the distinct pairs are computed, together, with fuzzy_match_pairs (each once, however
+    often the scores are read); fixed scores (e.g. substring hits) are recorded as-is.
+    """
+
+    def __init__(self):
+        self.candidates = []
+        self._fuzzy = {"title": [], "artist": []}  # [(candidate index, str1, str2), ...]
+        self._fixed = {"title": [], "artist": []}  # [(candidate index, score), ...]
+        self._pair_scores = {}  # (str1, str2) -> fuzzy_match(str1, str2)
+
+    def __len__(self):
+        return len(self.candidates)
+
+    def add_candidate(self, candidate):
+        """Registers a candidate and returns its index for the scoring calls below."""
+        self.candidates.append(candidate)
+        return len(self.candidates) - 1
+
+    def title_match(self, idx, str1, str2):
+        """Scores the candidate's title with fuzzy_match(str1, str2)."""
+        self._fuzzy["title"].append((idx, str1, str2))
+
+    def title_score(self, idx, score):
+        self._fixed["title"].append((idx, score))
+
+    def artist_match(self, idx, str1, str2):
+        """Scores the candidate's artist with fuzzy_match(str1, str2)."""
+        self._fuzzy["artist"].append((idx, str1, str2))
+
+    def artist_score(self, idx, score):
+        self._fixed["artist"].append((idx, score))
+
+    def _max_scores(self, kind):
+        best = np.zeros(len(self.candidates))
+        pairs = self._fuzzy[kind]
+        if pairs:
+            new_pairs = list(dict.fromkeys((a, b) for _, a, b in pairs if (a, b) not in self._pair_scores))
+            if new_pairs:
+                scores = fuzzy_match_pairs([a for a, _ in new_pairs], [b for _, b in new_pairs])
+                self._pair_scores.update(zip(new_pairs, scores.tolist()))
+            idx = np.fromiter((i for i, _, _ in pairs), dtype=np.intp, count=len(pairs))
+            values = np.fromiter((self._pair_scores[(a, b)] for _, a, b in pairs), dtype=np.float64, count=len(pairs))
+            np.maximum.at(best, idx, values)
+
+        for i, score in self._fixed[kind]:
+            best[i] = max(best[i], score)
+        return best
+
+    def scores(self):
+        """Returns (title_scores, artist_scores) arrays, one entry per candidate in registration order."""
+        return self._max_scores("title"), self._max_scores("artist")
+
+    def best_index(self):
+        """Returns (index, title_score, artist_score) for the best 0.7/0.3 weighted total, or None.
+
+        Ties go to the earliest candidate, and a candidate scoring 0 overall never wins.
+        """
+        if not self.candidates:
+            return None
+
+        title_scores, artist_scores = self.scores()
+        totals = 0.7 * title_scores + 0.3 * artist_scores
+
+        winner = int(np.argmax(totals))
+        if totals[winner] <= 0:
+            return None
+        return winner, title_scores[winner].item(), artist_scores[winner].item()
+
+    def best(self):
+        """Returns (candidate, title_score, artist_score) for the best candidate (see best_index), or None."""
+        scored = self.best_index()
+        if scored is None:
+            return None
+        winner, title_score, artist_score = scored
+        return self.candidates[winner], title_score, artist_score
+
+
+#%%
+# Blocking pre-filter (see CandidateFilter)
+PREFILTER_MIN_JACCARD = 0.1  # min token-set Jaccard between query and candidate (title + artists)
+PREFILTER_MAX_LENGTH_RATIO = 5  # candidate titles this many times longer than the query are dropped...
+PREFILTER_MIN_LENGTH_LIMIT = 60  # ...once longer than this many characters
+PREFILTER_DURATION_SLACK = 120  # seconds; see CandidateFilter.accepts
+
+
+def duration_seconds(value):
+    """Parses a 'm:ss' / 'h:mm:ss' duration (as returned by VideosSearch) into seconds, or None."""
+    if not value or not isinstance(value, str):
+        return None
+    seconds = 0
+    try:
+        for part in value.split(':'):
+            seconds = seconds * 60 + int(part)
+    except ValueError:
+        return None
+    return seconds
+
+
+class CandidateFilter:
+    """Cheap blocking stage run before the fuzzy scoring, built once per query.
+
+    Drops candidates sharing almost no tokens with the query (Jaccard over title and artist
+    tokens, BASE_STOPWORDS removed), with implausibly long titles (compilations, tracklists),
+    or, when both durations are known, whose length differs by more than the query's own
+    length (and PREFILTER_DURATION_SLACK), e.g. hour-long loops and mixes.
+
+    Args:
+        title (str): the query track title.
+        artists (str | list[str]): the query artist names.
+        duration (float | None): the query duration in seconds, if known.
+    """
+
+    def __init__(self, title, artists=(), duration=None, min_jaccard=PREFILTER_MIN_JACCARD):
+        track = normalize(title, artists)
+        self.tokens = (track.tokens | track.artist_tokens) - BASE_STOPWORDS
+        self.max_length = max(PREFILTER_MIN_LENGTH_LIMIT,
+                              PREFILTER_MAX_LENGTH_RATIO * (len(title) + sum(len(t) for t in track.artist_tokens)))
+        self.duration = duration
+        self.min_jaccard = min_jaccard
+
+    def jaccard(self, title, artists=()):
+        track = normalize(title, artists)
+        tokens = (track.tokens | track.artist_tokens) - BASE_STOPWORDS
+        union = len(self.tokens | tokens)
+        return len(self.tokens & tokens) / union if union else 0.0
+
+    def accepts(self, title, artists=(), duration=None):
+        """True if the candidate is worth fuzzy scoring."""
+        if not self.tokens:
+            return True  # nothing to block on (e.g. a title made only of stopwords)
+        if len(title) > self.max_length:
+            return False
+        if self.duration and duration:
+            if abs(duration - self.duration) > max(PREFILTER_DURATION_SLACK, self.duration):
+                return False
+        return self.jaccard(title, artists) >= self.min_jaccard
+
+
 #%%
 def is_match(sp_title, sp_artists, yt_title, yt_artists, threshold=85):
-    clean_sp = preprocess_title(sp_title, sp_artists)
-    clean_yt = preprocess_title(yt_title, yt_artists)
+    clean_sp = normalize(sp_title, sp_artists).clean_title
+    clean_yt = normalize(yt_title, yt_artists).clean_title
 
     score = fuzzy_match(clean_sp, clean_yt)
 
@@ -0,0 +1,167 @@
+"""Orders search_auto's query variants by their observed yield (counted in Redis) and stops querying
+once a candidate clears the early-exit bar.
+"""
+import os
+import time
+import redis
+from .redis_client import get_redis, report_redis_error
+
+EARLY_EXIT_TITLE_SCORE = float(os.getenv("SEARCH_EARLY_EXIT_TITLE", "95"))
+EARLY_EXIT_ARTIST_SCORE = float(os.getenv("SEARCH_EARLY_EXIT_ARTIST", "80"))
+PLANNER_MIN_SAMPLES = int(os.getenv("SEARCH_PLANNER_MIN_SAMPLES", "100"))
+_STATS_REFRESH_SECONDS = 600
+
+_KEY_PREFIX = "syncer:planner:"
+
+# {provider: (fetched_at, {variant: yield_rate})}
+_yield_rates = {}
+
+
+def _read_stats(provider):
+    client = get_redis()
+    if client is None:
+        return {}
+    try:
+        raw = client.hgetall(_KEY_PREFIX + provider)
+    except redis.RedisError as e:
+        report_redis_error(e, source="QueryPlanner")
+        return {}
+    return {field.decode(): int(count) for field, count in raw.items()}
+
+
+def _get_yield_rates(provider):
+    fetched_at, rates = _yield_rates.get(provider, (0.0, None))
+    if rates is not None and time.monotonic() - fetched_at < _STATS_REFRESH_SECONDS:
+        return rates
+
+    stats = _read_stats(provider)
+    rates = {}
+    for field, runs in stats.items():
+        variant, kind = field.rsplit(":", 1)
+        if kind == "runs" and runs >= PLANNER_MIN_SAMPLES:
+            rates[variant] = stats.get(f"{variant}:yields", 0) / runs
+    _yield_rates[provider] = (time.monotonic(), rates)
+    return rates
+
+
+def get_planner_stats(provider):
+    """Returns {variant: {'runs', 'yields', 'wins'}} plus search/early-exit totals for a provider."""
+    stats = _read_stats(provider)
+    variants = {}
+    totals = {}
+    for field, count in stats.items():
+        name, _, kind = field.rpartition(":")
+        if name:
+            variants.setdefault(name, {"runs": 0, "yields": 0, "wins": 0})[kind] = count
+        else:
+            totals[kind] = count
+    return {"variants": variants, **totals}
+
+
+class QueryPlanner:
+    """Runs a search_auto's query variants in waves, stopping early on a confident candidate.
+
+    Args:
+        provider (str): 'youtube' or 'spotify', used to keep per-provider stats.
+        variants (list[tuple[str, str]]): (variant name, query) in search_auto's default order.
+            Variants whose query duplicates an earlier one are dropped.
+    """
+
+    def __init__(self, provider, variants, title_bar=None, artist_bar=None):
+        self.provider = provider
+        self.title_bar = EARLY_EXIT_TITLE_SCORE if title_bar is None else title_bar
+        self.artist_bar = EARLY_EXIT_ARTIST_SCORE if artist_bar is None else artist_bar
+
+        seen_queries = set()
+        self.variants = []
+        for name, query in variants:
+            if query not in seen_queries:
+                seen_queries.add(query)
+                self.variants.append((name, query))
+
+    def ordered_variants(self):
+        """Variants by observed yield rate (best first); variants without enough samples keep their place."""
+        rates = _get_yield_rates(self.provider)
+        if not rates:
+            return list(self.variants)
+        default_rank = {name: i for i, (name, _) in enumerate(self.variants)}
+        mean_rate = sum(rates.values()) / len(rates)
+        return sorted(self.variants, key=lambda v: (-rates.get(v[0], mean_rate), default_rank[v[0]]))
+
+    def run(self, fetch, add_results, scorer, pool=None):
+        """Issues queries until a candidate clears the early-exit bar or every variant has run.
+
+        Args:
+            fetch (callable): fetch(query) -> list of raw results, or None on failure.
+            add_results (callable): registers a batch of raw results with scorer.
+            scorer (CandidateScorer): accumulates candidates across batches.
+            pool (Executor | None): if given, everything after the first query is issued concurrently
+                on it (its batches are still scored in plan order); otherwise queries run one at a time.
+
+        Returns:
+            tuple | None: scorer.best() over every candidate seen.
+        """
+        plan = self.ordered_variants()
+        if pool is None:
+            waves = [[variant] for variant in plan]
+        else:
+            waves = [plan[:1], plan[1:]]
+
+        runs, yields = [], []
+        sources = []  # variant name per candidate, aligned with scorer.candidates
+        early_exit = False
+
+        for wave in waves:
+            if not wave:
+                continue
+            queries = [query for _, query in wave]
+            batches = pool.map(fetch, queries) if pool is not None and len(wave) > 1 else map(fetch, queries)
+
+            for (name, _), batch in zip(wave, batches):
+                runs.append(name)
+                if batch is None:
+                    continue
+                first_new = len(scorer)
+                add_results(batch)
+                sources.extend([name] * (len(scorer) - first_new))
+                if len(scorer) == first_new:
+                    continue
+
+                title_scores, artist_scores = scorer.scores()
+                confident = (title_scores >= self.title_bar) & (artist_scores >= self.artist_bar)
+                if confident[first_new:].any():
+                    yields.append(name)
+                if confident.any():
+                    early_exit = True
+                    break
+            if early_exit:
+                break
+
+        scored = scorer.best_index()
+        winner = sources[scored[0]] if scored is not None else None
+        self._record(runs, yields, winner, early_exit)
+
+        if scored is None:
+            return None
+        idx, title_score, artist_score = scored
+        return scorer.candidates[idx], title_score, artist_score
+
+    def _record(self, runs, yields, winner, early_exit):
+        client = get_redis()
+        if client is None:
+            return
+        key = _KEY_PREFIX + self.provider
+        try:
+            pipe = client.pipeline()
+            pipe.hincrby(key, "searches", 1)
+            if early_exit:
+                pipe.hincrby(key, "early_exits", 1)
+            for name in runs:
+                pipe.hincrby(key, f"{name}:runs", 1)
+            for name in yields:
+                pipe.hincrby(key, f"{name}:yields", 1)
+            if winner is not None:
+                pipe.hincrby(key, f"{winner}:wins", 1)
+            pipe.execute()
+        except redis.RedisError as e:
+            report_redis_error(e, source="QueryPlanner")
@@ -0,0 +1,276 @@
+"""Rate limits for provider calls, shared by every process through Redis: a token bucket per endpoint
+class, a block on everyone when a call is throttled, and AIMD concurrency per process.
+"""
+import datetime
+import email.utils
+import logging
+import os
+import random
+import threading
+import time
+import redis
+from .redis_client import get_redis, report_redis_error
+
+logger = logging.getLogger(__name__)
+
+# Retries of a throttled call before the error is raised
+RATE_LIMIT_MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "4"))
+# Longest a call waits for the bucket or a backoff; beyond this it fails with RateLimitedError
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "60"))
+# Backoff after a throttled call without Retry-After, doubled per retry
+RATE_LIMIT_BASE_BACKOFF = float(os.getenv("RATE_LIMIT_BASE_BACKOFF", "1"))
+# Most in-flight calls per process and endpoint class (the AIMD limit's ceiling)
+RATE_LIMIT_MAX_CONCURRENCY = int(os.getenv("RATE_LIMIT_MAX_CONCURRENCY", "16"))
+
+_KEY_PREFIX = "syncer:ratelimit:"
+
+# Takes `tokens` from the bucket (going into debt if needed) and returns the seconds to wait for them,
+# or, while the endpoint is blocked, the seconds left of the block without taking anything
+_ACQUIRE_SCRIPT = """
+local blocked = redis.call('PTTL', KEYS[2])
+if blocked > 0 then
+    return {0, tostring(blocked / 1000)}
+end
+local rate, burst, tokens = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local available = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+available = math.min(burst, available + math.max(0, now - ts) * rate) - tokens
+redis.call('HSET', KEYS[1], 'tokens', tostring(available), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 60)
+if available >= 0 then
+    return {1, '0'}
+end
+return {1, tostring(-available / rate)}
+"""
+
+# Blocks the endpoint for ARGV[1] milliseconds, unless it already is for longer
+_BLOCK_SCRIPT = """
+if redis.call('PTTL', KEYS[1]) < tonumber(ARGV[1]) then
+    redis.call('SET', KEYS[1], '1', 'PX', ARGV[1])
+end
+return 1
+"""
+
+_scripts = None  # (client, acquire, block) registered on the current Redis client
+
+
+def _get_scripts(client):
+    global _scripts
+    if _scripts is None or _scripts[0] is not client:
+        _scripts = (client, client.register_script(_ACQUIRE_SCRIPT), client.register_script(_BLOCK_SCRIPT))
+    return _scripts
+
+
+class RateLimiter:
+    """Spaces calls to at most `rate` per second across every thread in the process.
+
+    Use as a context manager (or call acquire()) right before the outbound request.
+    A rate of 0 or less disables limiting.
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or an HTTP date); 0 if absent or unreadable."""
+    if not value:
+        return 0.0
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return 0.0
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, (when - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+
+class RateLimitedError(Exception):
+    """A provider asked us to wait longer than RATE_LIMIT_MAX_WAIT seconds."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdaptiveConcurrency:
+    """In-process cap on in-flight calls, adjusted by additive increase / multiplicative decrease."""
+
+    def __init__(self, max_limit: int, min_limit: int = 1):
+        self.max_limit = max(min_limit, max_limit)
+        self.min_limit = min_limit
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, throttled=False):
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.min_limit, self.limit / 2)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+
+class ProviderLimiter:
+    """Shared token bucket, backoff and AIMD concurrency for one provider's endpoint class.
+
+    Args:
+        provider (str): 'youtube' or 'spotify'.
+        endpoint (str): the endpoint class, e.g. 'read', 'write' or 'search'.
+        rate (float): calls per second across every process; 0 or less disables the bucket.
+        burst (float): most calls let through at once after a quiet period (defaults to rate).
+    """
+
+    def __init__(self, provider: str, endpoint: str, rate: float, burst: float | None = None,
+                 max_concurrency: int = RATE_LIMIT_MAX_CONCURRENCY):
+        self.name = f"{provider}:{endpoint}"
+        self.rate = rate
+        self.burst = max(1.0, burst if burst is not None else rate)
+        self.concurrency = AdaptiveConcurrency(max_concurrency)
+        self._bucket_key = f"{_KEY_PREFIX}{self.name}"
+        self._blocked_key = f"{_KEY_PREFIX}{self.name}:blocked"
+        self._local = RateLimiter(rate)
+        self._local_blocked_until = 0.0
+        self.throttled = 0
+
+    def _redis_wait(self, tokens):
+        """(took tokens, seconds to wait) from the shared bucket, or None without Redis."""
+        client = get_redis()
+        if client is None:
+            return None
+        try:
+            took, wait = _get_scripts(client)[1](
+                keys=[self._bucket_key, self._blocked_key], args=[self.rate, self.burst, tokens])
+        except redis.RedisError as e:
+            report_redis_error(e, source="RateLimit")
+            return None
+        return bool(took), float(wait)
+
+    def _sleep(self, wait):
+        if wait > RATE_LIMIT_MAX_WAIT:
+            raise RateLimitedError(f"{self.name} is rate limited for another {wait:.0f}s", wait)
+        if wait > 0:
+            time.sleep(wait)
+
+    def acquire(self, tokens=1):
+        """Waits until `tokens` calls may go out, then takes a concurrency slot (free it with release())."""
+        while True:
+            self._sleep(self._local_blocked_until - time.monotonic())
+            if self.rate <= 0:
+                break
+            result = self._redis_wait(tokens)
+            if result is None:
+                for _ in range(tokens):
+                    self._local.acquire()
+                break
+            took, wait = result
+            self._sleep(wait)
+            if took:
+                break
+        self.concurrency.acquire()
+
+    def release(self, throttled=False, retry_after=None):
+        """Frees the slot taken by acquire(); a throttled call also blocks the endpoint for retry_after seconds."""
+        self.concurrency.release(throttled)
+        if throttled:
+            self.throttled += 1
+            self.block(retry_after or RATE_LIMIT_BASE_BACKOFF)
+
+    def block(self, seconds):
+        """Holds back every process's calls to this endpoint class for `seconds`."""
+        logger.warning("%s throttled, backing off for %.1fs.", self.name, seconds)
+        self._local_blocked_until = max(self._local_blocked_until, time.monotonic() + seconds)
+        client = get_redis()
+        if client is None:
+            return
+        try:
+            _get_scripts(client)[2](keys=[self._blocked_key], args=[max(1, int(seconds * 1000))])
+        except redis.RedisError as e:
+            report_redis_error(e, source="RateLimit")
+
+    def call(self, fn, throttle_delay, tokens=1):
+        """Runs fn() within the limits, retrying it while the provider throttles it.
+
+        Args:
+            fn (callable): makes the outbound call.
+            throttle_delay (callable): throttle_delay(exception) -> None if the exception isn't a
+                throttling error, else the seconds the provider asked us to wait (0 if it didn't say).
+        """
+        for attempt in range(RATE_LIMIT_MAX_RETRIES + 1):
+            self.acquire(tokens)
+            try:
+                result = fn()
+            except Exception as e:
+                delay = throttle_delay(e)
+                if delay is None:
+                    self.release()
+                    raise
+                backoff = delay or RATE_LIMIT_BASE_BACKOFF * 2 ** attempt * (1 + random.random() / 2)
+                self.release(throttled=True, retry_after=backoff)
+                if attempt == RATE_LIMIT_MAX_RETRIES or backoff > RATE_LIMIT_MAX_WAIT:
+                    raise
+                continue
+            self.release()
+            return result
+
+    def stats(self):
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "concurrency_limit": int(self.concurrency.limit),
+            "in_flight": self.concurrency.in_flight,
+            "throttled": self.throttled,
+        }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(provider, endpoint, rate, burst=None):
+    """The process's ProviderLimiter for a provider's endpoint class, created with `rate` on first use."""
+    with _limiters_lock:
+        limiter = _limiters.get((provider, endpoint))
+        if limiter is None:
+            limiter = _limiters[(provider, endpoint)] = ProviderLimiter(provider, endpoint, rate, burst)
+        return limiter
+
+
+def get_rate_limit_stats():
+    """Configuration and AIMD state of every limiter this process has used."""
+    with _limiters_lock:
+        return {limiter.name: limiter.stats() for limiter in _limiters.values()}
@@ -0,0 +1,31 @@
+import logging
+import os
+import time
+import redis
+
+logger = logging.getLogger(__name__)
+
+# Same Redis as Celery (see celery_worker.py), shared by the API server and every worker
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# After a Redis error, callers bypass Redis for this many seconds instead of timing out on every call
+_RETRY_AFTER_FAILURE = 30
+
+_client = None
+_disabled_until = 0.0
+
+
+def get_redis():
+    """Returns the shared Redis client, or None while Redis is considered unavailable."""
+    global _client
+    if time.monotonic() < _disabled_until:
+        return None
+    if _client is None:
+        _client = redis.Redis.from_url(REDIS_URL, socket_connect_timeout=0.5, socket_timeout=0.5)
+    return _client
+
+
+def report_redis_error(e, source="Redis"):
+    """Marks Redis unavailable for a short cool-down after a redis.RedisError."""
+    global _disabled_until
+    _disabled_until = time.monotonic() + _RETRY_AFTER_FAILURE
+    logger.warning("[%s] Redis unavailable, bypassing it for %ss: %s", source, _RETRY_AFTER_FAILURE, e)
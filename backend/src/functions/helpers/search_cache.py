@@ -0,0 +1,103 @@
+"""Redis cache of raw VideosSearch and Spotify search responses, shared by the API server and the
+workers. Bypassed while Redis is unreachable.
+"""
+import hashlib
+import json
+import os
+import time
+import redis
+from .redis_client import get_redis, report_redis_error
+
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", str(6 * 60 * 60)))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "50000"))
+
+_KEY_PREFIX = "syncer:search:"
+_INDEX_KEY = _KEY_PREFIX + "lru"
+_STATS_KEY = _KEY_PREFIX + "stats"
+
+
+def _on_redis_error(e):
+    report_redis_error(e, source="SearchCache")
+
+
+def cache_key(provider, query, limit):
+    normalized_query = " ".join(query.lower().split())
+    digest = hashlib.sha1(normalized_query.encode("utf-8")).hexdigest()
+    return f"{_KEY_PREFIX}{provider}:{limit}:{digest}"
+
+
+def _store(client, key, value):
+    now = time.time()
+    pipe = client.pipeline()
+    pipe.set(key, json.dumps(value), ex=SEARCH_CACHE_TTL)
+    pipe.zadd(_INDEX_KEY, {key: now})
+    pipe.zremrangebyscore(_INDEX_KEY, "-inf", now - SEARCH_CACHE_TTL)  # already expired
+    pipe.zcard(_INDEX_KEY)
+    size = pipe.execute()[-1]
+
+    overflow = size - SEARCH_CACHE_MAX_ENTRIES
+    if overflow > 0:
+        evicted = [k for k, _ in client.zpopmin(_INDEX_KEY, overflow)]
+        if evicted:
+            client.delete(*evicted)
+
+
+def cached_search(provider, query, limit, fetch):
+    """Returns the cached candidate list for (provider, query, limit), or calls fetch() and caches it.
+
+    Args:
+        provider (str): 'youtube' or 'spotify'.
+        query (str): the search query as sent to the provider.
+        limit (int): the result limit sent to the provider.
+        fetch (callable): performs the real search; returns a JSON-serializable list, or None on failure.
+
+    Returns:
+        list | None: the candidate list, or None if the search failed (failures are never cached).
+    """
+    client = get_redis()
+    key = cache_key(provider, query, limit)
+
+    if client is not None:
+        try:
+            cached = client.get(key)
+            if cached is not None:
+                pipe = client.pipeline()
+                pipe.zadd(_INDEX_KEY, {key: time.time()})
+                pipe.hincrby(_STATS_KEY, f"{provider}:hits", 1)
+                pipe.execute()
+                return json.loads(cached)
+            client.hincrby(_STATS_KEY, f"{provider}:misses", 1)
+        except redis.RedisError as e:
+            _on_redis_error(e)
+            client = None
+
+    result = fetch()
+
+    if result is not None and client is not None:
+        try:
+            _store(client, key, result)
+        except redis.RedisError as e:
+            _on_redis_error(e)
+    return result
+
+
+def get_search_cache_stats():
+    """Returns hit/miss counts per provider (across every process sharing the cache) and the cache size."""
+    client = get_redis()
+    if client is None:
+        return {}
+    try:
+        raw = client.hgetall(_STATS_KEY)
+        size = client.zcard(_INDEX_KEY)
+    except redis.RedisError as e:
+        _on_redis_error(e)
+        return {}
+
+    stats = {}
+    for field, count in raw.items():
+        provider, kind = field.decode().rsplit(":", 1)
+        stats.setdefault(provider, {"hits": 0, "misses": 0})[kind] = int(count)
+    for counts in stats.values():
+        total = counts["hits"] + counts["misses"]
+        counts["hit_rate"] = round(counts["hits"] / total, 3) if total else 0.0
+    return {"providers": stats, "entries": size, "max_entries": SEARCH_CACHE_MAX_ENTRIES}
@@ -2,19 +2,122 @@ import spotipy
 from spotipy.oauth2 import SpotifyOAuth, SpotifyOauthError
 
 from .provider import Provider
-from .provider import tokenize, preprocess_title, fuzzy_match, is_match
+from .provider import tokenize, preprocess_title, normalize, fuzzy_match, is_match, CandidateScorer, CandidateFilter
 
 import os
 from dotenv import load_dotenv
 from .spotify_db_cache import DatabaseCacheHandler
+from .rate_limit import get_limiter, parse_retry_after
+from .search_cache import cached_search
+from .query_planner import QueryPlanner
+from .cassette import install_cassette
+from .auth_cache import is_auth_valid, record_auth_valid, invalidate_auth
+from .playlist_directory import get_cached_playlist, cache_playlist, save_directory, expire_playlist, is_fresh
+from .membership_index import cached_playlist_items
 from src.db.spotify_token import get_spotify_token
+from .log_pipeline import log_sampled
 import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 load_dotenv()
+install_cassette()
+logger = logging.getLogger(__name__)
 
 sp_client_id = os.getenv("SP_CLIENT_ID")
 sp_client_secret = os.getenv("SP_CLIENT_SECRET")
 
+# Spotify Web API calls per second across every process: searches, other reads, and writes (0 disables)
+SP_SEARCH_RATE = float(os.getenv("SP_SEARCH_RATE", "10"))
+SP_API_READ_RATE = float(os.getenv("SP_API_READ_RATE", "10"))
+SP_API_WRITE_RATE = float(os.getenv("SP_API_WRITE_RATE", "5"))
+# Tracks per playlist_add_items call in add_to_playlist (Spotify takes at most 100)
+SP_ADD_CHUNK_SIZE = max(1, min(100, int(os.getenv("SP_ADD_CHUNK_SIZE", "100"))))
+# Most chunks add_to_playlist writes at once...
+SP_ADD_CONCURRENCY = int(os.getenv("SP_ADD_CONCURRENCY", "4"))
+# ...starting from this many, doubled after every round that went in cleanly
+SP_ADD_INITIAL_CONCURRENCY = int(os.getenv("SP_ADD_INITIAL_CONCURRENCY", "2"))
+# Tries per chunk before add_to_playlist gives up on it (position conflicts aren't counted), and the first backoff
+SP_ADD_MAX_ATTEMPTS = int(os.getenv("SP_ADD_MAX_ATTEMPTS", "5"))
+SP_ADD_BACKOFF = float(os.getenv("SP_ADD_BACKOFF", "1.0"))
+# Add failures worth retrying (rate limits left over by the limiter, server errors); errors without an
+# HTTP status are not, as the chunk may well have gone in
+_RETRYABLE_ADD_STATUSES = {429, 500, 502, 503, 504}
+# Partial response for playlist items: only what iter_playlist_items reads
+_PLAYLIST_ITEMS_FIELDS = "next,items(track(id,name,duration_ms,artists(name)))"
+
+def _compact_track(track):
+    """Keeps only the search fields matching and manual search use, so cached entries stay small."""
+    if not track or not isinstance(track, dict):
+        return track
+    album = track.get('album') or {}
+    return {
+        'id': track.get('id'),
+        'uri': track.get('uri'),
+        'name': track.get('name'),
+        'artists': [{'name': artist.get('name')} for artist in (track.get('artists') or []) if artist],
+        'duration_ms': track.get('duration_ms'),
+        'album': {'images': (album.get('images') or [])[:1]},
+    }
+
+
+def _playlist_entry(pl):
+    """A Spotify playlist object in get_playlist_by_name's format."""
+    return {
+        'title': pl['name'],
+        'id': pl['id'],
+        'description': pl.get('description', ''),
+        'image': pl['images'][0]['url'] if pl.get('images') else 'No Image',
+        'snapshot_id': pl.get('snapshot_id'),
+        'track_count': (pl.get('tracks') or {}).get('total', 0),
+    }
+
+
+def _api_limiter(method, url):
+    """The shared rate limiter for a Web API call, by endpoint class."""
+    # spotipy passes the path relative to its API prefix ('search'), or a full URL when paging
+    path = url.split('?')[0].rsplit('/v1/', 1)[-1]
+    if path.lstrip('/').startswith('search'):
+        return get_limiter('spotify', 'search', SP_SEARCH_RATE)
+    if method == 'GET':
+        return get_limiter('spotify', 'read', SP_API_READ_RATE)
+    return get_limiter('spotify', 'write', SP_API_WRITE_RATE)
+
+
+def _is_position_error(e):
+    """True for a 400 refusing an insert position past the end of the playlist."""
+    message = str(getattr(e, 'msg', '') or e).lower()
+    return getattr(e, 'http_status', None) == 400 and ('index' in message or 'position' in message)
+
+
+def _throttle_delay(e):
+    """For a 429, the seconds its Retry-After asks for (0 if none); else None."""
+    if isinstance(e, spotipy.exceptions.SpotifyException) and e.http_status == 429:
+        return parse_retry_after((e.headers or {}).get('Retry-After'))
+    return None
+
+
+class _UserSpotify(spotipy.Spotify):
+    """spotipy client whose calls go through the shared rate limiter, and that forgets its user's
+    cached auth state when Spotify rejects the token."""
+
+    def __init__(self, user_id, **kwargs):
+        # 429s are left to the rate limiter (which shares Retry-After with every process) rather than retried here
+        super().__init__(status_forcelist=(500, 502, 503, 504), **kwargs)
+        self.user_id = user_id
+
+    def _internal_call(self, method, url, payload, params):
+        try:
+            return _api_limiter(method, url).call(
+                lambda: spotipy.Spotify._internal_call(self, method, url, payload, params), _throttle_delay)
+        except spotipy.exceptions.SpotifyException as e:
+            if e.http_status in (401, 403):
+                logger.warning("Spotify rejected the token of user %s (%s).", self.user_id, e.http_status)
+                invalidate_auth('spotify', self.user_id)
+            raise
+
+
 class SpotifyProvider(Provider):
     def __init__(self, user_id: str):
         self.user_id = user_id
@@ -27,15 +130,16 @@ class SpotifyProvider(Provider):
         if is_render:
             # If deployed, use the deployed URL (add this environment variable on Render)
             self.redirect_uri = os.environ.get("SPOTIFY_REDIRECT_URI", "https://syncer-26vh.onrender.com/callback")
-            print(f"Running in deployed mode, using redirect URI: {self.redirect_uri}")
+            logger.debug("Running in deployed mode, using redirect URI: %s", self.redirect_uri)
         else:
             # Locally, use localhost
             self.redirect_uri = "http://localhost:3000/callback"
-            print(f"Running in local mode, using redirect URI: {self.redirect_uri}")
+            logger.debug("Running in local mode, using redirect URI: %s", self.redirect_uri)
 
         self.scope = "playlist-modify-private playlist-modify-public playlist-read-private playlist-read-collaborative"
 
         self.sp = None  # Will be set after authentication
+        self.token_info = None
 
     def get_auth_manager(self):
         """Return a SpotifyOAuth object configured to use the database cache handler."""
@@ -57,47 +161,74 @@ class SpotifyProvider(Provider):
         token_info = auth_manager.get_access_token(code, as_dict=True)
         if not token_info:
             raise SpotifyOauthError("Failed to obtain Spotify token from callback.")
-        self.sp = spotipy.Spotify(auth_manager=auth_manager)
+        self.sp = _UserSpotify(self.user_id, auth_manager=auth_manager)
+        self.token_info = token_info
+        record_auth_valid('spotify', self.user_id, token_info.get('expires_at'))
         return token_info
 
     def ensure_client(self):
         if self.sp is not None:
             return self.sp
         auth_manager = self.get_auth_manager()
-        if auth_manager.validate_token(auth_manager.cache_handler.get_cached_token()):
-            self.sp = spotipy.Spotify(auth_manager=auth_manager)
+        token_info = auth_manager.validate_token(auth_manager.cache_handler.get_cached_token())
+        if token_info:
+            self.sp = _UserSpotify(self.user_id, auth_manager=auth_manager)
+            self.token_info = token_info
             return self.sp
         else:
             raise SpotifyOauthError("No valid Spotify token found. User must authenticate.")
 
-    def search_auto(self, track_name, artists) -> list:
-        """algorithmically processes track_name and artists from YouTube to search for equivalent Spotify track."""
+    def _search_tracks(self, query, limit=10):
+        """Runs one Spotify track search (through the shared search cache), returning its items or None."""
+        def fetch():
+            results = self.sp.search(q=query, limit=limit, type='track')
+            if not results or 'tracks' not in results or not results['tracks'] or 'items' not in results['tracks']:
+                return None
+            items = results['tracks']['items']
+            if not isinstance(items, list):
+                return None
+            return [_compact_track(track) for track in items]
+
+        return cached_search("spotify", query, limit, fetch)
+
+    def search_auto(self, track_name, artists, duration_ms=None) -> list:
+        """algorithmically processes track_name and artists from YouTube to search for equivalent Spotify track.
+
+        duration_ms (the video's length, if known) lets the pre-filter drop implausible candidates.
+        """
         self.ensure_client()
         
-        # Try multiple search strategies
-        search_queries = [
-            f"{track_name} {artists}",
-            f"{preprocess_title(track_name)} {artists}",
-            f"{track_name}",  # Sometimes artist in title is enough
+        # Try multiple search strategies (the planner may reorder them by observed yield)
+        search_variants = [
+            ("title_artist", f"{track_name} {artists}"),
+            ("clean_title_artist", f"{normalize(track_name).clean_title} {artists}"),
+            ("title", f"{track_name}"),  # Sometimes artist in title is enough
         ]
         
-        best_match = ["", 0, 0, "", ""]  # [uri, title_score, artist_score, title, artists]
-        all_tracks_found = []
+        scorer = CandidateScorer()
+        seen_uris = set()
+
+        # Loop-invariant forms of the YouTube side
+        yt_track = normalize(track_name)
+        track_lower = yt_track.lower
+        artists_lower = artists.lower()
+        candidate_filter = CandidateFilter(track_name, artists, duration_ms / 1000 if duration_ms else None)
         
-        for query in search_queries:
+        def fetch(query):
             try:
-                results = self.sp.search(q=query, limit=10, type='track')
-                if not results or 'tracks' not in results or not results['tracks'] or 'items' not in results['tracks']:
-                    print(f"Spotify search returned no usable result for query: {query}")
-                    continue
-                items = results['tracks']['items']
+                items = self._search_tracks(query, limit=10)
+                if items is None:
+                    logger.debug("Spotify search returned no usable result for query: %s", query)
+                    return None
                 if not items or not isinstance(items, list):
-                    print(f"Spotify search returned empty or malformed items for query: {query}")
-                    continue
+                    logger.debug("Spotify search returned empty or malformed items for query: %s", query)
+                    return None
+                return items
             except Exception as e:
-                print(f"An exception occurred during Spotify search for query '{query}': {e}")
-                continue
+                logger.warning("An exception occurred during Spotify search for query '%s': %s", query, e)
+                return None
 
+        def add_results(items):
             for track in items:
                 if not track or not isinstance(track, dict):
                     continue
@@ -110,60 +241,56 @@ class SpotifyProvider(Provider):
                 if not sp_artist_names:
                     continue
                 # Skip if we've already seen this track
-                if track.get('uri') in [t[0] for t in all_tracks_found]:
+                if track.get('uri') in seen_uris:
+                    continue
+                seen_uris.add(track.get('uri'))
+                # Obvious non-matches skip the fuzzy scoring entirely
+                duration = track.get('duration_ms')
+                if not candidate_filter.accepts(sp_track_title, sp_artist_names, duration / 1000 if duration else None):
                     continue
+                idx = scorer.add_candidate([track.get('uri'), sp_track_title, sp_artists_str])
+                sp_track = normalize(sp_track_title)
                 # Multiple scoring approaches for title
-                title_scores = []
                 # Direct fuzzy match
-                title_scores.append(fuzzy_match(sp_track_title.lower(), track_name.lower()))
+                scorer.title_match(idx, sp_track.lower, track_lower)
                 # Clean title match (without feat/ft parts)
-                clean_sp_title = preprocess_title(sp_track_title)
-                clean_yt_title = preprocess_title(track_name)
-                title_scores.append(fuzzy_match(clean_sp_title, clean_yt_title))
+                scorer.title_match(idx, sp_track.clean_title, yt_track.clean_title)
                 # Handle featured artists in track names
-                if '(' in track_name and ('feat' in track_name.lower() or 'ft' in track_name.lower()):
-                    main_title = track_name.split('(')[0].strip()
-                    title_scores.append(fuzzy_match(sp_track_title.lower(), main_title.lower()))
+                if yt_track.main_title is not None:
+                    scorer.title_match(idx, sp_track.lower, yt_track.main_title)
                 # Check if track titles contain similar words
-                sp_words = set(sp_track_title.lower().replace('(', ' ').replace(')', ' ').split())
-                yt_words = set(track_name.lower().replace('(', ' ').replace(')', ' ').split())
-                common_words = sp_words & yt_words
+                common_words = sp_track.words & yt_track.words
                 if len(common_words) > 0:
-                    word_score = (len(common_words) / max(len(sp_words), len(yt_words))) * 100
-                    title_scores.append(word_score)
-                title_score = max(title_scores) if title_scores else 0
+                    scorer.title_score(idx, (len(common_words) / max(len(sp_track.words), len(yt_track.words))) * 100)
                 # Artist matching with multiple approaches
-                artist_scores = []
                 # Direct artist name matching
                 for sp_artist in sp_artist_names:
-                    artist_scores.append(fuzzy_match(sp_artist.lower(), artists.lower()))
+                    sp_artist_lower = sp_artist.lower()
+                    scorer.artist_match(idx, sp_artist_lower, artists_lower)
                     # Check if artist name appears in YouTube title
-                    if sp_artist.lower() in track_name.lower():
-                        artist_scores.append(85)
+                    if sp_artist_lower in track_lower:
+                        scorer.artist_score(idx, 85)
                     # Check individual words of artist names
-                    for artist_word in sp_artist.lower().split():
-                        if len(artist_word) > 2 and artist_word in artists.lower():
-                            artist_scores.append(75)
+                    for artist_word in sp_artist_lower.split():
+                        if len(artist_word) > 2 and artist_word in artists_lower:
+                            scorer.artist_score(idx, 75)
                 # Check if any part of the artist string matches
-                artist_scores.append(fuzzy_match(sp_artists_str.lower(), artists.lower()))
-                artist_score = max(artist_scores) if artist_scores else 0
-                # Calculate total score
-                total_score = 0.7 * title_score + 0.3 * artist_score
-                # Store all tracks
-                all_tracks_found.append((track.get('uri'), title_score, artist_score, sp_track_title, sp_artists_str, total_score))
-                # Update best match
-                best_total_score = 0.7 * best_match[1] + 0.3 * best_match[2]
-                if total_score > best_total_score:
-                    best_match = [track.get('uri'), title_score, artist_score, sp_track_title, sp_artists_str]
+                scorer.artist_match(idx, sp_artists_str.lower(), artists_lower)
+        # Score each batch as it arrives and stop once a candidate is confident
+        best_match = ["", 0, 0, "", ""]  # [uri, title_score, artist_score, title, artists]
+        scored = QueryPlanner("spotify", search_variants).run(fetch, add_results, scorer)
+        if scored is not None:
+            (uri, sp_track_title, sp_artists_str), title_score, artist_score = scored
+            best_match = [uri, title_score, artist_score, sp_track_title, sp_artists_str]
         # Check thresholds
         if best_match[1] >= 60 and best_match[2] >= 40:
-            print(f"✓ Final match: '{best_match[3]}' by {best_match[4]}")
+            log_sampled(logger, logging.DEBUG, "✓ Final match: '%s' by %s", best_match[3], best_match[4])
             return best_match
         elif best_match[1] >= 80:
-            print(f"✓ High title match: '{best_match[3]}' by {best_match[4]}")
+            log_sampled(logger, logging.DEBUG, "✓ High title match: '%s' by %s", best_match[3], best_match[4])
             return best_match
         else:
-            print("✗ No suitable match found.")
+            log_sampled(logger, logging.DEBUG, "✗ No suitable match found.")
             return None
         
 
@@ -174,11 +301,11 @@ class SpotifyProvider(Provider):
         self.ensure_client()
         
         query = f"{track_name} {artists}"
-        results = self.sp.search(q=query, limit=10, type='track')
+        items = self._search_tracks(query, limit=10)
         
         search_results = []
-        if results['tracks']['items']:
-            for track in results['tracks']['items']:
+        if items:
+            for track in items:
                 search_results.append({
                     'sp_id': track['id'],
                     'title': track['name'],
@@ -207,101 +334,234 @@ class SpotifyProvider(Provider):
         for pl in playlists['items']]
     
 
-    def get_playlist_by_name(self, playlist_name):
-        """given a Spotify playlist name, return the playlist's information."""
+    def get_playlist_by_name(self, playlist_name, revalidate=False):
+        """given a Spotify playlist name, return the playlist's information.
+
+        Served from the user's playlist directory cache when possible (see playlist_directory).
+
+        Args:
+            revalidate (bool): check a cached entry against Spotify even if it is fresh, for callers
+                that write based on its track count or snapshot_id.
+        """
         self.ensure_client()
+
+        cached = get_cached_playlist('spotify', self.user_id, playlist_name)
+        if cached is not None:
+            if is_fresh(cached) and not revalidate:
+                return cached
+            playlist = self._revalidate_playlist(cached)
+            if playlist is not None and playlist['title'].lower() == playlist_name.lower():
+                return playlist
         
+        # List every page, so the other playlists' lookups are served from the directory too
+        entries = []
         playlists = self.sp.current_user_playlists()
         while playlists:
-            for pl in playlists['items']:
-                if pl['name'].lower() == playlist_name.lower():  # Case-insensitive comparison
-                    return {
-                        'title': pl['name'],
-                        'id': pl['id'],
-                        'description': pl.get('description', ''),
-                        'image': pl['images'][0]['url'] if pl.get('images') else 'No Image',
-                    }
+            entries.extend(_playlist_entry(pl) for pl in playlists['items'] if pl)
             if playlists['next']:
                 playlists = self.sp.next(playlists)
             else:
                 playlists = None
+        save_directory('spotify', self.user_id, entries)
+
+        for entry in entries:
+            if entry['title'].lower() == playlist_name.lower():  # Case-insensitive comparison
+                return entry
         return None  # Return None if playlist not found
+
+
+    def _revalidate_playlist(self, entry):
+        """Re-reads one cached playlist's name and snapshot_id; None if it's gone or unreadable."""
+        try:
+            pl = self.sp.playlist(entry['id'], fields="id,name,description,images,snapshot_id,tracks.total")
+        except spotipy.exceptions.SpotifyException as e:
+            logger.warning("Failed to revalidate playlist %s: %s", entry['id'], e)
+            return None
+        if not pl:
+            return None
+        playlist = _playlist_entry(pl)
+        if playlist['snapshot_id'] != entry.get('snapshot_id'):
+            logger.info("Playlist %s changed (snapshot %s).", entry['id'], playlist['snapshot_id'])
+        cache_playlist('spotify', self.user_id, playlist)
+        return playlist
     
 
     def get_playlist_track_count(self, playlist_name):
         """given a Spotify playlist name, return the number of tracks."""
-        self.ensure_client()
-        
-        playlists = self.sp.current_user_playlists()
-        while playlists:
-            for pl in playlists['items']:
-                if pl['name'].lower() == playlist_name.lower():
-                    return pl['tracks']['total']
-            if playlists['next']:
-                playlists = self.sp.next(playlists)
-            else:
-                playlists = None
-        return None
+        playlist = self.get_playlist_by_name(playlist_name)
+        return playlist['track_count'] if playlist else None
 
 
-    def get_playlist_items(self, playlist_id) -> list:
+    def iter_playlist_items(self, playlist_id, offset=0):
         """
-        Given a playlist id, returns a list of all tracks in it, handling pagination.
+        Given a playlist id, yields its tracks one page at a time, starting at offset.
+
+        Pages are as large as the API allows (100), episodes are skipped by the API, and the fields
+        mask keeps each response to the track id, name, artists and duration.
         """
         self.ensure_client()
         
-        results = self.sp.playlist_items(playlist_id)
-        tracks = []
+        results = self.sp.playlist_items(playlist_id, fields=_PLAYLIST_ITEMS_FIELDS, limit=100, offset=offset,
+                                         additional_types=('track',))
         
         while results:
             for item in results['items']:
-                # Handle cases where track metadata is missing (e.g., deleted songs)
-                if item and item['track'] and item['track']['id']:
+                # Handle cases where track metadata is missing (e.g., deleted songs or local files)
+                if item and item['track'] and item['track'].get('id'):
                     track_info = item['track']
                     artists = track_info.get('artists', [])
                     artist_names = [artist['name'] for artist in artists if artist and artist.get('name')]
 
-                    tracks.append({
+                    yield {
                         'title': track_info.get('name', 'Untitled Track'),
                         'id': track_info['id'],
                         'artist': ', '.join(artist_names),
+                        'duration_ms': track_info.get('duration_ms'),
                         'is_unplayable': False
-                    })
+                    }
                 else:
-                    tracks.append({
+                    yield {
                         'title': 'Unplayable/Deleted Song',
                         'id': None,
                         'artist': 'N/A',
                         'is_unplayable': True
-                    })
+                    }
             # Check for next page
             if results['next']:
                 results = self.sp.next(results)
             else:
                 results = None
-        
-        return tracks
 
 
-    def add_to_playlist(self, playlist_id, track_uri) -> None:
-        """add a list of songs (through uri) to a Spotify playlist.
+    def get_playlist_items(self, playlist_id, db=None, playlist=None) -> list:
+        """
+        Given a playlist id, returns a list of all tracks in it, handling pagination.
+
+        With db and the playlist as returned by get_playlist_by_name, the tracks come from the
+        snapshot store while its snapshot_id is unchanged, and only the tracks past the stored
+        ones are fetched when the playlist just grew.
+        """
+        if db is None or playlist is None:
+            return list(self.iter_playlist_items(playlist_id))
+        return cached_playlist_items(db, self.user_id, 'spotify', playlist,
+                                     lambda: list(self.iter_playlist_items(playlist_id)),
+                                     lambda offset: list(self.iter_playlist_items(playlist_id, offset=offset)))
+
+
+    def add_to_playlist(self, playlist_id, track_uri, start_position=None) -> list:
+        """add a list of songs (through uri) to a Spotify playlist, keeping their order.
+
+        Spotify takes at most 100 tracks per call, so the tracks go out in chunks of SP_ADD_CHUNK_SIZE,
+        each carrying the position its first track belongs at. Several chunks are written at once;
+        Spotify may apply them in any order and refuses a position past the current end of the
+        playlist, so rounds start at SP_ADD_INITIAL_CONCURRENCY chunks, double (up to
+        SP_ADD_CONCURRENCY) after a clean round and halve after one with position conflicts. Refused
+        chunks go out again in the next round; other failures are retried with exponential backoff,
+        and a chunk Spotify rejects as invalid is split to isolate the tracks at fault. Only rate limits
+        and server errors are retried. Empty ids (tracks that are unavailable on Spotify) are skipped.
 
         Args:
             playlist_id (str): the playlist id corresponding to the playlist to add songs to.
             track_uri (list[str]): a list of Spotify track uris to add to the playlist.
+            start_position (int | None): how many tracks the playlist already has; looked up if not given.
 
         Returns:
-            None: only mutates the playlist.
+            list[dict]: {'id', 'inserted', 'position', 'snapshot_id', 'error'} for each track, in track_uri
+            order; snapshot_id is the playlist's snapshot after the track's chunk went in.
         """
         self.ensure_client()
-        
+        results = [{'id': uri, 'inserted': False, 'position': None, 'snapshot_id': None,
+                    'error': None if uri else 'missing track id'} for uri in track_uri]
+        # A None id would go out as an invalid uri and fail its whole chunk
+        to_add = [i for i, uri in enumerate(track_uri) if uri]
+        if not to_add:
+            return results
+        if start_position is None:
+            start_position = self._get_track_count(playlist_id)
+        use_positions = start_position is not None
+        concurrency = max(1, min(SP_ADD_INITIAL_CONCURRENCY, SP_ADD_CONCURRENCY))
+        pending = [to_add[i:i + SP_ADD_CHUNK_SIZE] for i in range(0, len(to_add), SP_ADD_CHUNK_SIZE)]
+        attempts = {}  # first track of a chunk -> failed tries
+
+        def write(chunk, position):
+            try:
+                response = self.sp.playlist_add_items(playlist_id, [track_uri[i] for i in chunk], position=position)
+                return (response or {}).get('snapshot_id'), None
+            except Exception as e:
+                return None, e
+
+        with ThreadPoolExecutor(max_workers=max(1, SP_ADD_CONCURRENCY), thread_name_prefix="sp-add") as executor:
+            while pending:
+                # Without positions only one chunk at a time keeps the order
+                chunks = pending[:concurrency if use_positions else 1]
+                in_round = {i for chunk in chunks for i in chunk}
+                # A chunk's position counts the tracks before it that are already in or go out with it
+                positions = {}
+                for chunk in chunks:
+                    positions[chunk[0]] = (start_position or 0) + sum(
+                        1 for i in range(chunk[0]) if results[i]['inserted'] or i in in_round)
+                outcomes = list(executor.map(
+                    lambda chunk: write(chunk, positions[chunk[0]] if use_positions else None), chunks))
+
+                retry, conflicts, failures, backoff = [], 0, 0, 0
+                for chunk, (snapshot_id, e) in zip(chunks, outcomes):
+                    if e is None:
+                        for offset, i in enumerate(chunk):
+                            results[i].update(inserted=True, snapshot_id=snapshot_id, error=None,
+                                              position=positions[chunk[0]] + offset if use_positions else None)
+                        continue
+                    failures += 1
+                    for i in chunk:
+                        results[i]['error'] = str(e)
+                    status = getattr(e, 'http_status', None)
+                    if status in (401, 403):
+                        # The token was rejected (the auth cache has dropped it); nothing else will go in
+                        logger.warning("Spotify rejected the tracks added to playlist %s: %s", playlist_id, e)
+                        for other in pending:
+                            for i in other:
+                                results[i]['error'] = results[i]['error'] or str(e)
+                        expire_playlist('spotify', self.user_id, playlist_id)
+                        return results
+                    if use_positions and _is_position_error(e):
+                        conflicts += 1
+                        retry.append(chunk)
+                        continue
+                    if status == 400 and len(chunk) > 1:
+                        # Some track in the chunk is invalid; halves go in (or fail) on their own
+                        half = len(chunk) // 2
+                        retry.extend([chunk[:half], chunk[half:]])
+                        continue
+                    attempts[chunk[0]] = attempts.get(chunk[0], 0) + 1
+                    if attempts[chunk[0]] < SP_ADD_MAX_ATTEMPTS and status in _RETRYABLE_ADD_STATUSES:
+                        retry.append(chunk)
+                        backoff = max(backoff, attempts[chunk[0]])
+                    else:
+                        logger.warning("Giving up on adding %s tracks to playlist %s: %s", len(chunk), playlist_id, e)
+
+                if conflicts:
+                    if len(chunks) == 1:
+                        # Even a lone chunk's position was refused (the track count was stale), so append instead
+                        use_positions = False
+                    concurrency = max(1, concurrency // 2)
+                elif not failures:
+                    concurrency = min(max(1, SP_ADD_CONCURRENCY), concurrency * 2)
+                if backoff:
+                    time.sleep(SP_ADD_BACKOFF * 2 ** (backoff - 1))
+                pending = sorted(retry + pending[len(chunks):])
+
+        inserted = sum(result['inserted'] for result in results)
+        logger.info("Added %s of %s tracks to playlist %s", inserted, len(to_add), playlist_id)
+        # Its snapshot and track count have changed
+        expire_playlist('spotify', self.user_id, playlist_id)
+        return results
+
+    def _get_track_count(self, playlist_id):
+        """How many tracks a playlist has (None if it can't be read)."""
         try:
-            self.sp.playlist_add_items(playlist_id, track_uri)
-            print('sigma')
-            return True
-        except spotipy.exceptions.SpotifyException as e:
-            print('ligma')
-            return False
+            return self.sp.playlist(playlist_id, fields="tracks.total")['tracks']['total']
+        except Exception as e:
+            logger.warning("Failed to get the track count of playlist %s: %s", playlist_id, e)
+            return None
     
 
     def create_playlist(self, playlist_name):
@@ -320,18 +580,37 @@ class SpotifyProvider(Provider):
             name=playlist_name, public=True, 
             description="made with SYNCER!"
         )
-        print(f"Created Spotify playlist: {playlist['name']} (ID: {playlist['id']})")
+        logger.info("Created Spotify playlist: %s (ID: %s)", playlist['name'], playlist['id'])
+        cache_playlist('spotify', self.user_id, _playlist_entry(playlist))
         return playlist['id']
     
 
+def verify_spotify_client(provider):
+    """Makes sure provider's token works, calling sp.me() only if the auth cache has no recent success.
+
+    Returns:
+        bool: True if the token is (recently known to be) accepted by Spotify.
+    """
+    if is_auth_valid('spotify', provider.user_id):
+        logger.debug("Using cached Spotify auth state for user_id: %s", provider.user_id)
+        return True
+    user_profile = provider.sp.me()
+    if user_profile and 'id' in user_profile:
+        logger.debug("Successfully verified Spotify token for user_id: %s. User: %s", provider.user_id, user_profile['display_name'])
+        record_auth_valid('spotify', provider.user_id, (provider.token_info or {}).get('expires_at'))
+        return True
+    return False
+
+
 def is_spotify_authenticated(user_id):
     """
     Checks if a user is authenticated with Spotify by attempting to create a
     client and make a simple API call. This is more reliable than just checking
     for a token in the database, as it also verifies the token is still valid
-    and refreshes it if necessary.
+    and refreshes it if necessary. A recent successful check (shared through the
+    auth cache) is trusted instead of making the call again.
     """
-    print(f"[SpotifyAuthCheck] Checking Spotify auth status for user_id: {user_id}")
+    logger.debug("Checking Spotify auth status for user_id: %s", user_id)
     try:
         # Attempt to create a SpotifyProvider, which will try to get a valid token
         sp_provider = SpotifyProvider(user_id)
@@ -339,24 +618,21 @@ def is_spotify_authenticated(user_id):
         # The ensure_client method will try to validate/refresh the token and get a client
         sp_provider.ensure_client()
         
-        # Make a simple, low-cost API call to verify authentication
+        # Make a simple, low-cost API call to verify authentication (unless recently done)
         # sp.me() is a good choice as it just gets the current user's profile
-        user_profile = sp_provider.sp.me()
-        
-        if user_profile and 'id' in user_profile:
-            print(f"[SpotifyAuthCheck] Successfully verified Spotify token for user_id: {user_id}. User: {user_profile['display_name']}")
+        if verify_spotify_client(sp_provider):
             return True
         else:
-            print(f"[SpotifyAuthCheck] Token for user_id: {user_id} seems valid but failed to fetch profile.")
+            logger.warning("Token for user_id: %s seems valid but failed to fetch profile.", user_id)
             return False
             
     except SpotifyOauthError as e:
         # This error is specifically for auth problems
-        print(f"[SpotifyAuthCheck] Spotify auth error for user_id {user_id}: {e}")
+        logger.warning("Spotify auth error for user_id %s: %s", user_id, e)
         return False
     except Exception as e:
         # Catch any other exceptions during the process
-        print(f"[SpotifyAuthCheck] An unexpected error occurred while checking Spotify auth for user_id {user_id}: {e}")
+        logger.error("An unexpected error occurred while checking Spotify auth for user_id %s: %s", user_id, e)
         return False
 
 
@@ -365,15 +641,16 @@ def get_spotify_client(user_id: str) -> spotipy.Spotify | None:
     Returns an authenticated spotipy client for a given user_id.
     Returns None if authentication fails.
     """
-    print(f"[get_spotify_client] Getting client for user_id: {user_id}")
+    logger.debug("Getting client for user_id: %s", user_id)
     try:
         provider = SpotifyProvider(user_id)
         client = provider.ensure_client()
-        # A simple call to verify the client is working.
-        client.me()
-        print(f"[get_spotify_client] Successfully got client for user_id: {user_id}")
+        # A simple call to verify the client is working (skipped if recently verified).
+        if not verify_spotify_client(provider):
+            raise SpotifyOauthError("Spotify did not return the user's profile.")
+        logger.debug("Successfully got client for user_id: %s", user_id)
         return client
     except (SpotifyOauthError, Exception) as e:
-        print(f"[get_spotify_client] Failed to get client for user_id {user_id}: {e}")
+        logger.warning("Failed to get client for user_id %s: %s", user_id, e)
         return None
 
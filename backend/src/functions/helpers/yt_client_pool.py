@@ -0,0 +1,291 @@
+"""Per-process pool of users' YouTube credentials and API clients, built from the bundled discovery
+document. Requests go through the shared rate limiter; invalidating a user reaches every process
+through a version in Redis.
+"""
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+import redis
+from google.auth.credentials import AnonymousCredentials
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
+from .auth_cache import invalidate_auth
+from .rate_limit import get_limiter, parse_retry_after
+from .redis_client import get_redis, report_redis_error
+
+logger = logging.getLogger(__name__)
+
+YT_CLIENT_POOL_SIZE = int(os.getenv("YT_CLIENT_POOL_SIZE", "256"))
+YT_CLIENT_EXPIRY_MARGIN = int(os.getenv("YT_CLIENT_EXPIRY_MARGIN", "120"))
+YT_CLIENT_MAX_AGE = int(os.getenv("YT_CLIENT_MAX_AGE", "3600"))
+# Seconds a user's credentials version read from Redis is trusted before get() reads it again
+YT_CLIENT_VERSION_CHECK_SECONDS = float(os.getenv("YT_CLIENT_VERSION_CHECK_SECONDS", "5"))
+# Data API calls per second across every process: search.list, other reads, and writes (0 disables)
+YT_API_SEARCH_RATE = float(os.getenv("YT_API_SEARCH_RATE", "2"))
+YT_API_READ_RATE = float(os.getenv("YT_API_READ_RATE", "10"))
+YT_API_WRITE_RATE = float(os.getenv("YT_API_WRITE_RATE", "10"))
+# Writes let through at once after a quiet period, so a full insert batch needn't wait
+YT_API_WRITE_BURST = float(os.getenv("YT_API_WRITE_BURST", "50"))
+
+# 403 reasons that mean "slow down" rather than "not allowed"
+_RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+
+_VERSION_KEY_PREFIX = "syncer:ytclient:"
+
+_discovery_document = None
+_discovery_lock = threading.Lock()
+
+
+def _fill_in(resource, description):
+    """Instantiates every nested resource, so build_from_document has filled in all of the document's methods."""
+    for name, nested in description.get("resources", {}).items():
+        _fill_in(getattr(resource, name)(), nested)
+
+
+def get_discovery_document():
+    """The parsed YouTube Data API v3 discovery document bundled with the client library, shared by every build.
+
+    build_from_document adds parameters to the method descriptions of the dict it is given as their resources
+    are first built. That is done here once, for every resource, so later builds only read the document (or
+    write back the values already there) and can share it across threads.
+    """
+    global _discovery_document
+    if _discovery_document is None:
+        with _discovery_lock:
+            if _discovery_document is None:
+                document = get_static_doc("youtube", "v3")
+                if document is None:
+                    raise RuntimeError("google-api-python-client has no bundled discovery document for youtube v3")
+                document = json.loads(document)
+                _fill_in(build_from_document(document, credentials=AnonymousCredentials()), document)
+                _discovery_document = document
+    return _discovery_document
+
+
+def _error_content(e):
+    content = getattr(e, 'content', b'') or b''
+    if isinstance(content, bytes):
+        content = content.decode('utf-8', 'replace')
+    return content
+
+
+def is_auth_error(e):
+    """True for a 401, or a 403 that isn't about quota or rate limits."""
+    status = getattr(getattr(e, 'resp', None), 'status', None)
+    if status == 401:
+        return True
+    if status != 403:
+        return False
+    content = _error_content(e)
+    return not any(reason in content for reason in ('quotaExceeded',) + _RATE_LIMIT_REASONS)
+
+
+def throttle_delay(e):
+    """For a 429 or a 403 rateLimitExceeded, the seconds its Retry-After asks for (0 if none); else None."""
+    resp = getattr(e, 'resp', None)
+    status = getattr(resp, 'status', None)
+    if status == 429 or (status == 403 and any(reason in _error_content(e) for reason in _RATE_LIMIT_REASONS)):
+        return parse_retry_after(resp.get('retry-after'))
+    return None
+
+
+def api_limiter(method_id):
+    """The shared rate limiter for a Data API method (e.g. 'youtube.playlistItems.insert')."""
+    if method_id == 'youtube.search.list':
+        return get_limiter('youtube', 'search', YT_API_SEARCH_RATE)
+    if method_id and method_id.endswith('.list'):
+        return get_limiter('youtube', 'read', YT_API_READ_RATE)
+    return get_limiter('youtube', 'write', YT_API_WRITE_RATE, YT_API_WRITE_BURST)
+
+
+class _UserRequest(HttpRequest):
+    """HttpRequest that goes through the rate limiter and forgets its user's credentials when the API rejects them."""
+    user_id = None
+
+    def execute(self, *args, **kwargs):
+        try:
+            return api_limiter(self.methodId).call(lambda: HttpRequest.execute(self, *args, **kwargs), throttle_delay)
+        except HttpError as e:
+            if self.user_id is not None and is_auth_error(e):
+                logger.warning("YouTube rejected the token of user %s (%s), dropping it.", self.user_id, e.resp.status)
+                invalidate_client(self.user_id)
+                invalidate_auth('youtube', self.user_id)
+            raise
+
+
+def build_youtube(credentials, user_id=None):
+    """Builds a YouTube API client without fetching or re-reading the discovery document."""
+    def request_builder(*args, **kwargs):
+        request = _UserRequest(*args, **kwargs)
+        request.user_id = user_id  # kept by list_next, which copies the request
+        return request
+
+    return build_from_document(get_discovery_document(), credentials=credentials, requestBuilder=request_builder)
+
+
+class _PoolEntry:
+    def __init__(self, credentials, expires_at, version):
+        self.credentials = credentials
+        self.expires_at = expires_at
+        self.version = version
+        self.clients = threading.local()
+
+
+class ClientPool:
+    """Per-user LRU pool of YouTube credentials and their (per-thread) API clients.
+
+    Args:
+        max_size (int): users kept; the least recently used is dropped beyond this.
+        expiry_margin (float): seconds before the access token's expiry at which an entry is dropped.
+        max_age (float): longest an entry is kept, for credentials without an expiry.
+        version_check_interval (float): seconds get() trusts the last version read from Redis, so an
+            invalidation from another process takes up to this long to reach this one.
+    """
+
+    def __init__(self, max_size=YT_CLIENT_POOL_SIZE, expiry_margin=YT_CLIENT_EXPIRY_MARGIN, max_age=YT_CLIENT_MAX_AGE,
+                 version_check_interval=YT_CLIENT_VERSION_CHECK_SECONDS):
+        self.max_size = max_size
+        self.expiry_margin = expiry_margin
+        self.max_age = max_age
+        self.version_check_interval = version_check_interval
+        self._entries = OrderedDict()  # user_id -> _PoolEntry, least recently used first
+        self._versions = {}  # user_id -> (checked_at, version), the last version read from Redis
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _ttl(self, credentials):
+        ttl = self.max_age
+        if credentials.expiry is not None:
+            # google-auth keeps expiry as a naive UTC datetime
+            expires_in = (credentials.expiry - datetime.datetime.utcnow()).total_seconds()
+            ttl = min(ttl, expires_in - self.expiry_margin)
+        return ttl
+
+    def version(self, user_id):
+        """The user's credentials version shared by every process (0 if never bumped), or None without Redis.
+
+        Read it before loading the credentials that are then put(), so a token saved in between isn't missed.
+        """
+        client = get_redis()
+        if client is None:
+            return None
+        try:
+            return int(client.get(f"{_VERSION_KEY_PREFIX}{user_id}") or 0)
+        except redis.RedisError as e:
+            report_redis_error(e, source="ClientPool")
+            return None
+
+    def _recent_version(self, user_id):
+        """version(user_id), or the last one read if that was less than version_check_interval ago."""
+        with self._lock:
+            checked_at, version = self._versions.get(user_id, (None, None))
+        if checked_at is not None and time.monotonic() - checked_at < self.version_check_interval:
+            return version
+        version = self.version(user_id)
+        if version is not None:
+            with self._lock:
+                self._versions[user_id] = (time.monotonic(), version)
+        return version
+
+    def get(self, user_id):
+        """Returns (credentials, client) for user_id on this thread, or None if the user has no live entry."""
+        version = self._recent_version(user_id)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and (entry.expires_at <= time.monotonic()
+                                      or None not in (version, entry.version) and version != entry.version):
+                del self._entries[user_id]
+                entry = None
+            if entry is None:
+                self._versions.pop(user_id, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+
+        client = getattr(entry.clients, "client", None)
+        if client is None:
+            client = build_youtube(entry.credentials, user_id)
+            entry.clients.client = client
+        return entry.credentials, client
+
+    def put(self, user_id, credentials, version=None):
+        """Builds a client from valid credentials, pooling them if they stay valid long enough. Returns the client.
+
+        Args:
+            version (int | None): version(user_id) from before the credentials were loaded.
+        """
+        client = build_youtube(credentials, user_id)
+        ttl = self._ttl(credentials)
+        if ttl <= 0:
+            return client
+
+        entry = _PoolEntry(credentials, time.monotonic() + ttl, version)
+        entry.clients.client = client
+        with self._lock:
+            self._entries[user_id] = entry
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                evicted, _ = self._entries.popitem(last=False)
+                self._versions.pop(evicted, None)
+        return client
+
+    def invalidate(self, user_id):
+        """Drops a user's entry in every process, e.g. after a new token was saved or the API rejected the current one."""
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._versions.pop(user_id, None)
+        client = get_redis()
+        if client is None:
+            return
+        key = f"{_VERSION_KEY_PREFIX}{user_id}"
+        try:
+            pipe = client.pipeline()
+            pipe.incr(key)
+            # Outlives every entry built under an older version
+            pipe.expire(key, int(self.max_age) + 60)
+            pipe.execute()
+        except redis.RedisError as e:
+            report_redis_error(e, source="ClientPool")
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "users": len(self._entries),
+                "max_users": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            }
+
+
+_client_pool = ClientPool()
+
+
+def get_pooled_client(user_id):
+    return _client_pool.get(user_id)
+
+
+def get_client_version(user_id):
+    return _client_pool.version(user_id)
+
+
+def pool_client(user_id, credentials, version=None):
+    return _client_pool.put(user_id, credentials, version)
+
+
+def invalidate_client(user_id):
+    _client_pool.invalidate(user_id)
+
+
+def get_client_pool_stats():
+    """Hit/miss counts and size of this process's YouTube client pool."""
+    return _client_pool.stats()
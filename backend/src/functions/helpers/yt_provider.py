@@ -1,19 +1,35 @@
 import os
+import datetime
 from dotenv import load_dotenv
 from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 from google.oauth2.credentials import Credentials
 from google.auth.exceptions import RefreshError
 from google.auth.transport.requests import Request
+from googleapiclient.errors import HttpError
 import yt_dlp
+from concurrent.futures import ThreadPoolExecutor
 from youtubesearchpython import VideosSearch
 import json
+import logging
 from .provider import Provider
-from .provider import preprocess_title, fuzzy_match
+from .provider import normalize, CandidateScorer, CandidateFilter, duration_seconds
+from .rate_limit import get_limiter
+from .search_cache import cached_search
+from .query_planner import QueryPlanner
+from .cassette import install_cassette
+from .yt_client_pool import get_pooled_client, get_client_version, pool_client, invalidate_client, is_auth_error, api_limiter, throttle_delay
+from .auth_cache import is_auth_valid, record_auth_valid, invalidate_auth
+from .playlist_directory import get_cached_playlist, cache_playlist, save_directory, expire_playlist, is_fresh
+from .membership_index import cached_playlist_items
+from .log_pipeline import log_sampled
+from .audio_cache import get_audio, AudioDownloadError, ydl_format_selector
 load_dotenv()
+install_cassette()
 from src.db.youtube_token import get_youtube_token, save_youtube_token
 from src.db.youtube_quota import increment_quota
 
+logger = logging.getLogger(__name__)
+
 
 
 yt_client_id = os.getenv("YT_CLIENT_ID")
@@ -24,6 +40,94 @@ yt_auth_provider_x509_cert_url = os.getenv("YT_AUTH_PROVIDER_X509_CERT_URL")
 yt_client_secret = os.getenv("YT_CLIENT_SECRET")
 yt_redirect_uri = os.getenv("YT_REDIRECT_URIS")
 
+# Per-process cap on in-flight VideosSearch requests, shared by every search_auto call
+YT_SEARCH_CONCURRENCY = int(os.getenv("YT_SEARCH_CONCURRENCY", "8"))
+_search_pool = ThreadPoolExecutor(max_workers=YT_SEARCH_CONCURRENCY, thread_name_prefix="yt-search")
+# Cap on VideosSearch requests per second across every process (0 disables)
+_search_rate_limiter = get_limiter('youtube', 'scrape', float(os.getenv("YT_SEARCH_RATE", "10")))
+# Most playlistItems.insert calls per batch HTTP request in add_to_playlist...
+YT_INSERT_BATCH_SIZE = int(os.getenv("YT_INSERT_BATCH_SIZE", "50"))
+# ...starting from this many, doubled after every batch that went in cleanly (see add_to_playlist)
+YT_INSERT_INITIAL_BATCH_SIZE = int(os.getenv("YT_INSERT_INITIAL_BATCH_SIZE", "5"))
+# Tries per video before add_to_playlist gives up on it (position conflicts aren't counted)
+YT_INSERT_MAX_ATTEMPTS = int(os.getenv("YT_INSERT_MAX_ATTEMPTS", "3"))
+# Insert failures worth retrying: conflicts, rate limits, server errors...
+_RETRYABLE_INSERT_STATUSES = {409, 429, 500, 502, 503, 504}
+# ...and positions past the end of the playlist because a batch ran out of order
+_POSITION_ERRORS = {"invalidPlaylistItemPosition", "manualSortRequired"}
+# Partial response for playlist items: only what iter_playlist_items reads
+_PLAYLIST_ITEMS_FIELDS = "nextPageToken,items(snippet(title,videoOwnerChannelTitle,resourceId/videoId),status/privacyStatus)"
+# Privacy statuses of videos that can't be played (private, or deleted)
+_UNAVAILABLE_PRIVACY_STATUSES = {"private", "privacyStatusUnspecified"}
+
+
+def _compact_video(item):
+    """Keeps only the VideosSearch fields matching and manual search use, so cached entries stay small."""
+    if not item or not isinstance(item, dict):
+        return item
+    channel = item.get('channel') or {}
+    thumbnails = item.get('thumbnails') or []
+    return {
+        'id': item.get('id'),
+        'title': item.get('title'),
+        'channel': {'name': channel.get('name')} if channel else None,
+        'duration': item.get('duration'),
+        'thumbnails': thumbnails[:1],
+    }
+
+
+def _scrape_throttle_delay(e):
+    """VideosSearch doesn't check status codes: a throttled search fails on YouTube's non-JSON error page."""
+    return 0 if 'Could not parse YouTube response' in str(e) else None
+
+
+def _fetch_videos(query, limit):
+    try:
+        # VideosSearch makes its request when constructed
+        search = _search_rate_limiter.call(lambda: VideosSearch(query, limit=limit), _scrape_throttle_delay)
+        search_result = search.result()
+
+        # Defensive check against None or malformed responses
+        if not search_result or 'result' not in search_result:
+            logger.debug("YouTube search returned no result for query: %s", query)
+            return None
+
+        response = search_result['result']
+        if response is None:
+            logger.debug("YouTube search returned 'result: None' for query: %s", query)
+            return None
+        return [_compact_video(item) for item in response]
+
+    except Exception as e:
+        logger.warning("An exception occurred during YouTube search for query '%s': %s", query, e)
+        return None
+
+
+def _http_error_reason(e):
+    """The first 'reason' of a googleapiclient HttpError (e.g. 'quotaExceeded'), or None."""
+    details = getattr(e, 'error_details', None)
+    if isinstance(details, list) and details and isinstance(details[0], dict):
+        return details[0].get('reason')
+    return None
+
+
+def _playlist_entry(playlist, response_etag=None):
+    """A playlists.list item (snippet and contentDetails) in get_playlist_by_name's format."""
+    return {
+        'id': playlist['id'],
+        'title': playlist['snippet']['title'],
+        'description': playlist['snippet'].get('description', ''),
+        'itemCount': playlist['contentDetails']['itemCount'],
+        'etag': playlist.get('etag'),
+        'response_etag': response_etag,
+    }
+
+
+def _search_videos(query, limit=10):
+    """Runs one VideosSearch query (through the shared search cache), returning its results or None on failure."""
+    return cached_search("youtube", query, limit, lambda: _fetch_videos(query, limit))
+
+
 class YoutubeProvider(Provider):
     # Remove in-memory token_store if it's not used elsewhere,
     # or ensure it's properly managed if it's a cache.
@@ -33,7 +137,7 @@ class YoutubeProvider(Provider):
         if not user_id:
             raise ValueError("YoutubeProvider requires a user_id for token management!")
         self.user_id = user_id
-        print(f"[YTProvider] Using user_id: {self.user_id}")
+        logger.debug("Using user_id: %s", self.user_id)
         scopes = ['https://www.googleapis.com/auth/youtube.readonly',
                   'https://www.googleapis.com/auth/youtube.force-ssl']
 
@@ -44,7 +148,7 @@ class YoutubeProvider(Provider):
         CLIENT_SECRETS_FILE = os.path.join(token_dir, 'desktop_client_secrets.json')
 
         if not os.path.exists(CLIENT_SECRETS_FILE):
-            print("[YTProvider] Creating client_secrets.json file from environment variables...")
+            logger.info("Creating client_secrets.json file from environment variables...")
             # ... (rest of client_secrets.json creation logic remains unchanged)
             yt_client_id = os.getenv("YT_CLIENT_ID")
             yt_project_id = os.getenv("YT_PROJECT_ID")
@@ -67,136 +171,145 @@ class YoutubeProvider(Provider):
             }
             with open(CLIENT_SECRETS_FILE, 'w') as f:
                 json.dump(client_secrets, f, indent=2)
-            print(f"[YTProvider] Wrote client_secrets.json to: {CLIENT_SECRETS_FILE}")
-            with open(CLIENT_SECRETS_FILE, 'r') as f:
-                print("[YTProvider] Actual client_secrets.json file content:")
-                print(f.read())
+            logger.info("Wrote client_secrets.json to: %s", CLIENT_SECRETS_FILE)
         
-        print(f"[YTProvider] Initializing YouTube client for user {self.user_id}")
+        logger.debug("Initializing YouTube client for user %s", self.user_id)
         self.youtube = None
+        self.credentials = None
+        pooled = get_pooled_client(self.user_id)
+        if pooled is not None:
+            self.credentials, self.youtube = pooled
+            logger.debug("Reusing pooled YouTube API client for user %s.", self.user_id)
+            return
+
+        version = get_client_version(self.user_id)
         credentials = self.load_credentials_from_db()
 
         if credentials:
-            print(f"[YTProvider] Found credentials for user {self.user_id}")
+            logger.debug("Found credentials for user %s", self.user_id)
             if credentials.expired and credentials.refresh_token:
                 try:
-                    print(f"[YTProvider] Attempting to refresh YouTube token for user {self.user_id}...")
+                    logger.info("Attempting to refresh YouTube token for user %s...", self.user_id)
                     credentials.refresh(Request())
                     self.save_credentials_to_db(credentials) # Save refreshed token
-                    print(f"[YTProvider] Token refreshed and saved for user {self.user_id}.")
+                    logger.info("Token refreshed and saved for user %s.", self.user_id)
                 except RefreshError as e:
-                    print(f"[YTProvider] Failed to refresh token for user {self.user_id}: {e}")
+                    logger.warning("Failed to refresh token for user %s: %s", self.user_id, e)
                     credentials = None 
                 except Exception as e:
-                    print(f"[YTProvider] An unexpected error occurred during token refresh for user {self.user_id}: {e}")
+                    logger.error("An unexpected error occurred during token refresh for user %s: %s", self.user_id, e)
                     credentials = None
             else:
-                print(f"[YTProvider] Credentials are valid and not expired for user {self.user_id}")
+                logger.debug("Credentials are valid and not expired for user %s", self.user_id)
         else:
-            print(f"[YTProvider] No credentials found for user {self.user_id}")
+            logger.info("No credentials found for user %s", self.user_id)
 
         if credentials and credentials.valid:
             try:
-                self.youtube = build('youtube', 'v3', credentials=credentials)
-                print(f"[YTProvider] YouTube API client built successfully for user {self.user_id}.")
+                self.youtube = pool_client(self.user_id, credentials, version)
+                self.credentials = credentials
+                logger.debug("YouTube API client built successfully for user %s.", self.user_id)
             except Exception as e:
-                print(f"[YTProvider] Error building YouTube API client for user {self.user_id}: {e}")
+                logger.error("Error building YouTube API client for user %s: %s", self.user_id, e)
                 self.youtube = None
         else:
-            print(f"[YTProvider] No valid credentials available for user {self.user_id}")
+            logger.warning("No valid credentials available for user %s", self.user_id)
 
     def load_credentials_from_db(self):
         """Load credentials from the database for the current user_id."""
-        print(f"[YTProvider] Loading YouTube token from DB for user_id: {self.user_id}")
+        logger.debug("Loading YouTube token from DB for user_id: %s", self.user_id)
         token_json = get_youtube_token(self.user_id)
         if token_json:
             try:
                 token_data = json.loads(token_json)
-                print(f"[YTProvider] Successfully parsed token JSON for user_id: {self.user_id}")
-                print(f"[YTProvider] Token data: {json.dumps(token_data, indent=2)}")
+                logger.debug("Successfully parsed token JSON for user_id: %s", self.user_id)
                 creds = Credentials.from_authorized_user_info(token_data)
-                print(f"[YTProvider] Successfully created Credentials object for user_id: {self.user_id}")
-                print(f"[YTProvider] Token valid: {creds.valid}")
-                print(f"[YTProvider] Token expired: {creds.expired}")
-                print(f"[YTProvider] Has refresh token: {bool(creds.refresh_token)}")
+                logger.debug("Created Credentials for user_id %s (valid: %s, expired: %s, has refresh token: %s)",
+                             self.user_id, creds.valid, creds.expired, bool(creds.refresh_token))
                 return creds
             except json.JSONDecodeError as e:
-                print(f"[YTProvider] Failed to parse token JSON from DB for user_id {self.user_id}: {e}")
+                logger.warning("Failed to parse token JSON from DB for user_id %s: %s", self.user_id, e)
             except Exception as e:
-                print(f"[YTProvider] Failed to create Credentials object from DB token for user_id {self.user_id}: {e}")
+                logger.warning("Failed to create Credentials object from DB token for user_id %s: %s", self.user_id, e)
         else:
-            print(f"[YTProvider] No token found in DB for user_id: {self.user_id}")
+            logger.info("No token found in DB for user_id: %s", self.user_id)
         return None
 
     def save_credentials_to_db(self, credentials):
         """Save credentials to the database for the current user_id."""
-        print(f"Saving YouTube token to DB for user_id: {self.user_id}")
+        logger.debug("Saving YouTube token to DB for user_id: %s", self.user_id)
         try:
             # credentials.to_json() returns a string, which is what save_youtube_token expects
             save_youtube_token(self.user_id, credentials.to_json())
-            print(f"Successfully saved token to DB for user_id: {self.user_id}")
+            logger.debug("Successfully saved token to DB for user_id: %s", self.user_id)
         except Exception as e:
-            print(f"Failed to save token to DB for user_id {self.user_id}: {e}")
+            logger.error("Failed to save token to DB for user_id %s: %s", self.user_id, e)
 
     def _check_authenticated(self):
-        """Check if the YouTube client is authenticated and ready to use."""
-        print(f"[YTProvider] Checking authentication status for user {self.user_id}")
+        """Check if the YouTube client is authenticated and ready to use.
+
+        A recent successful check (shared through the auth cache) is trusted until the access token
+        expires, so the probe request below only runs when there is none.
+        """
+        logger.debug("Checking authentication status for user %s", self.user_id)
         if not hasattr(self, 'youtube') or self.youtube is None:
-            print(f"[YTProvider] YouTube client not initialized for user {self.user_id}")
+            logger.warning("YouTube client not initialized for user %s", self.user_id)
             return False
+        if is_auth_valid('youtube', self.user_id):
+            return True
         
         try:
             # Try to make a simple API call to verify the token is valid
             request = self.youtube.playlists().list(part="snippet", mine=True, maxResults=1)
             response = request.execute()
-            print(f"[YTProvider] Successfully verified YouTube token for user {self.user_id}")
+            logger.info("Successfully verified YouTube token for user %s", self.user_id)
+            expiry = self.credentials.expiry if self.credentials is not None else None
+            # google-auth keeps expiry as a naive UTC datetime
+            record_auth_valid('youtube', self.user_id,
+                              expiry.replace(tzinfo=datetime.timezone.utc).timestamp() if expiry else None)
             return True
         except Exception as e:
-            print(f"[YTProvider] Error verifying YouTube token for user {self.user_id}: {e}")
+            logger.warning("Error verifying YouTube token for user %s: %s", self.user_id, e)
             # Check if the error is specifically an authentication error
             if hasattr(e, 'resp') and hasattr(e.resp, 'status'):
                 if e.resp.status in [401, 403]:
-                    print(f"[YTProvider] Authentication error detected for user {self.user_id}")
+                    logger.warning("Authentication error detected for user %s", self.user_id)
+                    invalidate_client(self.user_id)
+                    invalidate_auth('youtube', self.user_id)
                     return False
             # For other errors, we'll assume the token is still valid
-            print(f"[YTProvider] Non-auth error during token verification for user {self.user_id}, assuming token is valid")
+            logger.warning("Non-auth error during token verification for user %s, assuming token is valid", self.user_id)
             return True
 
-    def search_auto(self, track_name, artists) -> list:
-        """algorithmically processes track_name and artists from Spotify to search for equivalent Youtube video."""
-        if not self._check_authenticated():
+    def search_auto(self, track_name, artists, check_auth=True, duration_ms=None) -> list:
+        """algorithmically processes track_name and artists from Spotify to search for equivalent Youtube video.
+
+        Pass check_auth=False when the caller has already verified authentication (e.g. once before
+        matching many tracks in parallel), since the check shares the non-thread-safe API client.
+        duration_ms (the Spotify track's length, if known) lets the pre-filter drop loops and mixes.
+        """
+        if check_auth and not self._check_authenticated():
             raise Exception("YouTube authentication required. Please authenticate via the web flow.")
         
-        # Try multiple search strategies
-        search_queries = [
-            f"{track_name} {artists}",
-            f"{preprocess_title(track_name)} {artists}",
-            f"{track_name}",  # Sometimes artist in title is enough
-            f"{artists} {track_name}",  # Try artist first
+        # Try multiple search strategies (the planner may reorder them by observed yield)
+        search_variants = [
+            ("title_artist", f"{track_name} {artists}"),
+            ("clean_title_artist", f"{normalize(track_name).clean_title} {artists}"),
+            ("title", f"{track_name}"),  # Sometimes artist in title is enough
+            ("artist_title", f"{artists} {track_name}"),  # Try artist first
         ]
         
-        best_match = ["", 0, 0, "", ""]  # [video_id, title_score, artist_score, video_title, channel_name]
-        all_videos_found = []
+        scorer = CandidateScorer()
+        seen_video_ids = set()
+
+        # Loop-invariant forms of the Spotify side
+        sp_track = normalize(track_name, artists)
+        artists_lower = artists.lower()
+        artist_words = [word for word in artists_lower.split() if len(word) > 2]
+        split_artists = [artist.strip().lower() for artist in artists.split(',')] if ',' in artists else []
+        candidate_filter = CandidateFilter(track_name, artists, duration_ms / 1000 if duration_ms else None)
         
-        for query in search_queries:
-            try:
-                search = VideosSearch(query, limit=10)
-                search_result = search.result()
-
-                # Defensive check against None or malformed responses
-                if not search_result or 'result' not in search_result:
-                    print(f"YouTube search returned no result for query: {query}")
-                    continue
-
-                response = search_result['result']
-                if response is None:
-                    print(f"YouTube search returned 'result: None' for query: {query}")
-                    continue
-
-            except Exception as e:
-                print(f"An exception occurred during YouTube search for query '{query}': {e}")
-                continue
-
+        def add_results(response):
             for item in response:
                 if not item or not isinstance(item, dict):
                     continue
@@ -214,100 +327,90 @@ class YoutubeProvider(Provider):
                     continue
                 
                 # Skip if we've already seen this video
-                if video_id in [v[0] for v in all_videos_found]:
+                if video_id in seen_video_ids:
                     continue
+                seen_video_ids.add(video_id)
+
+                # Obvious non-matches skip the fuzzy scoring entirely
+                if not candidate_filter.accepts(yt_video_title, yt_channel_name, duration_seconds(item.get('duration'))):
+                    continue
+
+                idx = scorer.add_candidate([video_id, yt_video_title, yt_channel_name])
+                yt_track = normalize(yt_video_title, yt_channel_name)
+                yt_title_lower = yt_track.lower
+                yt_channel_lower = yt_channel_name.lower()
                 
                 # Multiple scoring approaches for title
-                title_scores = []
                 
                 # Direct fuzzy match
-                title_scores.append(fuzzy_match(yt_video_title.lower(), track_name.lower()))
+                scorer.title_match(idx, yt_title_lower, sp_track.lower)
                 
                 # Clean title match (without feat/ft parts and other keywords)
-                clean_yt_title = preprocess_title(yt_video_title, yt_channel_name)
-                clean_sp_title = preprocess_title(track_name, artists)
-                title_scores.append(fuzzy_match(clean_yt_title, clean_sp_title))
+                scorer.title_match(idx, yt_track.clean_title, sp_track.clean_title)
                 
                 # Handle featured artists in track names
-                if '(' in track_name and ('feat' in track_name.lower() or 'ft' in track_name.lower()):
-                    main_title = track_name.split('(')[0].strip()
-                    title_scores.append(fuzzy_match(yt_video_title.lower(), main_title.lower()))
+                if sp_track.main_title is not None:
+                    scorer.title_match(idx, yt_title_lower, sp_track.main_title)
                 
                 # Handle YouTube-specific title patterns
-                yt_title_clean = yt_video_title.lower()
+                yt_title_clean = yt_title_lower
                 for suffix in [' official video', ' official audio', ' music video', ' mv', ' lyrics']:
                     if yt_title_clean.endswith(suffix):
                         yt_title_clean = yt_title_clean[:-len(suffix)].strip()
-                title_scores.append(fuzzy_match(yt_title_clean, track_name.lower()))
+                scorer.title_match(idx, yt_title_clean, sp_track.lower)
                 
                 # Check if track titles contain similar words
-                yt_words = set(yt_video_title.lower().replace('(', ' ').replace(')', ' ').split())
-                sp_words = set(track_name.lower().replace('(', ' ').replace(')', ' ').split())
-                common_words = yt_words & sp_words
+                common_words = yt_track.words & sp_track.words
                 if len(common_words) > 0:
-                    word_score = (len(common_words) / max(len(yt_words), len(sp_words))) * 100
-                    title_scores.append(word_score)
-                
-                title_score = max(title_scores)
+                    scorer.title_score(idx, (len(common_words) / max(len(yt_track.words), len(sp_track.words))) * 100)
                 
                 # Artist matching with multiple approaches
-                artist_scores = []
                 
                 # Direct channel name matching
-                artist_scores.append(fuzzy_match(yt_channel_name.lower(), artists.lower()))
+                scorer.artist_match(idx, yt_channel_lower, artists_lower)
                 
                 # Check if artist name appears in video title
-                if artists.lower() in yt_video_title.lower():
-                    artist_scores.append(90)
+                if artists_lower in yt_title_lower:
+                    scorer.artist_score(idx, 90)
                 
                 # Check individual artist words in title or channel
-                for artist_word in artists.lower().split():
-                    if len(artist_word) > 2:
-                        if artist_word in yt_video_title.lower():
-                            artist_scores.append(85)
-                        if artist_word in yt_channel_name.lower():
-                            artist_scores.append(75)
+                for artist_word in artist_words:
+                    if artist_word in yt_title_lower:
+                        scorer.artist_score(idx, 85)
+                    if artist_word in yt_channel_lower:
+                        scorer.artist_score(idx, 75)
                 
                 # Handle artist variations
-                clean_channel = yt_channel_name.lower()
+                clean_channel = yt_channel_lower
                 for suffix in [' official', ' vevo', ' records', ' music']:
                     if clean_channel.endswith(suffix):
                         clean_channel = clean_channel[:-len(suffix)].strip()
-                artist_scores.append(fuzzy_match(clean_channel, artists.lower()))
+                scorer.artist_match(idx, clean_channel, artists_lower)
                 
                 # Handle multiple artists
-                if ',' in artists:
-                    for artist in artists.split(','):
-                        artist = artist.strip()
-                        if artist.lower() in yt_channel_name.lower() or artist.lower() in yt_video_title.lower():
-                            artist_scores.append(80)
-                
-                artist_score = max(artist_scores) if artist_scores else 0
-                
-                # Calculate total score
-                total_score = 0.7 * title_score + 0.3 * artist_score
-                
-                # Store all videos
-                all_videos_found.append((video_id, title_score, artist_score, yt_video_title, yt_channel_name, total_score))
-                
-                # Update best match
-                best_total_score = 0.7 * best_match[1] + 0.3 * best_match[2]
-                if total_score > best_total_score:
-                    best_match = [video_id, title_score, artist_score, yt_video_title, yt_channel_name]
+                for artist in split_artists:
+                    if artist in yt_channel_lower or artist in yt_title_lower:
+                        scorer.artist_score(idx, 80)
+        
+        # Score each batch as it arrives and stop once a candidate is confident; the variants
+        # after the first are issued concurrently
+        best_match = ["", 0, 0, "", ""]  # [video_id, title_score, artist_score, video_title, channel_name]
+        scored = QueryPlanner("youtube", search_variants).run(_search_videos, add_results, scorer, pool=_search_pool)
+        if scored is not None:
+            (video_id, yt_video_title, yt_channel_name), title_score, artist_score = scored
+            best_match = [video_id, title_score, artist_score, yt_video_title, yt_channel_name]
         
         # Check thresholds
         if best_match[1] >= 60 and best_match[2] >= 40:
-            print(f"final song title (yt): {best_match[3]}, song title (sp): {track_name}")
-            print(f"final artist names (yt): {best_match[4]}, artist names (sp): {artists}")
-            print("")
+            log_sampled(logger, logging.DEBUG, "Final match: '%s' by %s for '%s' by %s",
+                        best_match[3], best_match[4], track_name, artists)
             return best_match
         elif best_match[1] >= 80:
-            print(f"final song title (yt): {best_match[3]}, song title (sp): {track_name}")
-            print(f"final artist names (yt): {best_match[4]}, artist names (sp): {artists}")
-            print("")
+            log_sampled(logger, logging.DEBUG, "Final match: '%s' by %s for '%s' by %s",
+                        best_match[3], best_match[4], track_name, artists)
             return best_match
         else:
-            print("no suitable match found.")
+            log_sampled(logger, logging.DEBUG, "no suitable match found.")
             return None
 
         
@@ -322,11 +425,10 @@ class YoutubeProvider(Provider):
             list: returns a list of potential matches, each a dict with video details.
         """
 
-        clean_sp_title = preprocess_title(track_name, artists)
+        clean_sp_title = normalize(track_name, artists).clean_title
         query = f"{clean_sp_title} {artists}"
 
-        search = VideosSearch(query, limit=6)
-        response = search.result().get('result', [])
+        response = _search_videos(query, limit=6)
 
         results = []
         if response:
@@ -339,7 +441,7 @@ class YoutubeProvider(Provider):
                 })
             return results
         else:
-            print("err: no items returned")
+            logger.debug("err: no items returned")
             return []
         
     
@@ -347,7 +449,7 @@ class YoutubeProvider(Provider):
         self._check_authenticated()
         """Obtains a list of the user's Youtube playlists"""
         try: # Add try...except here for detailed error on this specific call
-            print("Attempting to execute self.youtube.playlists().list...")
+            logger.debug("Attempting to execute self.youtube.playlists().list...")
             request = self.youtube.playlists().list(part="snippet", mine=True, maxResults=50) # Added maxResults
 
             # increment_quota("playlists.list")  # playlists.list costs 1 unit
@@ -355,7 +457,7 @@ class YoutubeProvider(Provider):
 
 
             response = request.execute()
-            print(f"Successfully executed playlists().list. Found {len(response.get('items', []))} items.")
+            logger.debug("Successfully executed playlists().list. Found %s items.", len(response.get('items', [])))
             return [
                 {
                     'title': pl['snippet']['title'],
@@ -368,56 +470,101 @@ class YoutubeProvider(Provider):
              error_details = f"Error: {e}"
              if hasattr(e, 'resp') and hasattr(e.resp, 'status'):
                   error_details = f"Status: {e.resp.status}, Reason: {e.resp.reason}, Content: {e.content}"
-             print(f"ERROR IN get_playlists during playlists().list execution: {error_details}")
+             logger.error("ERROR IN get_playlists during playlists().list execution: %s", error_details)
              return None # Return None on error
     
 
-    def get_playlist_by_name(self, playlist_name, db):
-        """given a Youtube playlist name, return the playlist's information."""
+    def get_playlist_by_name(self, playlist_name, db, revalidate=False):
+        """given a Youtube playlist name, return the playlist's information.
+
+        Served from the user's playlist directory cache when possible (see playlist_directory).
+
+        Args:
+            revalidate (bool): check a cached entry against YouTube even if it is fresh, for callers
+                that write based on its itemCount or etag.
+        """
         if not self._check_authenticated():
             raise Exception("YouTube authentication required.")
+
+        cached = get_cached_playlist('youtube', self.user_id, playlist_name)
+        if cached is not None:
+            if is_fresh(cached) and not revalidate:
+                return cached
+            playlist = self._revalidate_playlist(cached, db)
+            if playlist is not None and playlist['title'].lower() == playlist_name.lower():
+                return playlist
         
-        print("Attempting to execute self.youtube.playlists().list...")
+        logger.debug("Attempting to execute self.youtube.playlists().list...")
         try:
             request = self.youtube.playlists().list(
                 part="snippet,contentDetails",
                 mine=True,
                 maxResults=50
             )
-            
+
+            # List every page, so the other playlists' lookups are served from the directory too
+            playlists = []
             while request:
                 response = request.execute()
                 increment_quota(db, 1) 
-
-                for playlist in response.get('items', []):
-                    if playlist['snippet']['title'].lower() == playlist_name.lower():
-                        return {
-                            'id': playlist['id'],
-                            'title': playlist['snippet']['title'],
-                            'description': playlist['snippet'].get('description', ''),
-                            'itemCount': playlist['contentDetails']['itemCount']
-                        }
-                
+                playlists.extend(_playlist_entry(playlist) for playlist in response.get('items', []))
                 request = self.youtube.playlists().list_next(request, response)
+            save_directory('youtube', self.user_id, playlists)
 
+            for playlist in playlists:
+                if playlist['title'].lower() == playlist_name.lower():
+                    return playlist
             return None
         except Exception as e:
-            print(f"Failed to get playlists: {e}")
+            logger.warning("Failed to get playlists: %s", e)
             return None
 
 
-    def get_playlist_items(self, playlist_id, db):
-        """given a playlist id, return a list of all tracks in it.
-        
+    def _revalidate_playlist(self, entry, db):
+        """Re-reads one cached playlist (If-None-Match on its last response etag); None if it's gone or unreadable."""
+        request = self.youtube.playlists().list(part="snippet,contentDetails", id=entry['id'])
+        if entry.get('response_etag'):
+            request.headers['If-None-Match'] = entry['response_etag']
+        try:
+            response = request.execute()
+        except HttpError as e:
+            if e.resp.status == 304:
+                increment_quota(db, 1)
+                cache_playlist('youtube', self.user_id, entry)
+                return entry
+            logger.warning("Failed to revalidate playlist %s: %s", entry['id'], e)
+            return None
+        except Exception as e:
+            logger.warning("Failed to revalidate playlist %s: %s", entry['id'], e)
+            return None
+        increment_quota(db, 1)
+
+        items = response.get('items', [])
+        if not items:
+            return None
+        playlist = _playlist_entry(items[0], response.get('etag'))
+        cache_playlist('youtube', self.user_id, playlist)
+        return playlist
+
+
+    def iter_playlist_items(self, playlist_id, db):
+        """given a playlist id, yield its tracks one page at a time.
+
+        Pages are as large as the API allows, and the fields mask keeps each response to the
+        video id, title, channel and privacy status.
+
         Args:
             playlist_id (str): a valid Youtube playlist id.
 
-        Returns:
-           list[dict]: [{'title': track title, 'id': track id, 'artist': track artist}, ...]
+        Yields:
+            dict: {'title': track title, 'id': track id, 'artist': track artist, 'is_unplayable': bool}
         """
-        tracks_info = []
-        
-        request = self.youtube.playlistItems().list(part="snippet", playlistId=playlist_id, maxResults=25)
+        request = self.youtube.playlistItems().list(
+            part="snippet,status",
+            playlistId=playlist_id,
+            maxResults=50,
+            fields=_PLAYLIST_ITEMS_FIELDS
+        )
     
         while request:
             response = request.execute()
@@ -425,58 +572,182 @@ class YoutubeProvider(Provider):
             # increment_quota("playlistItems.list")  # playlistItems.list costs 1 unit
             increment_quota(db, count=1)
             
-            # Add the current batch of items to the playlist_items list
-            for item in response['items']:
+            for item in response.get('items', []):
                 snippet = item.get('snippet')
-                if snippet and snippet.get('resourceId') and snippet.get('resourceId', {}).get('videoId'):
-                    tracks_info.append({
+                privacy = (item.get('status') or {}).get('privacyStatus')
+                if (snippet and snippet.get('resourceId') and snippet.get('resourceId', {}).get('videoId')
+                        and privacy not in _UNAVAILABLE_PRIVACY_STATUSES):
+                    yield {
                         'title': snippet.get('title', 'Untitled'),
                         'id': snippet['resourceId']['videoId'],
                         'artist': snippet.get('videoOwnerChannelTitle', 'Unknown Artist'),
                         'is_unplayable': False
-                    })
+                    }
                 else:
-                    tracks_info.append({
+                    yield {
                         'title': 'Unplayable/Deleted Video',
                         'id': None,
                         'artist': 'N/A',
                         'is_unplayable': True
-                    })
+                    }
             
             # Check if there's a next page
             request = self.youtube.playlistItems().list_next(request, response)
-    
-        return tracks_info
+
+
+    def get_playlist_items(self, playlist_id, db, playlist=None):
+        """given a playlist id, return a list of all tracks in it.
+
+        With the playlist as returned by get_playlist_by_name, the tracks come from the snapshot
+        store while its etag and item count are unchanged. playlistItems.list can't start at an
+        offset, so a changed playlist is fetched in full.
+        
+        Args:
+            playlist_id (str): a valid Youtube playlist id.
+            playlist (dict, optional): the playlist as returned by get_playlist_by_name.
+
+        Returns:
+           list[dict]: [{'title': track title, 'id': track id, 'artist': track artist}, ...]
+        """
+        if playlist is None:
+            return list(self.iter_playlist_items(playlist_id, db))
+        return cached_playlist_items(db, self.user_id, 'youtube', playlist,
+                                     lambda: list(self.iter_playlist_items(playlist_id, db)))
     
 
-    def add_to_playlist(self, playlist_id, item_ids, db) -> None:
+    def add_to_playlist(self, playlist_id, item_ids, db, start_position=None) -> list:
         self._check_authenticated()
-        """add a list of videos (through id) to a Youtube playlist.
+        """add a list of videos (through id) to a Youtube playlist, keeping their order.
+
+        The inserts go out as batch HTTP requests, each insert carrying its position. YouTube may run
+        a batch's requests in any order, and an insert whose position is past the current end of the
+        playlist fails, so batches start at YT_INSERT_INITIAL_BATCH_SIZE inserts, double (up to
+        YT_INSERT_BATCH_SIZE) after a clean batch and halve after one with position conflicts.
+        Failed inserts are retried in the next batch. Quota is recorded once per batch: 50 units for each
+        insert that went in and 1 for each one YouTube rejected, as the API bills a failed call.
 
         Args:
             playlist_id (str): the playlist id corresponding to the playlist to add videos to.
-            item_id (list[str]): a list of video ids to add to the playlist.
+            item_ids (list[str]): a list of video ids to add to the playlist.
+            start_position (int | None): how many items the playlist already has; looked up if not given.
 
         Returns:
-            None: only mutates the playlist.
+            list[dict]: {'id', 'inserted', 'playlist_item_id', 'error'} for each video, in item_ids order.
         """
-        for item_id in item_ids:
-            request = self.youtube.playlistItems().insert(
-                part="snippet",
-                body={
-                    "snippet": {
-                        "playlistId": playlist_id,
-                        "resourceId": {
-                            "kind": "youtube#video",
-                            "videoId": item_id
-                        }
+        results = [{'id': item_id, 'inserted': False, 'playlist_item_id': None, 'error': None} for item_id in item_ids]
+        if not results:
+            return results
+        if start_position is None:
+            start_position = self.get_playlist_item_count(playlist_id, db)
+        use_positions = start_position is not None
+        batch_size = max(1, min(YT_INSERT_INITIAL_BATCH_SIZE, YT_INSERT_BATCH_SIZE))
+        attempts = [0] * len(results)
+        pending = list(range(len(results)))
+
+        while pending:
+            batch = pending[:batch_size]
+            in_batch = set(batch)
+            # A video's position counts the videos before it that are already in or go out with it
+            positions, position = {}, start_position or 0
+            for i, result in enumerate(results):
+                if i in in_batch:
+                    positions[i] = position
+                    position += 1
+                elif result['inserted']:
+                    position += 1
+
+            errors = {}
+
+            def on_response(request_id, response, exception):
+                if exception is not None:
+                    errors[int(request_id)] = exception
+                else:
+                    results[int(request_id)].update(inserted=True, playlist_item_id=response.get('id'), error=None)
+
+            # A batch's inserts don't go through the per-request limiter, so take a token for each
+            limiter = api_limiter('youtube.playlistItems.insert')
+            batch_request = self.youtube.new_batch_http_request(callback=on_response)
+            for i in batch:
+                snippet = {
+                    "playlistId": playlist_id,
+                    "resourceId": {
+                        "kind": "youtube#video",
+                        "videoId": item_ids[i]
                     }
                 }
-            )
-            request.execute()
-
-            # increment_quota("playlistItems.insert")
-            increment_quota(db, count=50)
+                if use_positions:
+                    snippet["position"] = positions[i]
+                batch_request.add(self.youtube.playlistItems().insert(part="snippet", body={"snippet": snippet}),
+                                  request_id=str(i))
+            limiter.acquire(len(batch))
+            try:
+                batch_request.execute()
+                # increment_quota("playlistItems.insert") for the inserts that went in, 1 unit per rejected one
+                increment_quota(db, count=50 * (len(batch) - len(errors)) + len(errors))
+            except Exception as e:
+                logger.warning("Batch insert into playlist %s failed: %s", playlist_id, e)
+                errors = {i: e for i in batch}
+            delays = [delay for delay in map(throttle_delay, errors.values()) if delay is not None]
+            limiter.release(throttled=bool(delays), retry_after=max(delays, default=None))
+
+            retry, conflicts, refused_positions = [], 0, 0
+            for i in batch:
+                if i not in errors:
+                    continue
+                e = errors[i]
+                results[i]['error'] = str(e)
+                status = getattr(getattr(e, 'resp', None), 'status', None)
+                reason = _http_error_reason(e)
+                if is_auth_error(e):
+                    # The token was rejected; nothing else will go in. A batch's parts don't go through the
+                    # pooled client's error handling, so drop the client and cached auth state here
+                    logger.warning("YouTube rejected the inserts into playlist %s: %s", playlist_id, e)
+                    invalidate_client(self.user_id)
+                    invalidate_auth('youtube', self.user_id)
+                    for j in pending:
+                        results[j]['error'] = results[j]['error'] or str(e)
+                    expire_playlist('youtube', self.user_id, playlist_id)
+                    return results
+                if reason in _POSITION_ERRORS or status == 409:
+                    conflicts += 1
+                    if reason == "manualSortRequired":
+                        use_positions = False
+                    if reason in _POSITION_ERRORS:
+                        refused_positions += 1
+                        retry.append(i)
+                        continue
+                attempts[i] += 1
+                if attempts[i] < YT_INSERT_MAX_ATTEMPTS and (status is None or status in _RETRYABLE_INSERT_STATUSES):
+                    retry.append(i)
+                else:
+                    logger.warning("Giving up on inserting video %s into playlist %s: %s", item_ids[i], playlist_id, e)
+
+            if conflicts:
+                if len(batch) == 1 and refused_positions:
+                    # Even a lone insert's position was refused (the item count was stale), so append instead
+                    use_positions = False
+                batch_size = max(1, batch_size // 2)
+            elif not errors:
+                batch_size = min(YT_INSERT_BATCH_SIZE, batch_size * 2)
+            pending = sorted(retry + pending[len(batch):])
+
+        inserted = sum(result['inserted'] for result in results)
+        logger.info("Inserted %s of %s videos into playlist %s", inserted, len(results), playlist_id)
+        # Its item count and etag have changed
+        expire_playlist('youtube', self.user_id, playlist_id)
+        return results
+
+
+    def get_playlist_item_count(self, playlist_id, db):
+        """given a Youtube playlist id, return how many items it has (None if it can't be read)."""
+        try:
+            response = self.youtube.playlists().list(part="contentDetails", id=playlist_id).execute()
+            increment_quota(db, count=1)
+        except Exception as e:
+            logger.warning("Failed to get the item count of playlist %s: %s", playlist_id, e)
+            return None
+        items = response.get('items', [])
+        return items[0]['contentDetails']['itemCount'] if items else None
     
 
     def create_playlist(self, playlist_name, db):
@@ -506,36 +777,27 @@ class YoutubeProvider(Provider):
         # increment_quota("playlists.insert")
         increment_quota(db, count=50)
 
-        print(f"Created YouTube playlist: {response['snippet']['title']} with ID: {response['id']}")
+        logger.info("Created YouTube playlist: %s with ID: %s", response['snippet']['title'], response['id'])
+        cache_playlist('youtube', self.user_id, _playlist_entry({**response, 'contentDetails': {'itemCount': 0}}))
         return response
     
 
-    def download_song(self, track_id):
-        self._check_authenticated()
-        """Downloads a song from Youtube given a video ID."""
-        url = f"https://www.youtube.com/watch?v={track_id}"
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'outtmpl': f'songs/%(title)s.%(ext)s',
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '192',
-            }],
-            'quiet': False,
-            'noplaylist': True,
-        }
+    def download_song(self, track_id, fmt='mp3'):
+        """Downloads a song from Youtube given a video ID, through the audio download cache.
 
+        Returns:
+            str | None: the path of the cached audio file, or None if the download failed.
+        """
         try:
-            os.makedirs('songs', exist_ok=True)
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([url])
-            print(f"Downloaded song from {url}")
-        except Exception as e:
-            print(f"Failed to download song from {url}. Error: {e}")
+            path = get_audio(track_id, fmt)
+            logger.info("Downloaded song %s to %s", track_id, path)
+            return path
+        except (ValueError, AudioDownloadError) as e:
+            logger.error("Failed to download song %s. Error: %s", track_id, e)
+            return None
 
 
-    def download_playlist(self, playlist_id, playlist_name):
+    def download_playlist(self, playlist_id, playlist_name, fmt='mp3'):
         self._check_authenticated()
         """YT_PROVIDER EXCLUSIVE. Downloads a playlist from Youtube given a video id.
             ***FFMPEG IS REQUIRED FOR INSTALLATION, WORKING ON BUNDLING THIS INTO THE PACKAGE***
@@ -543,15 +805,18 @@ class YoutubeProvider(Provider):
         Args:
             playlist_id (str): a playlist id corresponding to a Youtube playlist.
             playlist_name (str): the name of the playlist to download to.
+            fmt (str): 'mp3', 'm4a' or 'opus'. yt-dlp prefers a stream already in that codec and
+                only copies its audio out of the container; anything else is re-encoded.
         """
         playlist_url = f"https://www.youtube.com/playlist?list={playlist_id}"
-        dl_folder = os.makedirs(os.path.join('Downloads', f"{playlist_name}_from_SYNCER"), exist_ok=True)
+        dl_folder = os.path.join('Downloads', f"{playlist_name}_from_SYNCER")
+        os.makedirs(dl_folder, exist_ok=True)
 
         ydl_opts = {
-            'format': 'bestaudio',
+            'format': ydl_format_selector((fmt,)),
             'postprocessors': [{
                 'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
+                'preferredcodec': fmt,
                 'preferredquality': '192',
             }],
             'outtmpl': os.path.join(dl_folder,'%(title)s.%(ext)s'),
@@ -1,7 +1,22 @@
 from src.functions.helpers.sp_provider import SpotifyProvider
 from src.functions.helpers.yt_provider import YoutubeProvider
+from src.functions.helpers.match_index import search_auto_indexed
+from src.functions.helpers.log_pipeline import log_sampled
+import logging
 import time
 
+logger = logging.getLogger(__name__)
+
+def _warn_failed_adds(results, playlist_id):
+    failed = [result for result in results if not result['inserted']]
+    if failed:
+        logger.warning("Could not add %s of %s tracks to Spotify playlist %s: %s", len(failed), len(results),
+                       playlist_id, [(result['id'], result['error']) for result in failed[:10]])
+
+def _spotify_id(track):
+    """Bare track id of a Spotify track id or uri (search results are uris, playlist items ids)."""
+    return track.rsplit(':', 1)[-1]
+
 def merge_playlists(yt_name, sp_name, merge_name, user_id, db):
     yt = YoutubeProvider(user_id)
     sp = SpotifyProvider(user_id)
@@ -14,26 +29,36 @@ def merge_playlists(yt_name, sp_name, merge_name, user_id, db):
     if spp is None:
         raise Exception(f"Could not find Spotify playlist named '{sp_name}'")
     
-    sp_pl_songs, yt_pl_songs = sp.get_playlist_items(spp['id']), yt.get_playlist_items(ytp['id'], db)
+    sp_pl_songs, yt_pl_songs = sp.get_playlist_items(spp['id'], db, playlist=spp), yt.get_playlist_items(ytp['id'], db, playlist=ytp)
     
-    sp_song_ids = [song['id'] for song in sp_pl_songs]
+    # Tracks unavailable on Spotify have no id to add
+    sp_song_ids = [song['id'] for song in sp_pl_songs if song['id']]
     sp_song_names = [[song['title'], song['artist']] for song in sp_pl_songs]
     yt_song_ids = [song['id'] for song in yt_pl_songs]
     yt_song_names = [[song['title'], song['artist']] for song in yt_pl_songs]
 
+    # Track ids already in each merged playlist, so a song on both sides isn't added twice
+    merged_sp_ids = {_spotify_id(track_id) for track_id in sp_song_ids}
+    merged_yt_ids = set(yt_song_ids)
+
 
     # merge the playlists on SPOTIFY
     sp.create_playlist(merge_name)
     merge_id = sp.get_playlist_by_name(merge_name)['id']
-    sp.add_to_playlist(merge_id, sp_song_ids)
+    _warn_failed_adds(sp.add_to_playlist(merge_id, sp_song_ids), merge_id)
 
     need_to_add = []
-    for song in yt_song_names:
-        result = sp.search_auto(song[0], song[1])
+    for song, yt_song in zip(yt_song_names, yt_pl_songs):
+        result = search_auto_indexed(sp, db, "yt_to_sp", song[0], song[1], source_id=yt_song['id'])
         if result is not None:
+            found_id = _spotify_id(result[0])
+            if found_id in merged_sp_ids:
+                log_sampled(logger, logging.DEBUG, "Found song '%s' which is already in the merged Spotify playlist. Skipping.", result[3])
+                continue
+            merged_sp_ids.add(found_id)
             need_to_add.append(result[0])
         else:
-            print(f"A suitable match for <{song[0]}> by <{song[1]}> was not found.")
+            log_sampled(logger, logging.DEBUG, "A suitable match for <%s> by <%s> was not found.", song[0], song[1])
             # choice = int(input(f"Would you like to (1) manually search the song, or (2) skip? "))
             # if choice == 1:
             #     song = input("Enter the song title: ")
@@ -43,7 +68,7 @@ def merge_playlists(yt_name, sp_name, merge_name, user_id, db):
             
             # else:
             #     continue   
-    sp.add_to_playlist(merge_id, need_to_add)
+    _warn_failed_adds(sp.add_to_playlist(merge_id, need_to_add), merge_id)
 
 
 
@@ -60,12 +85,16 @@ def merge_playlists(yt_name, sp_name, merge_name, user_id, db):
 
     # Now add songs from Spotify (converted to YouTube)
     need_to_add = []
-    for song in sp_song_names:
-        result = yt.search_auto(song[0], song[1])
+    for song, sp_song in zip(sp_song_names, sp_pl_songs):
+        result = search_auto_indexed(yt, db, "sp_to_yt", song[0], song[1], source_id=sp_song['id'])
         if result is not None:
+            if result[0] in merged_yt_ids:
+                log_sampled(logger, logging.DEBUG, "Found song '%s' which is already in the merged YouTube playlist. Skipping.", result[3])
+                continue
+            merged_yt_ids.add(result[0])
             need_to_add.append(result[0])
         else:
-            print(f"A suitable match for <{song[0]}> by <{song[1]}> was not found.")
+            log_sampled(logger, logging.DEBUG, "A suitable match for <%s> by <%s> was not found.", song[0], song[1])
             # choice = int(input(f"Would you like to (1) manually search the song, or (2) skip? "))
             # if choice == 1:
             #     song = input("Enter the song title: ")
@@ -1,72 +1,92 @@
-from src.functions.helpers.provider import preprocess_title
+from src.functions.helpers.playlist_diff import PlaylistIndex
 from src.functions.helpers.sp_provider import SpotifyProvider
 from src.functions.helpers.yt_provider import YoutubeProvider
+from src.functions.helpers.match_index import match_tracks
+from src.functions.helpers.log_pipeline import log_sampled
+import logging
 import time
 
+logger = logging.getLogger(__name__)
 
-def sync_sp_to_yt(playlist_to_modify, sp: SpotifyProvider, db, song_limit: int | None = None, tracks_to_sync: list | None = None):
+
+def sync_sp_to_yt(playlist_to_modify, sp: SpotifyProvider, db, song_limit: int | None = None, tracks_to_sync: list | None = None, workers: int | None = None):
     yt = YoutubeProvider(sp.user_id)
 
     pl_info = sp.get_playlist_by_name(playlist_to_modify)
-    print(f"pl_info: {pl_info}")
+    logger.debug("pl_info: %s", pl_info)
     if pl_info is None:
-        print(f"Could not find or access playlist '{playlist_to_modify}'")
+        logger.warning("Could not find or access playlist '%s'", playlist_to_modify)
         return []
 
-    print(f"SPOTIFY playlist chosen: {pl_info['title']}")
+    logger.info("SPOTIFY playlist chosen: %s", pl_info['title'])
 
     # 3. check if same playlist exists in youtube, if not then make it
-    print(f"Checking if {pl_info['title']} exists in YouTube account...")
+    logger.debug("Checking if %s exists in YouTube account...", pl_info['title'])
     yt_playlist = yt.get_playlist_by_name(playlist_to_modify, db)
     if yt_playlist is None:
-        print(f"Playlist {playlist_to_modify} not found in YouTube, creating it now...")
+        logger.info("Playlist %s not found in YouTube, creating it now...", playlist_to_modify)
         yt.create_playlist(playlist_to_modify, db)
         # Retry logic: wait and retry fetching the playlist up to 5 times
         for attempt in range(5):
             time.sleep(1.5)  # Wait 1.5 seconds between attempts
             yt_playlist = yt.get_playlist_by_name(playlist_to_modify, db)
-            print(f"[Retry {attempt+1}/5] yt.get_playlist_by_name returned: {yt_playlist}")
+            logger.debug("[Retry %s/5] yt.get_playlist_by_name returned: %s", attempt+1, yt_playlist)
             if yt_playlist is not None:
                 break
 
     # Get items from the YouTube playlist to check for existing songs
     yt_playlist_items = []
     if yt_playlist:
-        print(f"Fetching items from YouTube playlist '{yt_playlist['title']}'...")
-        yt_playlist_items = yt.get_playlist_items(yt_playlist['id'], db)
+        logger.debug("Fetching items from YouTube playlist '%s'...", yt_playlist['title'])
+        yt_playlist_items = yt.get_playlist_items(yt_playlist['id'], db, playlist=yt_playlist)
     else:
-        print(f"Could not find or create YouTube playlist '{playlist_to_modify}'.")
+        logger.warning("Could not find or create YouTube playlist '%s'.", playlist_to_modify)
         return []
 
-    # Create a set of preprocessed titles for efficient lookup
-    existing_yt_titles = {preprocess_title(track['title']) for track in yt_playlist_items if 'title' in track}
-    print(f"Found {len(existing_yt_titles)} existing tracks in the YouTube playlist.")
+    # Index the existing tracks for fuzzy membership checks
+    existing_yt = PlaylistIndex(yt_playlist_items)
+    logger.info("Found %s existing tracks in the YouTube playlist.", len(existing_yt))
 
     # --- Use provided tracks_to_sync if given, else fetch all from Spotify ---
     if tracks_to_sync is not None:
         t_to_sync_sp = tracks_to_sync
-        print(f"Using provided tracks_to_sync: {len(t_to_sync_sp)} tracks")
+        logger.info("Using provided tracks_to_sync: %s tracks", len(t_to_sync_sp))
     else:
         # 4. Add each song from spotify to youtube playlist
-        print(f"(Step 2) Syncing {pl_info['title']}, {pl_info['id']} to Youtube...")
-        t_to_sync_sp = sp.get_playlist_items(pl_info['id'])
-        print(f"Fetched {len(t_to_sync_sp) if t_to_sync_sp else 0} tracks from Spotify playlist '{pl_info['title']}'")
-        if t_to_sync_sp:
+        logger.info("(Step 2) Syncing %s, %s to Youtube...", pl_info['title'], pl_info['id'])
+        t_to_sync_sp = sp.get_playlist_items(pl_info['id'], db, playlist=pl_info)
+        logger.info("Fetched %s tracks from Spotify playlist '%s'", len(t_to_sync_sp) if t_to_sync_sp else 0, pl_info['title'])
+        if t_to_sync_sp and logger.isEnabledFor(logging.DEBUG):
             for track in t_to_sync_sp:
-                print(f"Track: {track}")
+                log_sampled(logger, logging.DEBUG, "Track: %s", track)
 
         # Extra safeguard against None return
         if t_to_sync_sp is None:
-            print(f"Error: get_playlist_items returned None for playlist ID {pl_info['id']}")
+            logger.warning("Error: get_playlist_items returned None for playlist ID %s", pl_info['id'])
             t_to_sync_sp = []
 
+    # Skip tracks already in the YouTube playlist before spending searches on them
+    diff = existing_yt.diff(t_to_sync_sp)
+    if diff.present:
+        logger.info("Skipping %s tracks already in the YouTube playlist (%s ambiguous kept).", len(diff.present), len(diff.ambiguous))
+        present = {id(track) for track, _ in diff.present}
+        t_to_sync_sp = [track for track in t_to_sync_sp if id(track) not in present]
+
     # --- Apply song limit if provided ---
     if song_limit is not None and song_limit > 0:
-        print(f"Applying song limit: processing first {song_limit} of {len(t_to_sync_sp)} songs.")
+        logger.info("Applying song limit: processing first %s of %s songs.", song_limit, len(t_to_sync_sp))
         t_to_sync_sp = t_to_sync_sp[:song_limit]
 
+    # Verify YouTube auth once up front; the parallel searches below skip the per-call check
+    if not yt._check_authenticated():
+        raise Exception("YouTube authentication required. Please authenticate via the web flow.")
+    results = match_tracks(
+        lambda song, artists, duration_ms: yt.search_auto(song, artists, check_auth=False, duration_ms=duration_ms),
+        db, "sp_to_yt", t_to_sync_sp, workers=workers
+    )
+
     t_to_sync_yt = []
-    for track in t_to_sync_sp:
+    for track, result in zip(t_to_sync_sp, results):
         if track.get('is_unplayable'):
             t_to_sync_yt.append({
                 "name": track['title'],
@@ -81,13 +101,10 @@ def sync_sp_to_yt(playlist_to_modify, sp: SpotifyProvider, db, song_limit: int |
         song = track['title']
         artists = track['artist']
 
-        result = yt.search_auto(song, artists)
-
         if result is not None:
             found_yt_title = result[3]
-            processed_found_title = preprocess_title(found_yt_title)
-            if processed_found_title in existing_yt_titles:
-                print(f"Found song '{found_yt_title}' which already exists in the YouTube playlist. Skipping.")
+            if result[0] in existing_yt.ids or existing_yt.lookup(found_yt_title, result[4])[0] == 'present':
+                log_sampled(logger, logging.DEBUG, "Found song '%s' which already exists in the YouTube playlist. Skipping.", found_yt_title)
                 continue
             
             t_to_sync_yt.append({
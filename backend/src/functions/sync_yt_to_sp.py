@@ -1,71 +1,86 @@
 from src.functions.helpers.sp_provider import SpotifyProvider
 from src.functions.helpers.yt_provider import YoutubeProvider
-from src.functions.helpers.provider import preprocess_title
+from src.functions.helpers.playlist_diff import PlaylistIndex
+from src.functions.helpers.match_index import match_tracks
+from src.functions.helpers.log_pipeline import log_sampled
+import logging
 import time
 
+logger = logging.getLogger(__name__)
 
-def sync_yt_to_sp(playlist_to_modify, yt: YoutubeProvider, db, song_limit: int | None = None, tracks_to_sync: list | None = None):
+
+def sync_yt_to_sp(playlist_to_modify, yt: YoutubeProvider, db, song_limit: int | None = None, tracks_to_sync: list | None = None, workers: int | None = None):
     sp = SpotifyProvider(yt.user_id)
 
     # Use the provided SpotifyProvider instance
     pl_info = yt.get_playlist_by_name(playlist_to_modify, db)
     if pl_info is None:
-        print(f"Could not find or access playlist '{playlist_to_modify}'")
+        logger.warning("Could not find or access playlist '%s'", playlist_to_modify)
         return
 
-    print(f"YOUTUBE playlist chosen: {pl_info['title']}")
+    logger.info("YOUTUBE playlist chosen: %s", pl_info['title'])
 
     # 3. check if same playlist exists in spotify, if not then make it
-    print(f"Checking if {pl_info['title']} exists in Spotify account...")
+    logger.debug("Checking if %s exists in Spotify account...", pl_info['title'])
     sp_playlist = sp.get_playlist_by_name(playlist_to_modify)
     if sp_playlist is None:
-        print(f"Playlist {playlist_to_modify} not found in Spotify, creating it now...")
+        logger.info("Playlist %s not found in Spotify, creating it now...", playlist_to_modify)
         sp.create_playlist(playlist_to_modify)
 
         for attempt in range(5):
             time.sleep(1.5)
             sp_playlist = sp.get_playlist_by_name(playlist_to_modify)
-            print(f"[Retry {attempt + 1}/5] sp.get_playlist_by_name returned: {sp_playlist}")
+            logger.debug("[Retry %s/5] sp.get_playlist_by_name returned: %s", attempt + 1, sp_playlist)
             if sp_playlist is not None:
                 break
 
     # Get items from the Spotify playlist to check for existing songs
     sp_playlist_items = []
     if sp_playlist:
-        print(f"Fetching items from Spotify playlist '{sp_playlist['name']}'...")
-        sp_playlist_items = sp.get_playlist_items(sp_playlist['id'])
+        logger.debug("Fetching items from Spotify playlist '%s'...", sp_playlist['title'])
+        sp_playlist_items = sp.get_playlist_items(sp_playlist['id'], db, playlist=sp_playlist)
     else:
-        print(f"Could not find or create Spotify playlist '{playlist_to_modify}'.")
+        logger.warning("Could not find or create Spotify playlist '%s'.", playlist_to_modify)
         return []
 
-    # Create a set of preprocessed titles for efficient lookup
-    existing_sp_titles = {preprocess_title(track['title']) for track in sp_playlist_items if 'title' in track}
-    print(f"Found {len(existing_sp_titles)} existing tracks in the Spotify playlist.")
+    # Index the existing tracks for fuzzy membership checks
+    existing_sp = PlaylistIndex(sp_playlist_items)
+    logger.info("Found %s existing tracks in the Spotify playlist.", len(existing_sp))
 
     # --- Use provided tracks_to_sync if given, else fetch all from YouTube ---
     if tracks_to_sync is not None:
         t_to_sync_yt = tracks_to_sync
-        print(f"Using provided tracks_to_sync: {len(t_to_sync_yt)} tracks")
+        logger.info("Using provided tracks_to_sync: %s tracks", len(t_to_sync_yt))
     else:
-        print(f"(Step 2) Syncing {pl_info['title']}, {pl_info['id']} to Spotify...")
-        t_to_sync_yt = yt.get_playlist_items(pl_info['id'], db)
-        print(f"Fetched {len(t_to_sync_yt) if t_to_sync_yt else 0} tracks from YouTube playlist '{pl_info['title']}'")
-        if t_to_sync_yt:
+        logger.info("(Step 2) Syncing %s, %s to Spotify...", pl_info['title'], pl_info['id'])
+        t_to_sync_yt = yt.get_playlist_items(pl_info['id'], db, playlist=pl_info)
+        logger.info("Fetched %s tracks from YouTube playlist '%s'", len(t_to_sync_yt) if t_to_sync_yt else 0, pl_info['title'])
+        if t_to_sync_yt and logger.isEnabledFor(logging.DEBUG):
             for track in t_to_sync_yt:
-                print(f"Track: {track}")
+                log_sampled(logger, logging.DEBUG, "Track: %s", track)
 
         # Extra safeguard against None return
         if t_to_sync_yt is None:
-            print(f"Error: get_playlist_items returned None for playlist ID {pl_info['id']}")
+            logger.warning("Error: get_playlist_items returned None for playlist ID %s", pl_info['id'])
             t_to_sync_yt = []
 
+    # Skip tracks already in the Spotify playlist before spending searches on them
+    diff = existing_sp.diff(t_to_sync_yt)
+    if diff.present:
+        logger.info("Skipping %s tracks already in the Spotify playlist (%s ambiguous kept).", len(diff.present), len(diff.ambiguous))
+        present = {id(track) for track, _ in diff.present}
+        t_to_sync_yt = [track for track in t_to_sync_yt if id(track) not in present]
+
     # --- Apply song limit if provided ---
     if song_limit is not None and song_limit > 0:
-        print(f"Applying song limit: processing first {song_limit} of {len(t_to_sync_yt)} songs.")
+        logger.info("Applying song limit: processing first %s of %s songs.", song_limit, len(t_to_sync_yt))
         t_to_sync_yt = t_to_sync_yt[:song_limit]
 
+    sp.ensure_client()
+    results = match_tracks(sp.search_auto, db, "yt_to_sp", t_to_sync_yt, workers=workers)
+
     t_to_sync_sp = []
-    for track in t_to_sync_yt:
+    for track, result in zip(t_to_sync_yt, results):
         if track.get('is_unplayable'):
             t_to_sync_sp.append({
                 "name": track['title'],
@@ -80,13 +95,11 @@ def sync_yt_to_sp(playlist_to_modify, yt: YoutubeProvider, db, song_limit: int |
         song = track['title']
         artists = track['artist']
 
-        result = sp.search_auto(song, artists)
-
         if result is not None:
             found_sp_title = result[3]
-            processed_found_title = preprocess_title(found_sp_title)
-            if processed_found_title in existing_sp_titles:
-                print(f"Found song '{found_sp_title}' which already exists in the Spotify playlist. Skipping.")
+            sp_track_id = result[0].rsplit(':', 1)[-1]  # result[0] is the track uri
+            if sp_track_id in existing_sp.ids or existing_sp.lookup(found_sp_title, result[4])[0] == 'present':
+                log_sampled(logger, logging.DEBUG, "Found song '%s' which already exists in the Spotify playlist. Skipping.", found_sp_title)
                 continue
 
             t_to_sync_sp.append({
@@ -2,14 +2,18 @@ from db_models import Job, SessionLocal
 from src.functions.sync_sp_to_yt import sync_sp_to_yt
 from src.functions.sync_yt_to_sp import sync_yt_to_sp
 from src.functions.merge_playlists import merge_playlists
+from src.functions.download_yt_playlist import download_yt_playlist, DOWNLOAD_PLAYLIST_STALE_SECONDS
 from src.functions.helpers.sp_provider import SpotifyProvider
 from src.functions.helpers.yt_provider import YoutubeProvider
+from src.functions.helpers.membership_index import items_to_insert, playlist_version, record_inserted
+from src.functions.helpers.log_pipeline import setup_logging
+from sqlalchemy import or_, and_
 from sqlalchemy.orm import Session
 import logging
 import datetime
 from typing import Any
 
-logging.basicConfig(level=logging.INFO)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 def _update_job_status(db: Session, job_id: str, status: str, result: dict = None, error: str = None):
@@ -117,6 +121,53 @@ def run_merge_playlists_job(job_id: str, yt_playlist: str, sp_playlist: str, new
     finally:
         db.close()
 
+def _claim_download_job(db: Session, job_id: str) -> bool:
+    """Marks a download job as running, unless another worker is running it (its checkpoints are recent)."""
+    stale_before = datetime.datetime.utcnow() - datetime.timedelta(seconds=DOWNLOAD_PLAYLIST_STALE_SECONDS)
+    claimed = db.query(Job).filter(
+        Job.job_id == job_id,
+        or_(Job.status.in_(['pending', 'error']),
+            and_(Job.status == 'downloading', Job.updated_at < stale_before))
+    ).update({'status': 'downloading', 'error': None, 'updated_at': datetime.datetime.utcnow()}, synchronize_session=False)
+    db.commit()
+    return bool(claimed)
+
+def _save_checkpoint(db: Session, job_id: str, checkpoint: dict):
+    db.query(Job).filter(Job.job_id == job_id).update(
+        {'result': checkpoint, 'updated_at': datetime.datetime.utcnow()}, synchronize_session=False)
+    db.commit()
+
+def run_download_playlist_job(job_id: str, playlist_name: str, user_id: str, parallelism: int | None = None, fmt: str | None = None):
+    logger.info(f"=== TASK STARTED: run_download_playlist_job ===")
+    logger.info(f"Job ID: {job_id}")
+    logger.info(f"Playlist: {playlist_name}")
+    logger.info(f"User ID: {user_id}")
+
+    db = SessionLocal()
+    try:
+        if not _claim_download_job(db, job_id):
+            logger.warning(f"Download job {job_id} is finished, missing or running elsewhere. Skipping.")
+            return
+        # A resumed job carries the previous run's checkpoint
+        job = db.query(Job).filter(Job.job_id == job_id).first()
+        yt = YoutubeProvider(user_id)
+        result = download_yt_playlist(playlist_name, yt, db, checkpoint=job.result, parallelism=parallelism, fmt=fmt,
+                                      on_progress=lambda checkpoint: _save_checkpoint(db, job_id, checkpoint))
+        progress = result['progress']
+        logger.info(f"Download finished: {progress['done']} done, {progress['failed']} failed, {progress['skipped']} skipped")
+        if progress['failed'] and not progress['done']:
+            _update_job_status(db, job_id, 'error', result=result, error="None of the tracks could be downloaded.")
+        else:
+            _update_job_status(db, job_id, 'ready_to_download', result=result)
+        logger.info(f"=== TASK COMPLETED: run_download_playlist_job ===")
+    except Exception as e:
+        logger.error(f"Error in job {job_id}: {e}", exc_info=True)
+        db.rollback()
+        _update_job_status(db, job_id, 'error', error=str(e))
+        logger.info(f"=== TASK FAILED: run_download_playlist_job ===")
+    finally:
+        db.close()
+
 def run_finalize_job(job_id: str):
     logger.info(f"=== TASK STARTED: run_finalize_job ===")
     logger.info(f"Job ID: {job_id}")
@@ -135,24 +186,66 @@ def run_finalize_job(job_id: str):
         songs = job.result.get("songs", []) if job.result else []
         
         if job.type == "sync_sp_to_yt":
-            yt_ids = [song.get("yt_id") for song in songs if song.get("status") == "found" and song.get("yt_id")]
-            if yt_ids:
+            found = [song for song in songs if song.get("status") == "found" and song.get("yt_id")]
+            if found:
                 yt = YoutubeProvider(job.user_id)
-                pl_info = yt.get_playlist_by_name(job.playlist_name, db)
-                if pl_info is None:
+                # Its itemCount and etag decide the insert positions and which stored items are current
+                pl_info = yt.get_playlist_by_name(job.playlist_name, db, revalidate=True)
+                created = pl_info is None
+                if created:
                     pl_info = yt.create_playlist(job.playlist_name, db)
                 playlist_id = pl_info['id']
-                yt.add_to_playlist(playlist_id, yt_ids, db)
+                # Every insert costs 50 quota units, so drop the videos the playlist already has (a new one is empty)
+                items = items_to_insert(
+                    playlist_id,
+                    [{'id': song['yt_id'], 'title': song.get('yt_title'), 'artist': song.get('yt_artist')} for song in found],
+                    [] if created else yt.get_playlist_items(playlist_id, db, playlist=pl_info)
+                )
+                if items:
+                    results = yt.add_to_playlist(playlist_id, [item['id'] for item in items], db,
+                                                 start_position=0 if created else pl_info.get('itemCount'))
+                    inserted = [item for item, result in zip(items, results) if result['inserted']]
+                    failed = [result for result in results if not result['inserted']]
+                    if inserted:
+                        version = playlist_version('youtube', yt.get_playlist_by_name(job.playlist_name, db, revalidate=True))
+                        record_inserted(db, job.user_id, 'youtube', playlist_id, inserted, version, created=created)
+                    if failed:
+                        logger.warning(f"Could not insert {len(failed)} videos into YouTube playlist {playlist_id}: "
+                                       f"{[(result['id'], result['error']) for result in failed]}")
+                        if not inserted:
+                            raise Exception(f"Failed to add any videos to the YouTube playlist: {failed[0]['error']}")
+                    items = inserted
+                logger.info(f"Inserted {len(items)} of {len(found)} videos into YouTube playlist {playlist_id}")
                 
         elif job.type == "sync_yt_to_sp":
-            sp_ids = [song.get("sp_id") for song in songs if song.get("status") == "found" and song.get("sp_id")]
-            if sp_ids:
+            found = [song for song in songs if song.get("status") == "found" and song.get("sp_id")]
+            if found:
                 sp = SpotifyProvider(job.user_id)
-                pl_info = sp.get_playlist_by_name(job.playlist_name)
-                if pl_info is None:
-                    pl_info = sp.create_playlist(job.playlist_name)
+                pl_info = sp.get_playlist_by_name(job.playlist_name, revalidate=True)
+                created = pl_info is None
+                if created:
+                    pl_info = {'id': sp.create_playlist(job.playlist_name)}
                 playlist_id = pl_info['id']
-                sp.add_to_playlist(playlist_id, sp_ids)
+                items = items_to_insert(
+                    playlist_id,
+                    [{'id': song['sp_id'], 'title': song.get('sp_title'), 'artist': song.get('sp_artist')} for song in found],
+                    [] if created else sp.get_playlist_items(playlist_id, db, playlist=pl_info)
+                )
+                if items:
+                    results = sp.add_to_playlist(playlist_id, [item['id'] for item in items],
+                                                 start_position=0 if created else None)
+                    inserted = [item for item, result in zip(items, results) if result['inserted']]
+                    failed = [result for result in results if not result['inserted']]
+                    if inserted:
+                        version = playlist_version('spotify', sp.get_playlist_by_name(job.playlist_name, revalidate=True))
+                        record_inserted(db, job.user_id, 'spotify', playlist_id, inserted, version, created=created)
+                    if failed:
+                        logger.warning(f"Could not add {len(failed)} tracks to Spotify playlist {playlist_id}: "
+                                       f"{[(result['id'], result['error']) for result in failed]}")
+                        if not inserted:
+                            raise Exception(f"Failed to add any tracks to the Spotify playlist: {failed[0]['error']}")
+                    items = inserted
+                logger.info(f"Inserted {len(items)} of {len(found)} tracks into Spotify playlist {playlist_id}")
 
         _update_job_status(db, job_id, "completed")
         logger.info(f"Successfully finalized and completed job {job_id}")
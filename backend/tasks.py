@@ -7,25 +7,37 @@ from task_definitions import (
     run_sync_sp_to_yt_job as _run_sync_sp_to_yt_job,
     run_sync_yt_to_sp_job as _run_sync_yt_to_sp_job,
     run_merge_playlists_job as _run_merge_playlists_job,
-    run_finalize_job as _run_finalize_job
+    run_finalize_job as _run_finalize_job,
+    run_download_playlist_job as _run_download_playlist_job
 )
 from src.functions.helpers.yt_provider import YoutubeProvider
 from src.functions.helpers.sp_provider import SpotifyProvider
+from src.functions.helpers.log_pipeline import log_context
 
 logger = logging.getLogger(__name__)
 
 @celery_app.task(name='tasks.run_sync_sp_to_yt_job')
 def run_sync_sp_to_yt_job(job_id: str, playlist_name: str, user_id: str, song_limit: int | None = None):
-    return _run_sync_sp_to_yt_job(job_id, playlist_name, user_id, song_limit)
+    with log_context(job_id=job_id, user_id=user_id, job_type='sync_sp_to_yt'):
+        return _run_sync_sp_to_yt_job(job_id, playlist_name, user_id, song_limit)
 
 @celery_app.task(name='tasks.run_sync_yt_to_sp_job')
 def run_sync_yt_to_sp_job(job_id: str, playlist_name: str, user_id: str):
-    return _run_sync_yt_to_sp_job(job_id, playlist_name, user_id)
+    with log_context(job_id=job_id, user_id=user_id, job_type='sync_yt_to_sp'):
+        return _run_sync_yt_to_sp_job(job_id, playlist_name, user_id)
 
 @celery_app.task(name='tasks.run_merge_playlists_job')
 def run_merge_playlists_job(job_id: str, yt_playlist: str, sp_playlist: str, new_playlist_name: str, user_id: str):
-    return _run_merge_playlists_job(job_id, yt_playlist, sp_playlist, new_playlist_name, user_id)
+    with log_context(job_id=job_id, user_id=user_id, job_type='merge_playlists'):
+        return _run_merge_playlists_job(job_id, yt_playlist, sp_playlist, new_playlist_name, user_id)
+
+# Acknowledged only once it returns, so a download cut off by a lost worker is delivered again and resumes from its checkpoint
+@celery_app.task(name='tasks.run_download_playlist_job', acks_late=True, reject_on_worker_lost=True)
+def run_download_playlist_job(job_id: str, playlist_name: str, user_id: str, parallelism: int | None = None, fmt: str | None = None):
+    with log_context(job_id=job_id, user_id=user_id, job_type='download_playlist'):
+        return _run_download_playlist_job(job_id, playlist_name, user_id, parallelism, fmt)
 
 @celery_app.task(name="tasks.run_finalize_job")
 def run_finalize_job(job_id):
-    return _run_finalize_job(job_id)
\ No newline at end of file
+    with log_context(job_id=job_id, job_type='finalize'):
+        return _run_finalize_job(job_id)
\ No newline at end of file
@@ -0,0 +1,236 @@
+"""Offline matching benchmark: runs the labelled cases in fixtures/matching_corpus.json through
+search_auto without network, database or Redis, and reports precision/recall and timings.
+
+    python -m testing.benchmark_matching [--repeat N] [--verbose]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CORPUS = os.path.join(BACKEND_DIR, "testing", "fixtures", "matching_corpus.json")
+
+# The token modules read DATABASE_URL at import time; no connection is ever opened here
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("YT_SEARCH_RATE", "0")
+os.environ.setdefault("SP_SEARCH_RATE", "0")
+sys.path.insert(0, BACKEND_DIR)
+
+from src.functions.helpers import redis_client, yt_provider  # noqa: E402
+from src.functions.helpers.provider import _normalize, fuzzy_match, preprocess_title  # noqa: E402
+from src.functions.helpers.sp_provider import SpotifyProvider  # noqa: E402
+from src.functions.helpers.yt_provider import YoutubeProvider  # noqa: E402
+
+# Keep the search cache and planner stats out of it (and don't wait on a missing Redis)
+redis_client._disabled_until = float("inf")
+
+
+class OfflineYoutube(YoutubeProvider):
+    """YoutubeProvider whose searches return the current case's candidates."""
+
+    def __init__(self):
+        self.user_id = "benchmark"
+        self.candidates = []
+
+    def search_auto(self, track_name, artists, check_auth=False, duration_ms=None):
+        return super().search_auto(track_name, artists, check_auth=check_auth, duration_ms=duration_ms)
+
+
+class OfflineSpotify(SpotifyProvider):
+    """SpotifyProvider whose searches return the current case's candidates."""
+
+    def __init__(self):
+        self.user_id = "benchmark"
+        self.sp = object()  # ensure_client() is satisfied without a token
+        self.candidates = []
+
+    def _search_tracks(self, query, limit=10):
+        return self.candidates[:limit]
+
+
+def _compact_video(candidate):
+    return {
+        "id": candidate["id"],
+        "title": candidate["title"],
+        "channel": {"name": candidate["channel"]},
+        "duration": candidate.get("duration"),
+        "thumbnails": [],
+    }
+
+
+def _compact_track(candidate):
+    return {
+        "id": candidate["uri"].rsplit(":", 1)[-1],
+        "uri": candidate["uri"],
+        "name": candidate["name"],
+        "artists": [{"name": name} for name in candidate["artists"]],
+        "duration_ms": candidate.get("duration_ms"),
+        "album": {"images": []},
+    }
+
+
+def load_corpus(path):
+    with open(path, encoding="utf-8") as f:
+        corpus = json.load(f)
+    for case in corpus["cases"]:
+        if case["direction"] == "sp_to_yt":
+            case["results"] = [_compact_video(c) for c in case["candidates"]]
+        else:
+            case["results"] = [_compact_track(c) for c in case["candidates"]]
+    return corpus
+
+
+def make_ranker():
+    """Returns rank(case) -> search_auto result, driving the real providers from fixture data."""
+    yt = OfflineYoutube()
+    sp = OfflineSpotify()
+    yt_provider._search_videos = lambda query, limit=10: yt.candidates[:limit]
+
+    def rank(case):
+        if case["direction"] == "sp_to_yt":
+            yt.candidates = case["results"]
+            return yt.search_auto(case["title"], case["artist"], duration_ms=case.get("duration_ms"))
+        sp.candidates = case["results"]
+        return sp.search_auto(case["title"], case["artist"], duration_ms=case.get("duration_ms"))
+
+    return rank
+
+
+def _quiet(fn, *args):
+    """Calls fn with stdout discarded (search_auto prints every candidate it scores)."""
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        return fn(*args)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+def evaluate(cases, rank, verbose=False):
+    """Runs every case once and returns {direction: counts} plus the list of wrong answers."""
+    counts = {}
+    misses = []
+    for case in cases:
+        result = _quiet(rank, case)
+        predicted = result[0] if result else None
+        expected = case["expected"]
+        c = counts.setdefault(case["direction"], {"cases": 0, "tp": 0, "fp": 0, "fn": 0, "tn": 0})
+        c["cases"] += 1
+
+        if predicted is not None and predicted in expected:
+            c["tp"] += 1
+        elif predicted is None and not expected:
+            c["tn"] += 1
+        else:
+            if predicted is not None:
+                c["fp"] += 1
+            if expected:
+                c["fn"] += 1
+            misses.append((case, result))
+
+        if verbose:
+            ok = "ok  " if (predicted in expected) or (predicted is None and not expected) else "MISS"
+            scores = f"title={result[1]:.0f} artist={result[2]:.0f}" if result else "no match"
+            print(f"  {ok} {case['id']}: {case['title']!r} -> {predicted} ({scores})")
+    return counts, misses
+
+
+def _precision_recall(c):
+    precision = c["tp"] / (c["tp"] + c["fp"]) if c["tp"] + c["fp"] else 0.0
+    recall = c["tp"] / (c["tp"] + c["fn"]) if c["tp"] + c["fn"] else 0.0
+    return precision, recall
+
+
+def evaluate_pairs(pairs, threshold=85):
+    """Scores the labelled title pairs the way is_match does; returns (tp, fp, fn, tn)."""
+    tp = fp = fn = tn = 0
+    for pair in pairs:
+        score = fuzzy_match(preprocess_title(pair["a"]), preprocess_title(pair["b"]))
+        predicted = score >= threshold
+        if predicted and pair["match"]:
+            tp += 1
+        elif predicted:
+            fp += 1
+        elif pair["match"]:
+            fn += 1
+        else:
+            tn += 1
+    return tp, fp, fn, tn
+
+
+def _timeit(fn, items, repeat):
+    """Returns (microseconds per item, items per second) over repeat passes of fn(item)."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for item in items:
+            fn(item)
+    elapsed = time.perf_counter() - start
+    calls = repeat * len(items)
+    return elapsed / calls * 1e6, calls / elapsed
+
+
+def benchmark(corpus, rank, repeat):
+    titles = []
+    for case in corpus["cases"]:
+        titles.append(case["title"])
+        titles.extend(c.get("title") or c.get("name") for c in case["candidates"])
+    pairs = [(p["a"], p["b"]) for p in corpus["title_pairs"]]
+    for case in corpus["cases"]:
+        pairs.extend((case["title"], c.get("title") or c.get("name")) for c in case["candidates"])
+
+    def preprocess_cold(title):
+        _normalize.cache_clear()
+        preprocess_title(title)
+
+    timings = [
+        ("preprocess_title (cold)", _timeit(preprocess_cold, titles, repeat), "titles"),
+        ("preprocess_title (cached)", _timeit(preprocess_title, titles, repeat), "titles"),
+        ("fuzzy_match", _timeit(lambda p: fuzzy_match(*p), pairs, repeat), "pairs"),
+        ("full ranking (search_auto)", _timeit(lambda case: _quiet(rank, case), corpus["cases"], repeat), "tracks"),
+    ]
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline accuracy and speed benchmark for track matching.")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="labelled corpus (JSON)")
+    parser.add_argument("--repeat", type=int, default=20, help="passes over the corpus for timings")
+    parser.add_argument("--verbose", action="store_true", help="print every case's result")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    rank = make_ranker()
+
+    print(f"Corpus: {args.corpus} ({len(corpus['cases'])} cases, {len(corpus['title_pairs'])} title pairs)")
+    print("\nsearch_auto accuracy (thresholds: title >= 60 and artist >= 40, or title >= 80)")
+    counts, misses = evaluate(corpus["cases"], rank, verbose=args.verbose)
+    total = {"cases": 0, "tp": 0, "fp": 0, "fn": 0, "tn": 0}
+    for direction, c in sorted(counts.items()):
+        for k in total:
+            total[k] += c[k]
+        precision, recall = _precision_recall(c)
+        print(f"  {direction:<8} cases={c['cases']:<3} tp={c['tp']:<3} fp={c['fp']:<3} fn={c['fn']:<3} tn={c['tn']:<3} "
+              f"precision={precision:.3f} recall={recall:.3f}")
+    precision, recall = _precision_recall(total)
+    print(f"  {'all':<8} cases={total['cases']:<3} tp={total['tp']:<3} fp={total['fp']:<3} fn={total['fn']:<3} tn={total['tn']:<3} "
+          f"precision={precision:.3f} recall={recall:.3f}")
+
+    if misses and not args.verbose:
+        print("\n  Wrong answers:")
+        for case, result in misses:
+            got = f"{result[0]} ({result[3]!r}, title={result[1]:.0f} artist={result[2]:.0f})" if result else "no match"
+            print(f"    {case['id']}: {case['title']!r} by {case['artist']!r} -> {got}; expected {case['expected'] or 'no match'}")
+
+    tp, fp, fn, tn = evaluate_pairs(corpus["title_pairs"])
+    print(f"\nTitle pairs (is_match, threshold 85): tp={tp} fp={fp} fn={fn} tn={tn}")
+
+    print(f"\nTimings ({args.repeat} passes)")
+    for name, (us_per_item, per_second), unit in benchmark(corpus, rank, args.repeat):
+        print(f"  {name:<28} {us_per_item:>10.1f} us/call {per_second:>12.0f} {unit}/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+import os
+import sys
+
+# The token modules read DATABASE_URL at import time; no connection is ever opened by the tests
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.functions.helpers import redis_client  # noqa: E402
+
+# Keep the tests off any Redis that happens to be running (and don't wait on a missing one)
+redis_client._disabled_until = float("inf")
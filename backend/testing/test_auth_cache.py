@@ -0,0 +1,61 @@
+import pytest
+
+from src.functions.helpers import auth_cache
+from src.functions.helpers.auth_cache import invalidate_auth, is_auth_valid, record_auth_valid
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(auth_cache.time, "time", lambda: now[0])
+    monkeypatch.setattr(auth_cache, "_local", {})
+    return now
+
+
+@pytest.fixture
+def shared_redis(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(auth_cache, "get_redis", lambda: client)
+    return client
+
+
+def test_unknown_user_is_not_valid():
+    assert not is_auth_valid("youtube", "user")
+
+
+def test_validation_is_trusted_until_the_token_expires(clock):
+    record_auth_valid("youtube", "user", expires_at=clock[0] + 30)
+    assert is_auth_valid("youtube", "user")
+    assert not is_auth_valid("spotify", "user")
+    clock[0] += 30
+    assert not is_auth_valid("youtube", "user")
+
+
+def test_validation_is_trusted_at_most_max_age(clock):
+    record_auth_valid("spotify", "user")
+    clock[0] += auth_cache.AUTH_CACHE_MAX_AGE
+    assert not is_auth_valid("spotify", "user")
+
+
+def test_expired_token_is_not_recorded(clock):
+    record_auth_valid("youtube", "user", expires_at=clock[0] - 1)
+    assert not is_auth_valid("youtube", "user")
+
+
+def test_validation_is_shared_through_redis(shared_redis, monkeypatch):
+    record_auth_valid("youtube", "user")  # e.g. in the API server
+    monkeypatch.setattr(auth_cache, "_local", {})  # another process
+    assert is_auth_valid("youtube", "user")
+
+
+def test_invalidation_reaches_other_processes_after_the_local_ttl(shared_redis, monkeypatch, clock):
+    record_auth_valid("youtube", "user")
+    worker_local = dict(auth_cache._local)
+    invalidate_auth("youtube", "user")  # e.g. the server got a 401
+    assert not is_auth_valid("youtube", "user")
+
+    monkeypatch.setattr(auth_cache, "_local", worker_local)
+    assert is_auth_valid("youtube", "user")  # the worker still trusts its own record...
+    clock[0] += auth_cache.AUTH_CACHE_LOCAL_TTL
+    assert not is_auth_valid("youtube", "user")  # ...until it rechecks Redis
@@ -0,0 +1,45 @@
+import httplib2
+import pytest
+from googleapiclient.discovery import build
+
+from src.functions.helpers.cassette import Cassette
+
+
+class _CapturingHttp:
+    """Keeps the body of the batch request instead of sending it."""
+
+    def __init__(self):
+        self.bodies = []
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        self.bodies.append(body)
+        raise httplib2.HttpLib2Error("not sent")
+
+
+def _batch_body(developer_key, video_ids):
+    youtube = build('youtube', 'v3', developerKey=developer_key, static_discovery=True)
+    batch = youtube.new_batch_http_request()
+    for i, video_id in enumerate(video_ids):
+        snippet = {'playlistId': 'pl', 'resourceId': {'kind': 'youtube#video', 'videoId': video_id}, 'position': i}
+        batch.add(youtube.playlistItems().insert(part='snippet', body={'snippet': snippet}), request_id=str(i))
+    http = _CapturingHttp()
+    with pytest.raises(httplib2.HttpLib2Error):
+        batch.execute(http=http)
+    return http.bodies[0]
+
+
+def test_batch_requests_match_across_runs(tmp_path):
+    cassette = Cassette(str(tmp_path), 'replay')
+    url = 'https://youtube.googleapis.com/batch'
+    # Each batch gets a new boundary and Content-IDs, and the key differs between runs
+    first, second = _batch_body('key1', ['a', 'b']), _batch_body('key2', ['a', 'b'])
+    assert first != second
+    assert cassette._path('googleapiclient', 'POST', url, first) == cassette._path('googleapiclient', 'POST', url, second)
+    other = _batch_body('key1', ['a', 'c'])
+    assert cassette._path('googleapiclient', 'POST', url, first) != cassette._path('googleapiclient', 'POST', url, other)
+
+
+def test_other_bodies_are_matched_as_is(tmp_path):
+    cassette = Cassette(str(tmp_path), 'replay')
+    url = 'https://api.spotify.com/v1/playlists/pl/tracks'
+    assert cassette._path('requests', 'POST', url, '{"uris": ["a"]}') != cassette._path('requests', 'POST', url, '{"uris": ["b"]}')
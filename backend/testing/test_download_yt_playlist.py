@@ -0,0 +1,132 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+from src.functions import download_yt_playlist as download
+from src.functions.helpers import audio_cache
+from src.functions.helpers.audio_cache import AudioDownloadError, cache_path
+
+PLAYLIST = [
+    {'id': 'aaaaaaaaaaa', 'title': 'A/b', 'artist': 'X'},
+    {'id': 'bbbbbbbbbbb', 'title': 'B', 'artist': 'Y'},
+    {'id': 'ccccccccccc', 'title': 'A/b', 'artist': 'X'},
+    {'id': 'ddddddddddd', 'title': 'D', 'artist': 'Z', 'is_unplayable': True},
+]
+
+
+class FakeYoutube:
+    def get_playlist_by_name(self, playlist_name, db):
+        return {'id': 'PL'}
+
+    def get_playlist_items(self, playlist_id, db, playlist=None):
+        return [dict(item) for item in PLAYLIST]
+
+
+class Downloads(list):
+    """The ids a fake get_audio was asked for; those in `failing` raise AudioDownloadError."""
+
+    def __init__(self):
+        super().__init__()
+        self.failing = set()
+
+    def get_audio(self, video_id, fmt='mp3'):
+        self.append(video_id)
+        if video_id in self.failing:
+            raise AudioDownloadError('unavailable')
+        path = cache_path(video_id, fmt.split(',')[0])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(video_id.encode() * 10000)
+        return path
+
+
+@pytest.fixture
+def downloads(monkeypatch, tmp_path):
+    monkeypatch.setattr(audio_cache, 'AUDIO_CACHE_DIR', str(tmp_path))
+    downloads = Downloads()
+    monkeypatch.setattr(download, 'get_audio', downloads.get_audio)
+    return downloads
+
+
+def test_download_reports_progress(downloads):
+    downloads.failing.add('bbbbbbbbbbb')
+    checkpoints = []
+    result = download.download_yt_playlist('p', FakeYoutube(), None, parallelism=2, on_progress=checkpoints.append)
+    assert result['progress'] == {'total': 4, 'done': 2, 'failed': 1, 'skipped': 1, 'pending': 0}
+    assert [track['status'] for track in result['tracks']] == ['done', 'failed', 'done', 'skipped']
+    assert checkpoints[0]['progress']['pending'] == 3 and checkpoints[-1] == result
+
+
+def test_resume_only_downloads_what_is_missing(downloads):
+    downloads.failing.add('bbbbbbbbbbb')
+    first = download.download_yt_playlist('p', FakeYoutube(), None)
+    os.remove(cache_path('ccccccccccc', 'mp3'))  # evicted from the cache since
+    downloads.clear()
+    downloads.failing.clear()
+    # A resumed job needs no provider: the checkpoint has the tracks
+    result = download.download_yt_playlist('p', None, None, checkpoint=first)
+    assert sorted(downloads) == ['bbbbbbbbbbb', 'ccccccccccc']
+    assert result['progress']['done'] == 3 and result['playlist_id'] == 'PL'
+
+
+def test_zip_streams_done_tracks(downloads):
+    downloads.failing.add('bbbbbbbbbbb')
+    result = download.download_yt_playlist('p', FakeYoutube(), None)
+    chunks = list(download.iter_playlist_zip(result['tracks'], chunk_size=4096))
+    assert len(chunks) > 2 and max(map(len, chunks)) < 60000
+    archive = zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+    assert archive.testzip() is None
+    assert archive.namelist() == ['001 - X - A_b.mp3', '003 - X - A_b.mp3']
+    assert archive.read('003 - X - A_b.mp3') == b'ccccccccccc' * 10000
+
+
+def test_zip_leaves_out_tracks_that_fail_again(downloads):
+    result = download.download_yt_playlist('p', FakeYoutube(), None)
+    os.remove(cache_path('aaaaaaaaaaa', 'mp3'))
+    downloads.failing.add('aaaaaaaaaaa')
+    archive = zipfile.ZipFile(io.BytesIO(b''.join(download.iter_playlist_zip(result['tracks']))))
+    assert archive.namelist() == ['002 - Y - B.mp3', '003 - X - A_b.mp3']
+
+
+class FakeQuery:
+    def __init__(self, job):
+        self.job = job
+
+    def filter(self, *conditions):
+        return self
+
+    def first(self):
+        return self.job
+
+
+class FakeSession:
+    def __init__(self, job=None):
+        self.job = job
+
+    def add(self, job):
+        self.job = job
+
+    def commit(self):
+        pass
+
+    def query(self, model):
+        return FakeQuery(self.job)
+
+
+def test_resumed_job_keeps_its_format(downloads, monkeypatch):
+    jobs = pytest.importorskip("jobs")
+    queued = []
+    monkeypatch.setattr(jobs.run_download_playlist_job, "apply_async",
+                        lambda args, queue: queued.append(args) or type("Result", (), {"id": "task"})())
+    db = FakeSession()
+    started = jobs.start_download_playlist(
+        jobs.DownloadRequest(playlist_name="p", user_id="user", format="opus,mp3"), db=db)
+    db.job.status = "error"  # e.g. the worker died before the first track was done
+
+    jobs.resume_download_playlist(started["job_id"], db=db)
+    assert queued[-1][-1] == "opus,mp3"
+    # ...and the download picks it up from the first checkpoint either way
+    result = download.download_yt_playlist("p", FakeYoutube(), None, checkpoint=db.job.result)
+    assert result["format"] == "opus,mp3"
@@ -0,0 +1,85 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from src.functions.helpers import provider
+from src.functions.helpers.provider import (
+    CandidateScorer, fuzzy_match, fuzzy_match_matrix, fuzzy_match_pairs, preprocess_title,
+)
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "matching_corpus.json")
+
+
+def _corpus_strings():
+    """Every title, artist and channel in the corpus, raw, lowercased and preprocessed."""
+    with open(CORPUS, encoding="utf-8") as f:
+        corpus = json.load(f)
+    strings = set()
+    for case in corpus["cases"]:
+        strings.update([case["title"], case["title"].lower(), case["artist"],
+                        preprocess_title(case["title"], case["artist"])])
+        for candidate in case["candidates"]:
+            for key in ("title", "name", "channel", "artist"):
+                if isinstance(candidate.get(key), str):
+                    strings.update([candidate[key], candidate[key].lower()])
+            strings.add(preprocess_title(candidate.get("title") or candidate.get("name") or "", case["artist"]))
+    for pair in corpus["title_pairs"]:
+        strings.update([pair["a"], pair["b"]])
+    return sorted(strings)
+
+
+def test_fuzzy_match_matrix_agrees_with_fuzzy_match():
+    strings = _corpus_strings()
+    queries = strings[::7]
+    matrix = fuzzy_match_matrix(queries, strings)
+    expected = np.array([[fuzzy_match(query, choice) for choice in strings] for query in queries])
+    assert (matrix == expected).all()
+
+
+
+def test_fuzzy_match_matrix_swapped_order_agrees_with_fuzzy_match():
+    strings = _corpus_strings()
+    choices = strings[3::7]
+    matrix = fuzzy_match_matrix(strings, choices)
+    expected = np.array([[fuzzy_match(string, choice) for choice in choices] for string in strings])
+    assert (matrix == expected).all()
+
+
+def test_fuzzy_match_pairs_agrees_with_fuzzy_match_in_both_orders():
+    strings = _corpus_strings()
+    firsts, seconds = strings[:len(strings) // 2], strings[len(strings) // 2:][:len(strings) // 2]
+    assert fuzzy_match_pairs(firsts, seconds).tolist() == [fuzzy_match(a, b) for a, b in zip(firsts, seconds)]
+    assert fuzzy_match_pairs(seconds, firsts).tolist() == [fuzzy_match(b, a) for a, b in zip(firsts, seconds)]
+
+
+def test_candidate_scorer_keeps_argument_order(monkeypatch):
+    scored = []
+
+    def recording_pairs(strings1, strings2):
+        scored.extend(zip(strings1, strings2))
+        return fuzzy_match_pairs(strings1, strings2)
+
+    monkeypatch.setattr(provider, "fuzzy_match_pairs", recording_pairs)
+    scorer = CandidateScorer()
+    idx = scorer.add_candidate("video")
+    scorer.title_match(idx, "heat waves (official video)", "heat waves")
+    scorer.artist_match(idx, "glass animals vevo", "glass animals")
+    title_scores, artist_scores = scorer.scores()
+
+    assert scored == [("heat waves (official video)", "heat waves"), ("glass animals vevo", "glass animals")]
+    assert title_scores.tolist() == [fuzzy_match("heat waves (official video)", "heat waves")]
+    assert artist_scores.tolist() == [fuzzy_match("glass animals vevo", "glass animals")]
+    # Each pair is scored once, however often the scores are read
+    scorer.scores()
+    assert len(scored) == 2
+
+@pytest.mark.parametrize("str1, str2, score", [
+    ("", "", 40),
+    ("gods plan", "gods plan", 100),
+    ("Glass Animals - Heat Waves (slowed)", "Dua Lipa - Levitating (Official Animated Music Video)", 42),
+    ("6IX9INE", "BTS (방탄소년단) 'Dynamite' Official MV", 6),
+])
+def test_fuzzy_match_known_scores(str1, str2, score):
+    assert fuzzy_match(str1, str2) == score
@@ -0,0 +1,85 @@
+import datetime
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.db.track_matches import TrackMatch, create_track_matches_table, get_track_match, save_track_match
+from src.functions.helpers.match_index import track_fingerprint
+
+MAX_AGE = datetime.timedelta(days=30)
+
+
+@pytest.mark.parametrize("a, b", [
+    (("God's Plan", "Drake"), ("GOD'S PLAN (Official Video)", "drake")),
+    (("Paris", "The Chainsmokers, Emily Warren"), ("Paris", "Emily Warren, The Chainsmokers")),
+])
+def test_fingerprint_ignores_noise(a, b):
+    assert track_fingerprint(*a) == track_fingerprint(*b)
+
+
+@pytest.mark.parametrize("version", [
+    "Paris (Live)", "Paris - Cover", "Paris (Remix)", "Paris (Acoustic)",
+])
+def test_fingerprint_keeps_version(version):
+    assert track_fingerprint(version, "The Chainsmokers") != track_fingerprint("Paris", "The Chainsmokers")
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    create_track_matches_table(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def _add(db, fingerprint, source_id, target_id, age=datetime.timedelta(0)):
+    db.add(TrackMatch(direction='sp_to_yt', fingerprint=fingerprint, source_id=source_id, target_id=target_id,
+                      target_title='t', target_artist='a', title_score=100, artist_score=100, confidence=100,
+                      last_verified=datetime.datetime.now(datetime.timezone.utc) - age))
+    db.commit()
+
+
+def test_source_id_match_wins_over_fingerprint(db):
+    _add(db, 'paris::chainsmokers', 'other', 'yt-other')
+    _add(db, 'paris live::chainsmokers', 'sp1', 'yt-live')
+    assert get_track_match(db, 'sp_to_yt', 'paris::chainsmokers', 'sp1', MAX_AGE).target_id == 'yt-live'
+
+
+def test_fingerprint_used_without_source_id_match(db):
+    _add(db, 'paris::chainsmokers', 'other', 'yt-other')
+    assert get_track_match(db, 'sp_to_yt', 'paris::chainsmokers', 'sp1', MAX_AGE).target_id == 'yt-other'
+    assert get_track_match(db, 'yt_to_sp', 'paris::chainsmokers', 'sp1', MAX_AGE) is None
+
+
+def test_stale_source_id_match_is_not_replaced_by_fingerprint(db):
+    _add(db, 'paris::chainsmokers', 'other', 'yt-other')
+    _add(db, 'paris live::chainsmokers', 'sp1', 'yt-live', age=datetime.timedelta(days=40))
+    assert get_track_match(db, 'sp_to_yt', 'paris::chainsmokers', 'sp1', MAX_AGE) is None
+    assert get_track_match(db, 'sp_to_yt', 'paris live::chainsmokers', None, MAX_AGE) is None
+
+
+def _save(db, fingerprint, source_id, target_id):
+    save_track_match(db, 'sp_to_yt', fingerprint, source_id, target_id, 't', 'a', 100, 100, 100)
+
+
+def test_save_track_match_upserts_on_fingerprint(db):
+    _save(db, 'paris::chainsmokers', 'sp1', 'yt-old')
+    _save(db, 'paris::chainsmokers', None, 'yt-new')
+    match = db.query(TrackMatch).one()
+    assert (match.source_id, match.target_id) == ('sp1', 'yt-new')
+
+
+def test_save_track_match_last_source_id_wins(db):
+    _save(db, 'paris::chainsmokers', 'sp1', 'yt1')
+    _save(db, 'paris::chainsmokers', 'sp2', 'yt1')
+    assert db.query(TrackMatch).one().source_id == 'sp2'
+    # The first source still finds the match through the fingerprint
+    assert get_track_match(db, 'sp_to_yt', 'paris::chainsmokers', 'sp1', MAX_AGE).target_id == 'yt1'
+
+
+def test_create_track_matches_table_is_idempotent(db):
+    create_track_matches_table(db.get_bind())
+    _save(db, 'paris::chainsmokers', 'sp1', 'yt1')
+    assert db.query(TrackMatch).count() == 1
@@ -0,0 +1,89 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.db.playlist_members import create_playlist_members_table, get_playlist_members
+from src.functions.helpers.membership_index import cached_playlist_items, items_to_insert, record_inserted
+
+PLAYLIST = {'id': 'PL1', 'etag': 'etag-1', 'itemCount': 2}
+ITEMS = [
+    {'id': 'vid1', 'title': 'Heat Waves', 'artist': 'Glass Animals'},
+    {'id': 'vid2', 'title': 'Levitating', 'artist': 'Dua Lipa'},
+]
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    create_playlist_members_table(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+class Fetch:
+    def __init__(self, items):
+        self.items = items
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return [dict(item) for item in self.items]
+
+
+def test_unchanged_playlist_is_served_from_the_store(db):
+    fetch = Fetch(ITEMS)
+    first = cached_playlist_items(db, 'user', 'youtube', PLAYLIST, fetch)
+    second = cached_playlist_items(db, 'user', 'youtube', PLAYLIST, fetch)
+    assert fetch.calls == 1
+    assert [item['id'] for item in second] == [item['id'] for item in first] == ['vid1', 'vid2']
+    assert get_playlist_members(db, 'user', 'youtube', 'PL1').version == 'etag-1:2'
+
+
+def test_changed_playlist_is_refetched_and_replaced(db):
+    cached_playlist_items(db, 'user', 'youtube', PLAYLIST, Fetch(ITEMS))
+    fetch = Fetch(ITEMS[:1])
+    items = cached_playlist_items(db, 'user', 'youtube', {**PLAYLIST, 'etag': 'etag-2', 'itemCount': 1}, fetch)
+    assert fetch.calls == 1
+    assert [item['id'] for item in items] == ['vid1']
+    members = get_playlist_members(db, 'user', 'youtube', 'PL1')
+    assert (members.version, len(members.items)) == ('etag-2:1', 1)
+
+
+def test_grown_spotify_playlist_fetches_only_its_tail(db):
+    tracks = [{'id': f'sp{i}', 'title': f'Song {i}', 'artist': 'A'} for i in range(8)]
+    cached_playlist_items(db, 'user', 'spotify', {'id': 'SP1', 'snapshot_id': 's1', 'track_count': 6},
+                          Fetch(tracks[:6]))
+    offsets = []
+
+    def fetch_tail(offset):
+        offsets.append(offset)
+        return tracks[offset:]
+
+    fetch = Fetch(tracks)
+    items = cached_playlist_items(db, 'user', 'spotify', {'id': 'SP1', 'snapshot_id': 's2', 'track_count': 8},
+                                  fetch, fetch_tail)
+    assert (fetch.calls, offsets) == (0, [1])
+    assert [item['id'] for item in items] == [track['id'] for track in tracks]
+
+
+def test_inserted_items_are_recorded_with_the_new_version(db):
+    cached_playlist_items(db, 'user', 'spotify', {'id': 'SP1', 'snapshot_id': 's1'}, Fetch(ITEMS))
+    record_inserted(db, 'user', 'spotify', 'SP1', [{'id': 'spotify:track:new', 'title': 'New', 'artist': 'B'}], 's2')
+    members = get_playlist_members(db, 'user', 'spotify', 'SP1')
+    assert members.version == 's2'
+    assert [item['id'] for item in members.items] == ['vid1', 'vid2', 'new']
+
+    fetch = Fetch([])
+    cached_playlist_items(db, 'user', 'spotify', {'id': 'SP1', 'snapshot_id': 's2'}, fetch)
+    assert fetch.calls == 0
+
+
+def test_created_playlist_is_stored_whole(db):
+    record_inserted(db, 'user', 'youtube', 'PL2', ITEMS, 'etag:2', created=True)
+    assert [item['id'] for item in get_playlist_members(db, 'user', 'youtube', 'PL2').items] == ['vid1', 'vid2']
+
+
+def test_items_already_in_the_playlist_are_not_inserted():
+    items = [{'id': 'spotify:track:a'}, {'id': 'spotify:track:b'}, {'id': 'spotify:track:b'}]
+    assert items_to_insert('SP1', items, [{'id': 'a'}]) == [{'id': 'spotify:track:b'}]
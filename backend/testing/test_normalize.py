@@ -0,0 +1,19 @@
+from src.functions.helpers.provider import normalize, preprocess_title
+
+
+def test_normalize_is_memoized():
+    assert normalize("Gods Plan", "Drake") is normalize("Gods Plan", "Drake")
+    # A list of artists and the same names as separate groups are one key
+    assert normalize("Paris", ["The Chainsmokers", "Emily Warren"]) is normalize("Paris", "The Chainsmokers", "Emily Warren")
+
+
+def test_clean_title_drops_stopwords_and_artists():
+    track = normalize("Drake - God&#39;s Plan (Official Music Video)", "Drake")
+    assert track.clean_title == "god s plan"
+    assert track.artist_tokens == {"drake"}
+    assert preprocess_title("Drake - God&#39;s Plan (Official Music Video)", "Drake") == track.clean_title
+
+
+def test_main_title_before_feat_part():
+    assert normalize("Paris (feat. Emily Warren)").main_title == "paris"
+    assert normalize("Paris").main_title is None
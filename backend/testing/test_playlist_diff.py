@@ -0,0 +1,49 @@
+import pytest
+
+from src.functions.helpers.playlist_diff import PlaylistIndex, diff_playlists
+
+PLAYLIST = [
+    {'id': 'a', 'title': "Drake - Hold On, We're Going Home (Official Video)", 'artist': 'DrakeVEVO'},
+    {'id': 'b', 'title': 'Katy Perry - Dark Horse (Official) ft. Juicy J', 'artist': 'KatyPerryVEVO'},
+    {'id': 'c', 'title': "Drake - God's Plan (Official Music Video)", 'artist': 'DrakeVEVO'},
+    {'id': 'd', 'title': 'Heat Waves (Slowed)', 'artist': 'Glass Animals'},
+    {'id': 'e', 'title': 'Unplayable', 'artist': '', 'is_unplayable': True},
+    {'id': 'f', 'title': 'Hello', 'artist': 'Adele'},
+    {'id': 'g', 'title': 'Blinding Lights', 'artist': 'TheWeekndVEVO'},
+    {'id': 'h', 'title': 'Stay', 'artist': ''},
+    {'id': 'i', 'title': 'Halo', 'artist': 'Beyonce'},
+]
+
+
+@pytest.mark.parametrize("title, artist, status", [
+    ("God's Plan", "Drake", 'present'),
+    ("Hold On, We're Going Home", "Drake", 'present'),
+    ("Dark Horse", "Katy Perry", 'present'),
+    # Titles that are only a subset of a playlist title are a different song, or at best a guess
+    ("Hold On", "Drake", 'ambiguous'),
+    ("Horse", "Katy Perry", 'ambiguous'),
+    ("Heat Waves", "Glass Animals", 'ambiguous'),
+    ("Levitating", "Dua Lipa", 'missing'),
+    # The same title by another artist is left to the search, as is a title whose artist is unknown
+    ("Hello", "Adele", 'present'),
+    ("Hello", "Lionel Richie", 'ambiguous'),
+    ("Hello", "", 'ambiguous'),
+    ("Stay", "Rihanna", 'ambiguous'),
+    ("Blinding Lights", "The Weeknd", 'present'),
+    ("Halo", "Beyoncé", 'present'),
+])
+def test_lookup(title, artist, status):
+    assert PlaylistIndex(PLAYLIST).lookup(title, artist)[0] == status
+
+
+def test_diff_keeps_source_order():
+    source = [
+        {'id': '1', 'title': 'Horse', 'artist': 'Katy Perry'},
+        {'id': '2', 'title': "God's Plan", 'artist': 'Drake'},
+        {'id': '3', 'title': 'Levitating', 'artist': 'Dua Lipa'},
+        {'id': '4', 'title': 'Unplayable', 'artist': '', 'is_unplayable': True},
+    ]
+    diff = diff_playlists(source, PLAYLIST)
+    assert [t['id'] for t in diff.added] == ['3', '4']
+    assert [(s['id'], t['id']) for s, t in diff.present] == [('2', 'c')]
+    assert [(s['id'], [t['id'] for t in matches]) for s, matches in diff.ambiguous] == [('1', ['b'])]
@@ -0,0 +1,74 @@
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+from src.functions.helpers import playlist_directory, yt_provider
+
+
+@pytest.fixture
+def directory(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(playlist_directory, "get_redis", lambda: client)
+    return client
+
+
+class FakePlaylists:
+    """playlists().list(id=...) answering with the playlist's current state, or 304 for a matching etag."""
+
+    def __init__(self, item_count, etag):
+        self.item_count = item_count
+        self.etag = etag
+        self.calls = 0
+
+    def list(self, part, id=None, **kwargs):
+        fake = self
+
+        class Request:
+            def __init__(self):
+                self.headers = {}
+
+            def execute(self):
+                fake.calls += 1
+                if self.headers.get('If-None-Match') == fake.etag:
+                    raise HttpError(httplib2.Response({'status': 304}), b'')
+                item = {'id': id, 'etag': f'item-{fake.etag}', 'snippet': {'title': 'Road Trip'},
+                        'contentDetails': {'itemCount': fake.item_count}}
+                return {'etag': fake.etag, 'items': [item]}
+
+        return Request()
+
+
+@pytest.fixture
+def provider(monkeypatch, directory):
+    monkeypatch.setattr(yt_provider, 'increment_quota', lambda db, count=1: None)
+    provider = yt_provider.YoutubeProvider.__new__(yt_provider.YoutubeProvider)
+    provider.user_id = 'user'
+    provider._check_authenticated = lambda: True
+    provider.youtube = type('FakeYoutube', (), {})()
+    provider.youtube.playlists = lambda: provider.playlists
+    provider.playlists = FakePlaylists(item_count=10, etag='v1')
+    playlist_directory.cache_playlist('youtube', 'user', yt_provider._playlist_entry(
+        {'id': 'pl', 'etag': 'item-v1', 'snippet': {'title': 'Road Trip'}, 'contentDetails': {'itemCount': 10}}, 'v1'))
+    return provider
+
+
+def test_fresh_entry_is_used_for_reads(provider):
+    provider.playlists.item_count, provider.playlists.etag = 12, 'v2'
+    assert provider.get_playlist_by_name('road trip', None)['itemCount'] == 10
+    assert provider.playlists.calls == 0
+
+
+def test_fresh_entry_is_revalidated_for_writes(provider):
+    provider.playlists.item_count, provider.playlists.etag = 12, 'v2'
+    playlist = provider.get_playlist_by_name('road trip', None, revalidate=True)
+    assert (playlist['itemCount'], playlist['response_etag']) == (12, 'v2')
+    # ...and written back, so later reads see it too
+    assert provider.get_playlist_by_name('Road Trip', None)['itemCount'] == 12
+    assert provider.playlists.calls == 1
+
+
+def test_unchanged_entry_is_confirmed_with_etag(provider):
+    playlist = provider.get_playlist_by_name('road trip', None, revalidate=True)
+    assert playlist['itemCount'] == 10
+    assert provider.playlists.calls == 1
@@ -0,0 +1,97 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.functions.helpers import query_planner
+from src.functions.helpers.provider import CandidateScorer
+from src.functions.helpers.query_planner import QueryPlanner, get_planner_stats
+
+VARIANTS = [("full", "heat waves glass animals"), ("title", "heat waves"), ("clean", "heat waves")]
+
+
+@pytest.fixture(autouse=True)
+def fresh_rates(monkeypatch):
+    monkeypatch.setattr(query_planner, "_yield_rates", {})
+
+
+@pytest.fixture
+def shared_redis(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(query_planner, "get_redis", lambda: client)
+    return client
+
+
+def _search(results):
+    """fetch/add_results for the planner; results maps a query to [(id, title score, artist score), ...]."""
+    queried = []
+
+    def fetch(query):
+        queried.append(query)
+        return results.get(query)
+
+    def add_results(scorer):
+        def add(batch):
+            for candidate_id, title_score, artist_score in batch:
+                idx = scorer.add_candidate(candidate_id)
+                scorer.title_score(idx, title_score)
+                scorer.artist_score(idx, artist_score)
+        return add
+
+    return fetch, add_results, queried
+
+
+def test_duplicate_queries_are_dropped():
+    assert QueryPlanner("youtube", VARIANTS).variants == VARIANTS[:2]
+
+
+def test_stops_after_a_confident_candidate():
+    fetch, add_results, queried = _search({"heat waves glass animals": [("a", 100, 90)]})
+    scorer = CandidateScorer()
+    assert QueryPlanner("youtube", VARIANTS).run(fetch, add_results(scorer), scorer) == ("a", 100, 90)
+    assert queried == ["heat waves glass animals"]
+
+
+def test_runs_every_variant_and_returns_the_best_without_a_confident_candidate():
+    fetch, add_results, queried = _search({
+        "heat waves glass animals": [("a", 70, 50)],
+        "heat waves": [("b", 90, 60)],
+    })
+    scorer = CandidateScorer()
+    assert QueryPlanner("youtube", VARIANTS).run(fetch, add_results(scorer), scorer) == ("b", 90, 60)
+    assert queried == ["heat waves glass animals", "heat waves"]
+
+
+def test_failed_queries_are_skipped():
+    fetch, add_results, _ = _search({"heat waves": [("b", 100, 100)]})
+    scorer = CandidateScorer()
+    assert QueryPlanner("youtube", VARIANTS).run(fetch, add_results(scorer), scorer) == ("b", 100, 100)
+
+
+def test_pool_scores_batches_in_plan_order():
+    fetch, add_results, queried = _search({
+        "heat waves glass animals": [("a", 60, 60)],
+        "heat waves": [("b", 80, 80)],
+    })
+    scorer = CandidateScorer()
+    with ThreadPoolExecutor(2) as pool:
+        assert QueryPlanner("youtube", VARIANTS).run(fetch, add_results(scorer), scorer, pool=pool) == ("b", 80, 80)
+    assert scorer.candidates == ["a", "b"]
+
+
+def test_high_yield_variants_run_first(shared_redis, monkeypatch):
+    monkeypatch.setattr(query_planner, "PLANNER_MIN_SAMPLES", 1)
+    shared_redis.hset("syncer:planner:youtube", mapping={"full:runs": 10, "full:yields": 1,
+                                                         "title:runs": 10, "title:yields": 8})
+    assert [name for name, _ in QueryPlanner("youtube", VARIANTS).ordered_variants()] == ["title", "full"]
+
+
+def test_runs_are_recorded(shared_redis):
+    fetch, add_results, _ = _search({"heat waves glass animals": [("a", 100, 90)]})
+    scorer = CandidateScorer()
+    QueryPlanner("youtube", VARIANTS).run(fetch, add_results(scorer), scorer)
+    assert get_planner_stats("youtube") == {
+        "variants": {"full": {"runs": 1, "yields": 1, "wins": 1}},
+        "searches": 1,
+        "early_exits": 1,
+    }
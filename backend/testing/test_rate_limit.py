@@ -0,0 +1,82 @@
+import pytest
+
+from src.functions.helpers import rate_limit
+from src.functions.helpers.rate_limit import ProviderLimiter, parse_retry_after
+
+
+@pytest.fixture
+def shared_redis(monkeypatch):
+    """A Lua-capable fake Redis standing in for the one every process shares."""
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(rate_limit, "get_redis", lambda: client)
+    return client
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Records the limiter's sleeps instead of sleeping."""
+    recorded = []
+    monkeypatch.setattr(rate_limit.time, "sleep", recorded.append)
+    return recorded
+
+
+def test_bucket_is_shared_between_limiters(shared_redis, sleeps):
+    # Two processes' limiters for the same endpoint class draw on one bucket
+    first, second = ProviderLimiter("test", "read", rate=2), ProviderLimiter("test", "read", rate=2)
+    for limiter in (first, second):
+        limiter.acquire()
+        limiter.release()
+    assert sleeps == []
+    second.acquire()
+    second.release()
+    assert len(sleeps) == 1 and 0.3 < sleeps[0] <= 0.5
+
+
+def test_throttled_call_backs_off_and_retries(shared_redis, sleeps):
+    limiter = ProviderLimiter("test", "write", rate=100)
+    attempts = []
+
+    def fn():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("429")
+        return "ok"
+
+    assert limiter.call(fn, lambda e: 0.01) == "ok"
+    assert len(attempts) == 2 and limiter.throttled == 1
+    assert limiter.concurrency.limit < limiter.concurrency.max_limit
+
+
+def test_block_reaches_every_limiter(shared_redis):
+    first, second = ProviderLimiter("test", "write", rate=100), ProviderLimiter("test", "write", rate=100)
+    first.block(5)
+    took, wait = second._redis_wait(1)
+    assert not took and 4 < wait <= 5
+
+
+def test_non_throttling_error_is_raised_without_retry(shared_redis, sleeps):
+    limiter = ProviderLimiter("test", "search", rate=100)
+    attempts = []
+
+    def fn():
+        attempts.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        limiter.call(fn, lambda e: None)
+    assert len(attempts) == 1 and limiter.throttled == 0 and limiter.concurrency.in_flight == 0
+
+
+def test_wait_beyond_max_raises(shared_redis, sleeps, monkeypatch):
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_MAX_WAIT", 10)
+    limiter = ProviderLimiter("test", "read", rate=100)
+    limiter.block(30)
+    with pytest.raises(rate_limit.RateLimitedError):
+        limiter.acquire()
+
+
+@pytest.mark.parametrize("value, seconds", [(None, 0.0), ("3", 3.0), ("junk", 0.0), ("Wed, 21 Oct 2015 07:28:00 GMT", 0.0)])
+def test_parse_retry_after(value, seconds):
+    assert parse_retry_after(value) == seconds
@@ -0,0 +1,64 @@
+import pytest
+
+from src.functions.helpers import search_cache
+from src.functions.helpers.search_cache import cache_key, cached_search, get_search_cache_stats
+
+
+@pytest.fixture
+def shared_redis(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(search_cache, "get_redis", lambda: client)
+    return client
+
+
+class Fetch:
+    def __init__(self, result):
+        self.result = result
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.result
+
+
+def test_key_ignores_case_and_whitespace():
+    assert cache_key("youtube", "Heat  Waves glass animals", 20) == cache_key("youtube", "heat waves Glass Animals ", 20)
+    assert cache_key("youtube", "heat waves", 20) != cache_key("spotify", "heat waves", 20)
+    assert cache_key("youtube", "heat waves", 20) != cache_key("youtube", "heat waves", 10)
+
+
+def test_second_search_is_served_from_cache(shared_redis):
+    fetch = Fetch([{"id": "abc", "title": "Heat Waves"}])
+    assert cached_search("youtube", "heat waves", 20, fetch) == fetch.result
+    assert cached_search("youtube", "Heat Waves", 20, fetch) == fetch.result
+    assert fetch.calls == 1
+    assert get_search_cache_stats()["providers"]["youtube"] == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+def test_failed_search_is_not_cached(shared_redis):
+    failing = Fetch(None)
+    assert cached_search("spotify", "heat waves", 20, failing) is None
+    fetch = Fetch([{"uri": "spotify:track:1"}])
+    assert cached_search("spotify", "heat waves", 20, fetch) == fetch.result
+    assert fetch.calls == 1
+
+
+def test_least_recently_used_entries_are_evicted(shared_redis, monkeypatch):
+    monkeypatch.setattr(search_cache, "SEARCH_CACHE_MAX_ENTRIES", 2)
+    for query in ("a", "b"):
+        cached_search("youtube", query, 20, Fetch([query]))
+    cached_search("youtube", "a", 20, Fetch(None))  # "a" is now more recent than "b"
+    cached_search("youtube", "c", 20, Fetch(["c"]))
+
+    assert shared_redis.get(cache_key("youtube", "b", 20)) is None
+    assert cached_search("youtube", "a", 20, Fetch(None)) == ["a"]
+    assert get_search_cache_stats()["entries"] == 2
+
+
+def test_search_runs_uncached_without_redis():
+    fetch = Fetch(["x"])
+    assert cached_search("youtube", "heat waves", 20, fetch) == ["x"]
+    assert cached_search("youtube", "heat waves", 20, fetch) == ["x"]
+    assert fetch.calls == 2
+    assert get_search_cache_stats() == {}
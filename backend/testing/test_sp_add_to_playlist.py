@@ -0,0 +1,100 @@
+import threading
+
+import pytest
+from spotipy.exceptions import SpotifyException
+
+from src.functions.helpers import sp_provider
+
+
+class FakeSpotify:
+    """playlist_add_items on an in-memory playlist, refusing positions past its end like Spotify does."""
+
+    def __init__(self, items=(), fail=None):
+        self.items = list(items)
+        self.calls = []
+        self.fail = fail or (lambda uris, attempt: None)
+        self._lock = threading.Lock()
+
+    def playlist(self, playlist_id, fields=None):
+        return {'tracks': {'total': len(self.items)}}
+
+    def playlist_add_items(self, playlist_id, uris, position=None):
+        with self._lock:
+            self.calls.append(list(uris))
+            error = self.fail(uris, len(self.calls))
+            if error is not None:
+                raise error
+            if any(not uri or uri.startswith('bad') for uri in uris):
+                raise SpotifyException(400, -1, 'Invalid base62 id')
+            if position is not None and position > len(self.items):
+                raise SpotifyException(400, -1, 'Index out of bounds')
+            if position is None:
+                self.items.extend(uris)
+            else:
+                self.items[position:position] = uris
+            return {'snapshot_id': f'snapshot{len(self.calls)}'}
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    monkeypatch.setattr(sp_provider, 'SP_ADD_BACKOFF', 0)
+    monkeypatch.setattr(sp_provider, 'expire_playlist', lambda *args: None)
+    provider = sp_provider.SpotifyProvider.__new__(sp_provider.SpotifyProvider)
+    provider.user_id = 'user'
+    provider.ensure_client = lambda: None
+    return provider
+
+
+def test_chunks_keep_order_after_existing_tracks(provider):
+    provider.sp = FakeSpotify(['x0', 'x1'])
+    uris = [f't{i}' for i in range(450)]
+    results = provider.add_to_playlist('pl', uris)
+    assert provider.sp.items == ['x0', 'x1'] + uris
+    assert all(len(chunk) <= 100 for chunk in provider.sp.calls)
+    assert [result['position'] for result in results] == list(range(2, 452))
+    assert all(result['inserted'] and result['snapshot_id'] for result in results)
+
+
+def test_missing_ids_are_skipped(provider):
+    provider.sp = FakeSpotify()
+    uris = [f't{i}' for i in range(250)]
+    uris[120] = None
+    results = provider.add_to_playlist('pl', uris)
+    assert provider.sp.items == [uri for uri in uris if uri]
+    assert sum(result['inserted'] for result in results) == 249
+    assert results[120] == {'id': None, 'inserted': False, 'position': None, 'snapshot_id': None,
+                            'error': 'missing track id'}
+
+
+def test_invalid_track_is_isolated(provider):
+    provider.sp = FakeSpotify()
+    uris = [f't{i}' for i in range(200)]
+    uris[37] = 'bad37'
+    results = provider.add_to_playlist('pl', uris)
+    assert provider.sp.items == [uri for uri in uris if uri != 'bad37']
+    assert [result['id'] for result in results if not result['inserted']] == ['bad37']
+
+
+def test_server_errors_are_retried(provider):
+    provider.sp = FakeSpotify(fail=lambda uris, attempt: SpotifyException(503, -1, 'busy') if attempt <= 2 else None)
+    uris = [f't{i}' for i in range(150)]
+    results = provider.add_to_playlist('pl', uris)
+    assert provider.sp.items == uris
+    assert all(result['inserted'] for result in results)
+
+
+def test_errors_without_status_are_not_retried(provider):
+    # e.g. a connection reset after the request was sent: the tracks may be in already
+    provider.sp = FakeSpotify(fail=lambda uris, attempt: ConnectionError('reset') if uris[0] == 't100' else None)
+    uris = [f't{i}' for i in range(250)]
+    results = provider.add_to_playlist('pl', uris)
+    assert sum(1 for chunk in provider.sp.calls if chunk[0] == 't100') == 1
+    assert [result['inserted'] for result in results] == [True] * 100 + [False] * 100 + [True] * 50
+
+
+def test_stale_track_count_falls_back_to_appending(provider):
+    provider.sp = FakeSpotify(['x0'])
+    uris = [f't{i}' for i in range(150)]
+    results = provider.add_to_playlist('pl', uris, start_position=5)
+    assert provider.sp.items == ['x0'] + uris
+    assert all(result['inserted'] for result in results)
@@ -0,0 +1,34 @@
+import pytest
+import spotipy
+
+from src.functions.helpers import sp_provider
+
+
+@pytest.mark.parametrize("method, url, endpoint", [
+    ('GET', 'search', 'search'),
+    ('GET', 'https://api.spotify.com/v1/search?query=x&offset=10&limit=10&type=track', 'search'),
+    ('GET', 'playlists/abc/tracks', 'read'),
+    ('GET', 'https://api.spotify.com/v1/playlists/abc/tracks?offset=100', 'read'),
+    ('POST', 'playlists/abc/tracks', 'write'),
+])
+def test_api_limiter_by_endpoint(method, url, endpoint):
+    assert sp_provider._api_limiter(method, url).name == f'spotify:{endpoint}'
+
+
+def test_search_goes_through_search_limiter(monkeypatch):
+    used = []
+
+    class _Limiter:
+        def __init__(self, endpoint):
+            self.endpoint = endpoint
+
+        def call(self, fn, throttle_delay, tokens=1):
+            used.append(self.endpoint)
+            return fn()
+
+    monkeypatch.setattr(sp_provider, 'get_limiter', lambda provider, endpoint, rate: _Limiter(endpoint))
+    monkeypatch.setattr(spotipy.Spotify, '_internal_call', lambda self, method, url, payload, params: {})
+    sp = sp_provider._UserSpotify('user', auth='token')
+    sp.search(q='track:hello', type='track', limit=10)
+    sp.playlist_items('abc')
+    assert used == ['search', 'read']
@@ -0,0 +1,120 @@
+import json
+import random
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+from src.functions.helpers import yt_provider
+
+
+def _http_error(status, reason):
+    content = json.dumps({'error': {'code': status, 'message': reason, 'errors': [{'reason': reason}]}})
+    return HttpError(httplib2.Response({'status': status}), content.encode())
+
+
+class FakeYoutube:
+    """playlistItems().insert batches on an in-memory playlist, optionally run out of order like YouTube may."""
+
+    def __init__(self, items=(), fail=None, shuffle=False):
+        self.items = list(items)
+        self.shuffle = shuffle
+        self.batches = []
+        self.rejected = 0
+        self.fail = fail or (lambda video_id: None)
+
+    def playlistItems(self):
+        return self
+
+    def insert(self, part, body):
+        return body['snippet']
+
+    def new_batch_http_request(self, callback):
+        youtube = self
+
+        class Batch:
+            def __init__(self):
+                self.requests = []
+
+            def add(self, snippet, request_id):
+                self.requests.append((request_id, snippet))
+
+            def execute(self):
+                youtube.batches.append(len(self.requests))
+                requests = random.sample(self.requests, len(self.requests)) if youtube.shuffle else self.requests
+                for request_id, snippet in requests:
+                    video_id = snippet['resourceId']['videoId']
+                    position = snippet.get('position', len(youtube.items))
+                    error = youtube.fail(video_id)
+                    if error is None and position > len(youtube.items):
+                        error = _http_error(400, 'invalidPlaylistItemPosition')
+                    if error is not None:
+                        youtube.rejected += 1
+                        callback(request_id, None, error)
+                        continue
+                    youtube.items.insert(position, video_id)
+                    callback(request_id, {'id': f'item-{video_id}'}, None)
+
+        return Batch()
+
+
+class _Limiter:
+    def acquire(self, tokens=1):
+        pass
+
+    def release(self, throttled=False, retry_after=None):
+        pass
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    invalidated, quota = [], []
+    monkeypatch.setattr(yt_provider, 'api_limiter', lambda method: _Limiter())
+    monkeypatch.setattr(yt_provider, 'increment_quota', lambda db, count=1: quota.append(count))
+    monkeypatch.setattr(yt_provider, 'expire_playlist', lambda *args: None)
+    monkeypatch.setattr(yt_provider, 'invalidate_client', lambda user_id: invalidated.append(('client', user_id)))
+    monkeypatch.setattr(yt_provider, 'invalidate_auth', lambda service, user_id: invalidated.append((service, user_id)))
+    provider = yt_provider.YoutubeProvider.__new__(yt_provider.YoutubeProvider)
+    provider.user_id = 'user'
+    provider._check_authenticated = lambda: None
+    provider.invalidated = invalidated
+    provider.quota = quota
+    return provider
+
+
+def test_batches_grow_while_clean(provider, monkeypatch):
+    monkeypatch.setattr(yt_provider, 'YT_INSERT_INITIAL_BATCH_SIZE', 5)
+    monkeypatch.setattr(yt_provider, 'YT_INSERT_BATCH_SIZE', 50)
+    provider.youtube = FakeYoutube(['x0'])
+    video_ids = [f'v{i}' for i in range(120)]
+    results = provider.add_to_playlist('pl', video_ids, db=None, start_position=1)
+    assert provider.youtube.items == ['x0'] + video_ids
+    assert all(result['inserted'] and result['playlist_item_id'] == f"item-{result['id']}" for result in results)
+    assert provider.youtube.batches == [5, 10, 20, 40, 45]
+
+
+def test_out_of_order_batches_keep_order(provider):
+    random.seed(1)
+    provider.youtube = FakeYoutube(['x0'], shuffle=True)
+    video_ids = [f'v{i}' for i in range(120)]
+    results = provider.add_to_playlist('pl', video_ids, db=None, start_position=1)
+    assert provider.youtube.items == ['x0'] + video_ids
+    assert all(result['inserted'] for result in results)
+
+
+def test_failed_insert_is_retried_then_given_up(provider):
+    provider.youtube = FakeYoutube(fail=lambda video_id: _http_error(404, 'videoNotFound') if video_id == 'v3' else None)
+    video_ids = [f'v{i}' for i in range(8)]
+    results = provider.add_to_playlist('pl', video_ids, db=None, start_position=0)
+    assert provider.youtube.items == [video_id for video_id in video_ids if video_id != 'v3']
+    assert [result['id'] for result in results if not result['inserted']] == ['v3']
+    # 50 units per insert that went in, 1 per rejected one (v3, and inserts behind it refused their position)
+    assert sum(provider.quota) == 50 * 7 + provider.youtube.rejected
+
+
+def test_auth_error_drops_client_and_auth_state(provider):
+    provider.youtube = FakeYoutube(fail=lambda video_id: _http_error(401, 'authError'))
+    results = provider.add_to_playlist('pl', ['v0', 'v1'], db=None, start_position=0)
+    assert not any(result['inserted'] for result in results)
+    assert all(result['error'] for result in results)
+    assert provider.invalidated == [('client', 'user'), ('youtube', 'user')]
@@ -0,0 +1,86 @@
+import datetime
+
+import pytest
+
+from src.functions.helpers import yt_client_pool
+from src.functions.helpers.yt_client_pool import ClientPool
+
+
+class FakeCredentials:
+    def __init__(self, token):
+        self.token = token
+        self.expiry = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+
+
+@pytest.fixture(autouse=True)
+def no_build(monkeypatch):
+    monkeypatch.setattr(yt_client_pool, "build_youtube", lambda credentials, user_id=None: ("client", credentials.token))
+
+
+@pytest.fixture
+def shared_redis(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(yt_client_pool, "get_redis", lambda: client)
+    return client
+
+
+def test_entry_is_reused_until_invalidated():
+    pool = ClientPool()
+    pool.put("user", FakeCredentials("a"))
+    credentials, client = pool.get("user")
+    assert client == ("client", "a")
+    pool.invalidate("user")
+    assert pool.get("user") is None
+
+
+def test_least_recently_used_user_is_dropped():
+    pool = ClientPool(max_size=2)
+    for user in ("a", "b"):
+        pool.put(user, FakeCredentials(user))
+    pool.get("a")
+    pool.put("c", FakeCredentials("c"))
+    assert pool.get("b") is None and pool.get("a") is not None and pool.get("c") is not None
+
+
+def test_invalidation_reaches_other_processes(shared_redis):
+    # Two processes' pools (e.g. the API server and a worker) sharing Redis
+    server, worker = ClientPool(), ClientPool()
+    worker.put("user", FakeCredentials("old"), worker.version("user"))
+    worker.put("other", FakeCredentials("other"), worker.version("other"))
+    server.invalidate("user")  # e.g. the OAuth callback saved a new token
+    assert worker.get("user") is None
+    assert worker.get("other") is not None
+
+
+def test_token_saved_while_loading_is_not_pooled_as_current(shared_redis):
+    server, worker = ClientPool(), ClientPool()
+    version = worker.version("user")  # the worker misses and starts loading the stored token...
+    server.invalidate("user")  # ...while a new one is saved
+    worker.put("user", FakeCredentials("old"), version)
+    assert worker.get("user") is None
+
+
+def test_version_is_read_from_redis_once_per_interval(shared_redis, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(yt_client_pool.time, "monotonic", lambda: now[0])
+    reads = []
+    real_get = shared_redis.get
+    monkeypatch.setattr(shared_redis, "get", lambda key: reads.append(key) or real_get(key))
+
+    server, worker = ClientPool(), ClientPool(version_check_interval=5)
+    worker.put("user", FakeCredentials("old"), worker.version("user"))
+    for _ in range(10):
+        assert worker.get("user") is not None
+    assert len(reads) == 2  # version() before put, and the first get()
+
+    server.invalidate("user")
+    assert worker.get("user") is not None  # not seen until the interval is over
+    now[0] += 5
+    assert worker.get("user") is None
+
+
+def test_discovery_document_is_parsed_once_and_shared():
+    document = yt_client_pool.get_discovery_document()
+    assert isinstance(document, dict)
+    assert yt_client_pool.get_discovery_document() is document